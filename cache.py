@@ -0,0 +1,191 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from functools import lru_cache
+from types import BuiltinFunctionType, CodeType
+from typing import Optional, Tuple
+from handlers import SlotTable, parse_path, path_steps, preload_paths
+from optimizer import compile_rules
+from references import private_directory
+from registry import FUNCTIONS
+from tree import TreeNode, is_path_node
+
+__version__ = "0.1.0"
+
+# modules whose code decides what the optimized tree looks like, editing them invalidates the cache
+COMPILER_MODULES = ["handlers.py", "optimizer.py", "registry.py", "tree.py", "cache.py"]
+
+
+@lru_cache(maxsize=1)
+def compiler_fingerprint() -> str:
+    digest = hashlib.sha256(f"{__version__} {sys.version_info[:2]} {pickle.HIGHEST_PROTOCOL}".encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in COMPILER_MODULES:
+        with open(os.path.join(directory, module), "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def code_identity(code: CodeType) -> str:
+    # nested functions are constants of their parent, their repr holds an address
+    constants = [code_identity(constant) if isinstance(constant, CodeType) else repr(constant)
+                 for constant in code.co_consts]
+    return hashlib.sha256(code.co_code + repr((code.co_names, constants)).encode()).hexdigest()
+
+
+def function_identity(function) -> Optional[str]:
+    """
+        tells a registered function from any other one, None when that can't be told from its
+        name and code, like callable objects or closures over anything but plain values
+    """
+    if function is None:
+        return ""
+    name = f"{getattr(function, '__module__', None)}.{getattr(function, '__qualname__', None)}"
+    if f"{function.__module__}.py" in COMPILER_MODULES:
+        # the source of these is part of compiler_fingerprint
+        return name
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return name if isinstance(function, BuiltinFunctionType) else None
+
+    try:
+        values = [cell.cell_contents for cell in function.__closure__ or ()] + list(function.__defaults__ or ())
+    except ValueError:
+        # closure cell not assigned yet
+        return None
+    if not all(isinstance(value, PLAIN_TYPES) for value in values):
+        return None
+    # lambdas and nested functions share their qualified name with their siblings
+    return f"{name} {code_identity(code)} {values!r}"
+
+
+def registry_fingerprint() -> Optional[str]:
+    """
+        registered functions and their flags, custom functions can be folded into cached trees.
+        None when some function can't be identified, the rules aren't cached then
+    """
+    specs = []
+    for name, spec in FUNCTIONS.items():
+        function, build = function_identity(spec.function), function_identity(spec.build)
+        if function is None or build is None:
+            return None
+        specs.append((name, function, spec.arity, build, spec.pure, spec.foldable, spec.vectorizable, spec.inline))
+    return repr(sorted(specs))
+
+
+def jsonpath_expressions(tree: TreeNode) -> dict:
+    """
+        parsed jsonpath_ng expressions of the tree paths that can't be resolved step by step
+    """
+    parsed = {}
+
+    def collect(node):
+        if is_path_node(node) and path_steps(node._expression) is None and node._expression not in parsed:
+            parsed[node._expression] = parse_path(node._expression)
+        for leaf in getattr(node, '_leafs', []):
+            collect(leaf)
+
+    for rule in tree._leafs:
+        collect(rule._leafs[0])
+    return parsed
+
+
+class RuleCache:
+    """
+        optimized rule trees and their parsed jsonpath expressions kept on disk, so a process
+        compiling rules it has seen before skips parsing and optimizing them. entries are keyed by
+        the rules, the options and the compiler code, entries of older versions are never read
+        again and go away with the least recently used ones once max_bytes is exceeded.
+        entries are unpickled, the directory is only used when it belongs to this user and other
+        users can't write to it (it is created with mode 0700), rules are just compiled otherwise
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 << 20) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.private = private_directory(directory)
+
+    def key(self, rules: str, **options) -> Optional[str]:
+        registry = registry_fingerprint()
+        if registry is None:
+            return None
+        digest = hashlib.sha256(compiler_fingerprint().encode())
+        digest.update(registry.encode())
+        digest.update(repr(sorted(options.items())).encode())
+        digest.update(rules.encode())
+        return digest.hexdigest()
+
+    def compile(self, rules: str, adaptive: bool = False) -> Tuple[TreeNode, SlotTable]:
+        """
+            same as compile_rules, read from the cache when possible
+        """
+        key = self.key(rules, adaptive=adaptive)
+        if key is None or not self.private:
+            return compile_rules(rules, adaptive)
+        entry = self.load(key)
+        if entry is not None:
+            tree, slot_table, parsed = entry
+            preload_paths(parsed)
+            return tree, slot_table
+
+        tree, slot_table = compile_rules(rules, adaptive)
+        self.store(key, (tree, slot_table, jsonpath_expressions(tree)))
+        return tree, slot_table
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pickle")
+
+    def load(self, key: str) -> Optional[tuple]:
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, "rb") as entry:
+                compiled = pickle.load(entry)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # truncated or unreadable entry, compiled again and overwritten
+            self.remove(entry_path)
+            return None
+
+        # recently used entries are evicted last
+        os.utime(entry_path)
+        return compiled
+
+    def store(self, key: str, compiled: tuple) -> None:
+        # written to a temporary file first, concurrent readers never see half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as entry:
+                pickle.dump(compiled, entry, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.entry_path(key))
+        except Exception:
+            # trees too deep to pickle, a full disk... the rules are just compiled again next time
+            self.remove(temporary)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            self.remove(entry_path)
+            size -= entry_size
+
+    @staticmethod
+    def remove(entry_path: str) -> None:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
@@ -0,0 +1,320 @@
+import itertools
+import linecache
+import math
+import weakref
+from typing import Callable, List
+from handlers import _NO_MATCH, _scope, concat_value, number_value, path_steps, path_value, resolve_steps, scoped_values, split_values, string_values
+from optimizer import is_constant
+from registry import function_spec
+from tree import TreeNode, ensure_leafs, get_handler_for, is_path_node, is_relative_path_node
+
+_SLOW = object()
+_file_numbers = itertools.count()
+
+
+class CodeGenerator:
+    """
+        turns one rule tree into the source of a single python function, operators are inlined
+        and every intermediate value lives in a local variable. nodes without a template are
+        called through their usual closure
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.namespace = {
+            "_NO_MATCH": _NO_MATCH,
+            "_SLOW": _SLOW,
+            "_resolve_steps": resolve_steps,
+            "_path_value": path_value,
+            "_number_value": number_value,
+            "_string_values": string_values,
+            "_split_values": split_values,
+            "_concat_value": concat_value,
+            "_isclose": math.isclose,
+            "_ceil": math.ceil,
+            "_floor": math.floor,
+            "_scope": _scope,
+            "_scoped_values": scoped_values,
+        }
+        self._names = itertools.count()
+        # variables holding the elements of the quantifiers being generated, innermost last
+        self.elements: List[str] = []
+
+    def temp(self) -> str:
+        return f"_t{next(self._names)}"
+
+    def bind(self, value) -> str:
+        name = f"_k{next(self._names)}"
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def literal(self, value) -> str:
+        if value is None or value.__class__ in (bool, int, str) or (value.__class__ is float and math.isfinite(value)):
+            return repr(value)
+        return self.bind(value)
+
+    def expression(self, node: TreeNode, indent: int, root: bool = False) -> str:
+        """
+            emits the statements computing node and returns the name or literal holding its value
+        """
+        if is_constant(node):
+            return self.literal(node._expression)
+
+        if node._slot is not None and not root:
+            # shared with other rules, goes through the memoized handler of its slot
+            return self.call(generate_handler(node), indent)
+
+        if is_path_node(node):
+            return self.path(node._expression, indent)
+
+        if is_relative_path_node(node) and self.elements:
+            return self.path("$" + node._expression[1:], indent, self.elements[-1])
+
+        spec = function_spec(node._expression) if hasattr(node, '_leafs') and not node._adaptive else None
+        template = TEMPLATES.get(node._expression) if spec is not None and spec.inline else None
+        if template is None:
+            return self.fallback(node, indent)
+
+        arity, generate = template
+        if arity is not None:
+            ensure_leafs(node, arity)
+        return generate(self, node, indent)
+
+    def fallback(self, node: TreeNode, indent: int) -> str:
+        return self.call(get_handler_for(node)(node), indent)
+
+    def call(self, handler: Callable, indent: int) -> str:
+        result = self.temp()
+        self.emit(indent, f"{result} = {self.bind(handler)}(data)")
+        return result
+
+    def path(self, expression: str, indent: int, source: str = "data") -> str:
+        """
+            inlined resolve_steps for dicts and lists, anything else goes through resolve_steps itself
+        """
+        result = self.temp()
+        steps = path_steps(expression)
+        if steps is None:
+            self.emit(indent, f"{result} = _path_value({source}, {expression!r})")
+            return result
+
+        self.emit(indent, f"{result} = {source}")
+        for step in steps:
+            if step.__class__ is str:
+                self.emit(indent, f"if {result}.__class__ is dict:")
+                self.emit(indent + 1, f"{result} = {result}.get({step!r}, _NO_MATCH)")
+            else:
+                self.emit(indent, f"if {result}.__class__ is list:")
+                self.emit(indent + 1, f"{result} = {result}[{step}] if len({result}) > {step} else _NO_MATCH")
+            self.emit(indent, f"elif {result} is not _NO_MATCH:")
+            self.emit(indent + 1, f"{result} = _SLOW")
+        self.emit(indent, f"if {result} is _NO_MATCH:")
+        self.emit(indent + 1, f"{result} = []")
+        self.emit(indent, f"elif {result} is _SLOW:")
+        self.emit(indent + 1, f"{result} = _resolve_steps({source}, {steps!r}, {expression!r})")
+        return result
+
+    def args(self, node: TreeNode, indent: int) -> List[str]:
+        return [self.expression(leaf, indent) for leaf in node._leafs]
+
+    def assign(self, indent: int, template: str, *args: str) -> str:
+        result = self.temp()
+        self.emit(indent, f"{result} = " + template.format(*args))
+        return result
+
+
+def operator_template(template: str, named: bool = False) -> Callable:
+    """
+        named templates subscript their operands or call their methods, literals like 1[0] or
+        5.isalnum() aren't valid there, constant operands go through a name instead
+    """
+    def generate(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+        args = [generator.bind(leaf._expression) if named and is_constant(leaf) else generator.expression(leaf, indent)
+                for leaf in node._leafs]
+        return generator.assign(indent, template, *args)
+    return generate
+
+
+def generate_in_range(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+    # same evaluation order as low(data) <= expr(data) <= high(data)
+    expr, low, high = node._leafs
+    low_value = generator.expression(low, indent)
+    value = generator.expression(expr, indent)
+    result = generator.assign(indent, "{} <= {}", low_value, value)
+    generator.emit(indent, f"if {result}:")
+    high_value = generator.expression(high, indent + 1)
+    generator.emit(indent + 1, f"{result} = {value} <= {high_value}")
+    return result
+
+
+def generate_operands(generator: CodeGenerator, node: TreeNode, indent: int, decisive: bool) -> str:
+    """
+        _all (decisive False) and some (decisive True): stops at the first decisive operand,
+        raises the first error only if none decided
+    """
+    result, error, caught = generator.temp(), generator.temp(), generator.temp()
+    generator.emit(indent, f"{result} = {not decisive}")
+    generator.emit(indent, f"{error} = None")
+    for leaf in node._leafs:
+        generator.emit(indent, f"if {'not ' if decisive else ''}{result}:")
+        generator.emit(indent + 1, "try:")
+        value = generator.expression(leaf, indent + 2)
+        generator.emit(indent + 2, f"if {'' if decisive else 'not '}{value}:")
+        generator.emit(indent + 3, f"{result} = {decisive}")
+        generator.emit(indent + 1, f"except Exception as {caught}:")
+        generator.emit(indent + 2, f"if {error} is None:")
+        generator.emit(indent + 3, f"{error} = {caught}")
+    generator.emit(indent, f"if {'not ' if decisive else ''}{result} and {error} is not None:")
+    generator.emit(indent + 1, f"raise {error}")
+    return result
+
+
+def generate_quantifier(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+    """
+        every, any and count-where as a loop, relative paths of the rule read the loop variable.
+        the element still goes to the scope for the nodes called through their closure
+    """
+    name = node._expression
+    list_node, body = node._leafs
+    values = generator.assign(indent, "_scoped_values({!r}, {})", name, generator.expression(list_node, indent))
+    result, error, caught, element, outer = (generator.temp() for _ in range(5))
+    initial = {"every": True, "any": False, "count-where": 0}[name]
+    generator.emit(indent, f"{result} = {initial}")
+    generator.emit(indent, f"{error} = None")
+    generator.emit(indent, f"{outer} = getattr(_scope, 'element', _NO_MATCH)")
+    generator.emit(indent, "try:")
+    generator.emit(indent + 1, f"for {element} in {values}:")
+    generator.emit(indent + 2, f"_scope.element = {element}")
+    generator.elements.append(element)
+    if name == "count-where":
+        value = generator.expression(body, indent + 2)
+        generator.emit(indent + 2, f"if {value}:")
+        generator.emit(indent + 3, f"{result} += 1")
+    else:
+        generator.emit(indent + 2, "try:")
+        value = generator.expression(body, indent + 3)
+        generator.emit(indent + 3, f"if {'not ' if initial else ''}{value}:")
+        generator.emit(indent + 4, f"{result} = {not initial}")
+        generator.emit(indent + 4, "break")
+        generator.emit(indent + 2, f"except Exception as {caught}:")
+        generator.emit(indent + 3, f"if {error} is None:")
+        generator.emit(indent + 4, f"{error} = {caught}")
+    generator.elements.pop()
+    generator.emit(indent, "finally:")
+    generator.emit(indent + 1, f"_scope.element = {outer}")
+    generator.emit(indent, f"if {'' if initial else 'not '}{result} and {error} is not None:")
+    generator.emit(indent + 1, f"raise {error}")
+    return result
+
+
+def generate_if(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+    if len(node._leafs) not in [2, 3]:
+        return generator.fallback(node, indent)
+
+    condition, *branches = node._leafs
+    result = generator.temp()
+    condition_value = generator.expression(condition, indent)
+    generator.emit(indent, f"if {condition_value}:")
+    generator.emit(indent + 1, f"{result} = {generator.expression(branches[0], indent + 1)}")
+    generator.emit(indent, "else:")
+    otherwise = generator.expression(branches[1], indent + 1) if len(branches) == 2 else "None"
+    generator.emit(indent + 1, f"{result} = {otherwise}")
+    return result
+
+
+def generate_concat(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+    if len(node._leafs) < 1:
+        return generator.fallback(node, indent)
+
+    result = generator.assign(indent, "''")
+    for leaf in node._leafs:
+        value = generator.expression(leaf, indent)
+        generator.emit(indent, f"{result} += _concat_value({value})")
+    return result
+
+
+def string_template(name: str, method: str) -> Callable:
+    def generate(generator: CodeGenerator, node: TreeNode, indent: int) -> str:
+        string, pattern = generator.temp(), generator.temp()
+        generator.emit(indent, f"{string}, {pattern} = _string_values({name!r}, {', '.join(generator.args(node, indent))})")
+        return generator.assign(indent, method, string, pattern)
+    return generate
+
+
+# function name -> (number of arguments or None, generator)
+TEMPLATES = {
+    "eq": (2, operator_template("{} == {}")),
+    "neq": (2, operator_template("{} != {}")),
+    "gt": (2, operator_template("{} > {}")),
+    "gte": (2, operator_template("{} >= {}")),
+    "lt": (2, operator_template("{} < {}")),
+    "lte": (2, operator_template("{} <= {}")),
+    "eq_delta": (3, operator_template("_isclose({}, {}, rel_tol={})")),
+    "in-range": (3, generate_in_range),
+    "abs": (1, operator_template("abs(_number_value({}))")),
+    "ceil": (1, operator_template("_ceil(_number_value({}))")),
+    "floor": (1, operator_template("_floor(_number_value({}))")),
+    "round": (1, operator_template("round(_number_value({}))")),
+    "not": (1, operator_template("not {}")),
+    "all": (None, lambda generator, node, indent: generate_operands(generator, node, indent, False)),
+    "and": (None, lambda generator, node, indent: generate_operands(generator, node, indent, False)),
+    "some": (None, lambda generator, node, indent: generate_operands(generator, node, indent, True)),
+    "or": (None, lambda generator, node, indent: generate_operands(generator, node, indent, True)),
+    "none": (None, lambda generator, node, indent: generator.assign(indent, "not {}", generate_operands(generator, node, indent, False))),
+    "if": (None, generate_if),
+    "every": (2, generate_quantifier),
+    "any": (2, generate_quantifier),
+    "count-where": (2, generate_quantifier),
+    "length": (1, operator_template("len({})")),
+    "first": (1, operator_template("{0}[0] if len({0}) > 0 else None", named=True)),
+    "last": (1, operator_template("{0}[-1] if len({0}) > 0 else None", named=True)),
+    "split": (2, operator_template("_split_values({}, {})")),
+    "concat": (None, generate_concat),
+    "starts-with": (2, string_template("starts-with", "{}.startswith({})")),
+    "ends-with": (2, string_template("ends-with", "{}.endswith({})")),
+    "contains": (2, string_template("contains", "{1} in {0}")),
+    "exists": (1, operator_template("not (isinstance({0}, list) and len({0}) == 0)")),
+    "is_number": (1, operator_template("isinstance({0}, int) or isinstance({0}, float)")),
+    "is_integer": (1, operator_template("isinstance({}, int)")),
+    "is_float": (1, operator_template("isinstance({}, float)")),
+    "is_string": (1, operator_template("isinstance({}, str)")),
+    "is_alphanumeric": (1, operator_template("{}.isalnum()", named=True)),
+}
+
+
+def generate_function(node: TreeNode) -> Callable:
+    """
+        compiles node into a function of data, its source is kept in the function's source attribute
+    """
+    generator = CodeGenerator()
+    result = generator.expression(node, 1, root=True)
+    generator.emit(1, f"return {result}")
+    source = "def rule(data):\n" + "\n".join(generator.lines) + "\n"
+
+    # registered in linecache so tracebacks and debuggers can show the generated lines, until the
+    # function is collected
+    filename = f"<generated rule {next(_file_numbers)}>"
+    try:
+        code = compile(source, filename, "exec")
+    except (SyntaxError, RecursionError):
+        # trees nested deeper than python's block or parser limits stay closures
+        return get_handler_for(node)(node)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    exec(code, generator.namespace)
+
+    function = generator.namespace["rule"]
+    function.source = source
+    weakref.finalize(function, linecache.cache.pop, filename, None)
+    return function
+
+
+def generate_handler(node: TreeNode) -> Callable:
+    """
+        drop-in replacement of tree.build_handler for TreeNode.as_validation_tree
+    """
+    if node._slot is None:
+        return generate_function(node)
+    return node._slots.handler(node._slot, lambda: generate_function(node))
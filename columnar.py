@@ -0,0 +1,266 @@
+import math
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+from handlers import path_steps, resolve_steps
+from optimizer import is_constant
+from registry import function_spec
+from tree import TreeNode, is_path_node
+from validator import Validator, format_error
+
+# beyond this ints don't survive the conversion to float64
+MAX_EXACT_INT = 2 ** 53
+NUMBER_TYPES = (int, float, bool)
+# markers used while a path is resolved step by step over the whole batch
+_MISSING = object()
+_SLOW = object()
+# resolve_steps raised for the record, the row goes through the rule closures
+_FAILED = object()
+
+
+def is_column_number(value) -> bool:
+    """
+        values that can go into a float64 column and compare exactly like the python value
+    """
+    if value.__class__ is bool:
+        return True
+    if value.__class__ is int:
+        return -MAX_EXACT_INT <= value <= MAX_EXACT_INT
+    if value.__class__ is float:
+        return math.isfinite(value)
+    return False
+
+
+class Batch:
+    """
+        records of one batch and the columns extracted from them, every referenced path
+        becomes a float64 array and a mask of the rows that hold a plain number
+    """
+
+    def __init__(self, records: Sequence[dict]) -> None:
+        self.records = records
+        self.size = len(records)
+        self._columns = {}
+        self._number_masks = {}
+
+    def values(self, expression: str, steps: tuple) -> list:
+        """
+            resolve_steps over every record, one step at a time so the common
+            dict and list cases stay inside list comprehensions
+        """
+        values = self.records
+        for step in steps:
+            if step.__class__ is str:
+                values = [value.get(step, _MISSING) if value.__class__ is dict
+                          else value if value is _MISSING or value is _SLOW
+                          else _SLOW for value in values]
+            else:
+                values = [(value[step] if len(value) > step else _MISSING) if value.__class__ is list
+                          else value if value is _MISSING or value is _SLOW
+                          else _SLOW for value in values]
+
+        def resolve(record):
+            try:
+                return resolve_steps(record, steps, expression)
+            except Exception:
+                return _FAILED
+
+        return [[] if value is _MISSING
+                else resolve(record) if value is _SLOW
+                else value for value, record in zip(values, self.records)]
+
+    def column(self, expression: str, steps: tuple):
+        column = self._columns.get(expression)
+        if column is None:
+            raw = self.values(expression, steps)
+            values = np.array([value if value.__class__ in NUMBER_TYPES else math.nan for value in raw],
+                              dtype=np.float64)
+            valid = np.isfinite(values)
+            for row in np.flatnonzero(np.abs(values) > MAX_EXACT_INT):
+                valid[row] = is_column_number(raw[row])
+            column = self._columns[expression] = (values, valid)
+        return column
+
+    def is_number(self, expression: str, steps: tuple):
+        """
+            (values, valid) of is_number over the path, rows whose path raised aren't valid
+        """
+        mask = self._number_masks.get(expression)
+        if mask is None:
+            values = self.values(expression, steps)
+            mask = self._number_masks[expression] = (
+                np.array([isinstance(value, (int, float)) for value in values], dtype=bool),
+                np.array([value is not _FAILED for value in values], dtype=bool))
+        return mask
+
+
+# array versions of the handlers, arguments and results are (values, valid) pairs,
+# rows that are not valid are recomputed with the rule closures
+
+def truthy(arg):
+    return arg[0] != 0
+
+
+def _eq(left, right):
+    return left[0] == right[0], np.logical_and(left[1], right[1])
+
+
+def _neq(left, right):
+    return left[0] != right[0], np.logical_and(left[1], right[1])
+
+
+def _in_range(expr, low, high):
+    return (low[0] <= expr[0]) & (expr[0] <= high[0]), expr[1] & low[1] & high[1]
+
+
+def _eq_delta(left, right, delta):
+    # math.isclose without abs_tol, a negative tolerance raises so those rows fall back
+    diff = np.abs(right[0] - left[0])
+    close = (left[0] == right[0]) | (diff <= np.abs(delta[0] * right[0])) | (diff <= np.abs(delta[0] * left[0]))
+    return close, left[1] & right[1] & delta[1] & (delta[0] >= 0)
+
+
+def unary(func: Callable):
+    return lambda arg: (func(arg[0]), arg[1])
+
+
+def _all(*args):
+    values, valid = True, True
+    for arg in args:
+        values, valid = np.logical_and(values, truthy(arg)), np.logical_and(valid, arg[1])
+    return values, valid
+
+
+def _some(*args):
+    values, valid = False, True
+    for arg in args:
+        values, valid = np.logical_or(values, truthy(arg)), np.logical_and(valid, arg[1])
+    return values, valid
+
+
+def _none(*args):
+    values, valid = _all(*args)
+    return np.logical_not(values), valid
+
+
+def _not(arg):
+    return np.logical_not(truthy(arg)), arg[1]
+
+
+VECTORIZED = {
+    "eq": _eq,
+    "neq": _neq,
+    "in-range": _in_range,
+    "eq_delta": _eq_delta,
+    "abs": unary(np.abs),
+    "ceil": unary(np.ceil),
+    "floor": unary(np.floor),
+    "round": unary(np.round),
+    "not": _not,
+    "all": _all,
+    "and": _all,
+    "some": _some,
+    "or": _some,
+    "none": _none,
+}
+
+
+def compile_node(node: TreeNode) -> Optional[Callable]:
+    """
+        turns a rule tree into a function of a Batch, None when some node can't be vectorized
+    """
+    if is_constant(node):
+        value = node._expression
+        if not is_column_number(value):
+            return None
+        return lambda batch: (value, True)
+
+    if is_path_node(node):
+        expression = node._expression
+        steps = path_steps(expression)
+        if steps is None:
+            return None
+        return lambda batch: batch.column(expression, steps)
+
+    spec = function_spec(node._expression) if hasattr(node, '_leafs') else None
+    if spec is None or not spec.vectorizable:
+        return None
+
+    if node._expression == "is_number" and len(node._leafs) == 1:
+        leaf = node._leafs[0]
+        if is_path_node(leaf):
+            expression = leaf._expression
+            steps = path_steps(expression)
+            if steps is not None:
+                return lambda batch: batch.is_number(expression, steps)
+        arg = compile_node(leaf)
+        # every valid value of a vectorized subtree is a number
+        return None if arg is None else lambda batch: (True, arg(batch)[1])
+
+    operator = VECTORIZED.get(node._expression)
+    if operator is None:
+        return None
+    args = [compile_node(leaf) for leaf in node._leafs]
+    if None in args:
+        return None
+
+    return lambda batch: operator(*[arg(batch) for arg in args])
+
+
+class ColumnarEngine:
+    """
+        evaluates the rules of a Validator over a whole batch of records at once,
+        numeric rules run as numpy array operations, the rest through the usual closures
+    """
+
+    def __init__(self, validator: Validator) -> None:
+        self.validator = validator
+        self._rules = validator._rules
+        self._plans = [compile_node(rule['node']) for rule in validator.val_tree]
+
+    @property
+    def vectorized_rules(self) -> int:
+        return sum(plan is not None for plan in self._plans)
+
+    def mask(self, records: Sequence[dict]) -> np.ndarray:
+        """
+            records x rules matrix, True where the record passed the rule
+        """
+        return self._evaluate(records)[0]
+
+    def validate_many(self, records: Sequence[dict]) -> List[list]:
+        """
+            same result as Validator.validate_many
+        """
+        records = list(records)
+        passed, raised = self._evaluate(records)
+        errors = [[] for _ in records]
+        for row, column in zip(*np.nonzero(~passed)):
+            _, name, error_message = self._rules[column]
+            errors[row].append(format_error(name, raised.get((row, column), error_message), records[row]))
+
+        return errors
+
+    def _evaluate(self, records: Sequence[dict]):
+        # records may have changed since the last batch, don't reuse shared subexpression results
+        self.validator._slot_table.epoch += 1
+        batch = Batch(records)
+        passed = np.empty((batch.size, len(self._rules)), dtype=bool)
+        raised = {}
+
+        with np.errstate(all='ignore'):
+            for column, (plan, (validate, _, _)) in enumerate(zip(self._plans, self._rules)):
+                if plan is not None:
+                    values, valid = plan(batch)
+                    passed[:, column] = np.broadcast_to(values != 0, (batch.size,))
+                    fallback_rows = np.flatnonzero(~np.broadcast_to(valid, (batch.size,)))
+                else:
+                    fallback_rows = range(batch.size)
+
+                for row in fallback_rows:
+                    try:
+                        passed[row, column] = bool(validate(records[row]))
+                    except Exception as e:
+                        passed[row, column] = False
+                        raised[(row, column)] = e
+
+        return passed, raised
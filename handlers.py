@@ -1,8 +1,12 @@
-from ast import Raise
+import importlib
+import json
 import math
 import numbers
-from jsonpath_ng import parse
-from typing import Callable, List
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, Union
 from functools import lru_cache
 import operator
 
@@ -15,21 +19,28 @@ def dual_expr(data, left_expr, right_expr, operator=None):
     return operator(left, right) if operator is not None else (left, right)
 
 
-def unary_number_expr(data, expr, func):
-    val = expr(data)
+def number_value(val):
     if not isinstance(val, numbers.Number):
         raise Exception(f'{val} must be a number')
-    return func(val)
+    return val
+
+
+def string_values(function_name: str, string, pattern):
+    if not isinstance(string, str) or not isinstance(pattern, str):
+        raise Exception(
+            f"both arguments of {function_name} must evaluate to strings")
+    return string, pattern
+
+
+def unary_number_expr(data, expr, func):
+    return func(number_value(expr(data)))
 
 
 # arithmetical operations
 
 
 def _abs(data, expr):
-    val = expr(data)
-    if not isinstance(val, numbers.Number):
-        raise Exception(f'{val} must be a number')
-    return abs(val)
+    return abs(number_value(expr(data)))
 
 
 # comparison functions
@@ -87,33 +98,78 @@ def _round(data, expr):
 # string matching functions
 
 def starts_with(data, left_expr, right_expr) -> bool:
-    string, pattern = dual_expr(data, left_expr, right_expr)
-
-    if not isinstance(string, str) or not isinstance(pattern, str):
-        raise Exception(
-            "both arguments of starts-with must evaluate to strings")
-
+    string, pattern = string_values("starts-with", *dual_expr(data, left_expr, right_expr))
     return string.startswith(pattern)
 
 
 def ends_with(data, left_expr, right_expr) -> bool:
-    string, pattern = dual_expr(data, left_expr, right_expr)
-
-    if not isinstance(string, str) or not isinstance(pattern, str):
-        raise Exception(
-            "both arguments of ends-with must evaluate to strings")
-
+    string, pattern = string_values("ends-with", *dual_expr(data, left_expr, right_expr))
     return string.endswith(pattern)
 
 
 def contains(data, left_expr, right_expr) -> bool:
-    string, pattern = dual_expr(data, left_expr, right_expr)
+    string, pattern = string_values("contains", *dual_expr(data, left_expr, right_expr))
+    return pattern in string
+
+# regular expressions
+
+# module compiling the patterns, see use_regex_engine
+_regex_engine = re
+
+
+def use_regex_engine(name: str) -> None:
+    """
+        re by default, re2 or regex when installed. rules compiled before keep their patterns
+    """
+    global _regex_engine
+    if name not in ["re", "re2", "regex"]:
+        raise Exception(f"unknown regex engine {name}, expected re, re2 or regex")
+    try:
+        _regex_engine = importlib.import_module(name)
+    except ImportError:
+        raise Exception(f"regex engine {name} is not installed")
+    regex_pattern.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def regex_pattern(pattern: str):
+    """
+        compiled pattern, hits and misses of patterns computed at runtime are in regex_pattern.cache_info()
+    """
+    return _regex_engine.compile(pattern)
+
+
+def match_value(string: str, pattern) -> bool:
+    return pattern.fullmatch(string) is not None
+
+
+def search_value(string: str, pattern) -> bool:
+    return pattern.search(string) is not None
+
+
+def extract_value(string: str, pattern) -> Optional[str]:
+    """
+        first group of the first match, the whole match when the pattern has no group
+    """
+    match = pattern.search(string)
+    if match is None:
+        return None
+    return match.group(1) if pattern.groups else match.group(0)
+
+
+def matches(data, string_expr, pattern_expr) -> bool:
+    string, pattern = string_values("matches", *dual_expr(data, string_expr, pattern_expr))
+    return match_value(string, regex_pattern(pattern))
 
-    if not isinstance(string, str) or not isinstance(pattern, str):
-        raise Exception(
-            "both arguments of ends-with must evaluate to strings")
 
-    return string != None and pattern in string
+def regex_search(data, string_expr, pattern_expr) -> bool:
+    string, pattern = string_values("regex-search", *dual_expr(data, string_expr, pattern_expr))
+    return search_value(string, regex_pattern(pattern))
+
+
+def regex_extract(data, string_expr, pattern_expr) -> Optional[str]:
+    string, pattern = string_values("regex-extract", *dual_expr(data, string_expr, pattern_expr))
+    return extract_value(string, regex_pattern(pattern))
 
 # string manipulation functions
 
@@ -128,14 +184,17 @@ def to_lower(data, expr):
     return string_val.lower()
 
 
-def split(data, left_expr, right_expr) -> List[str]:
-    string, divider = dual_expr(data, left_expr, right_expr)
+def split_values(string, divider) -> List[str]:
     if not isinstance(string, str) or not isinstance(divider, str):
         raise Exception(
             f"split couldn't be performed on  types {type(string)} and {type(divider)}")
     return string.split(divider)
 
 
+def split(data, left_expr, right_expr) -> List[str]:
+    return split_values(*dual_expr(data, left_expr, right_expr))
+
+
 def substring(data, left_expr, from_expr, to_expr):
     string = left_expr(data)
     start_index = from_expr(data)
@@ -148,16 +207,17 @@ def index(data, left_expr, right_expr):
     return string.index(substring)
 
 
+def concat_value(value) -> str:
+    if not isinstance(value, str):
+        raise Exception(
+            f"all parts of concat function must evaluate to strings, {type(value).__name__} found")
+    return value
+
+
 def concat(data, *expr_list):
     result = ""
     for expr in expr_list:
-        value = expr(data)
-
-        if not isinstance(value, str):
-            raise Exception(
-                f"all parts of concat function must evaluate to strings, {type(value).__name__} found")
-
-        result += value
+        result += concat_value(expr(data))
 
     return result
 
@@ -169,12 +229,217 @@ def length(data, expr) -> int:
     return len(expr(data))
 
 
+# jsonpath expressions parsed in an earlier run, restored from the rules cache (see cache.py)
+_parsed_paths = {}
+
+
+def parse_path(path: str):
+    jsonpath_expression = _parsed_paths.get(path)
+    if jsonpath_expression is None:
+        # jsonpath_ng and its parser take a while to import, simple paths never need them
+        from jsonpath_ng import parse
+        jsonpath_expression = parse(path)
+    return jsonpath_expression
+
+
+def preload_paths(parsed: dict) -> None:
+    _parsed_paths.update(parsed)
+
+
 @lru_cache(maxsize=512)
 def path(path: str) -> Callable:
-    jsonpath_expression = parse(path)
+    jsonpath_expression = parse_path(path)
     return jsonpath_expression.find
 
 
+def path_value(data, expression: str):
+    values = [match.value for match in path(expression)(data)]
+    return values[0] if len(values) == 1 else values
+
+
+# same identifiers jsonpath_ng accepts for fields, minus the "@" it also allows
+_SIMPLE_PATH_STEP = re.compile(r'\.([a-zA-Z_][a-zA-Z0-9_\-]*)|\[(\d+)\]')
+_NO_MATCH = object()
+
+
+@lru_cache(maxsize=512)
+def path_steps(path: str) -> Optional[Tuple[Union[str, int], ...]]:
+    """
+        splits simple paths like $.foo.bar[0] into key/index steps,
+        returns None when the path needs the full jsonpath parser
+        (filters, slices, wildcards, recursive descent, quoted fields...)
+    """
+    if not path.startswith('$'):
+        return None
+
+    steps = []
+    position = 1
+    while position < len(path):
+        step = _SIMPLE_PATH_STEP.match(path, position)
+        if step is None:
+            return None
+        key, index = step.groups()
+        if key == 'where':
+            # reserved word in the jsonpath grammar
+            return None
+        steps.append(key if key is not None else int(index))
+        position = step.end()
+
+    return tuple(steps)
+
+
+def resolve_steps(data, steps: tuple, expression: str):
+    """
+        walks plain dicts and lists along steps, gives the same result as path_value,
+        anything else (custom mappings, indexing strings...) is left to jsonpath_ng
+    """
+    value = data
+    for step in steps:
+        if step.__class__ is str:
+            if value.__class__ is dict:
+                value = value.get(step, _NO_MATCH)
+                if value is _NO_MATCH:
+                    return []
+                continue
+            if value.__class__ in (list, str, int, float, bool, type(None)):
+                return []
+        elif value.__class__ is list:
+            if len(value) > step:
+                value = value[step]
+                continue
+            return []
+
+        return path_value(data, expression)
+
+    return value
+
+
+class PathMatch(NamedTuple):
+    """
+        match of a simple path found by lookup, has the value attribute of the jsonpath_ng matches
+    """
+    value: object
+
+
+def match_steps(data, steps: tuple, find: Callable) -> list:
+    """
+        lookup's version of resolve_steps: a list of one PathMatch, or no match at all, so an
+        empty list found at the path is still a match. find is the jsonpath_ng fallback
+    """
+    value = data
+    for step in steps:
+        if step.__class__ is str:
+            if value.__class__ is dict:
+                value = value.get(step, _NO_MATCH)
+                if value is _NO_MATCH:
+                    return []
+                continue
+            if value.__class__ in (list, str, int, float, bool, type(None)):
+                return []
+        elif value.__class__ is list:
+            if len(value) > step:
+                value = value[step]
+                continue
+            return []
+
+        return find(data)
+
+    return [PathMatch(value)]
+
+
+class PathCacheStats(NamedTuple):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class PathCache:
+    """
+        paths computed at runtime by lookup, compiled once and kept for every Validator of the
+        process. simple paths become step tuples walked like resolve_steps, the others are parsed
+        by jsonpath_ng. the least recently used paths are evicted beyond max_size
+    """
+
+    def __init__(self, max_size: int = 65536) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._finders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def finder(self, path: str) -> Callable:
+        """
+            function of data giving the matches of path
+        """
+        with self._lock:
+            find = self._finders.get(path)
+            if find is not None:
+                self.hits += 1
+                self._finders.move_to_end(path)
+                return find
+            self.misses += 1
+
+        find = self._compile(path)
+        with self._lock:
+            self._finders[path] = find
+            self._evict()
+        return find
+
+    def warm(self, paths: Iterable[str]) -> None:
+        """
+            compiles paths ahead of the first objects, without counting hits or misses
+        """
+        for path in paths:
+            find = self._compile(path)
+            with self._lock:
+                self._finders[path] = find
+                self._evict()
+
+    def resize(self, max_size: int) -> None:
+        if max_size < 1:
+            raise Exception(f"the path cache needs room for at least one path, got {max_size}")
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._finders.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> PathCacheStats:
+        return PathCacheStats(len(self._finders), self.max_size, self.hits, self.misses, self.evictions)
+
+    def __len__(self) -> int:
+        return len(self._finders)
+
+    def _evict(self) -> None:
+        while len(self._finders) > self.max_size:
+            self._finders.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _compile(expression: str) -> Callable:
+        # not through path_steps, its lru_cache would thrash the same way
+        steps = path_steps.__wrapped__(expression)
+        if steps is None:
+            return parse_path(expression).find
+        # jsonpath_ng only parses the path if a step needs it, like indexing a string
+        return lambda data: match_steps(data, steps, lambda data: path(expression)(data))
+
+
+# compiled paths of lookup, shared by every Validator
+path_cache = PathCache()
+
+
 # list functions
 
 def first(data, expr):
@@ -195,6 +460,32 @@ def in_list(data, left_expr, right_expr) -> bool:
     return needle in list
 
 
+def member(value, values: frozenset) -> bool:
+    try:
+        return value in values
+    except TypeError:
+        # lists and objects of the validated object are equal to no literal
+        return False
+
+
+def in_values(data, needle_expr, *value_exprs) -> bool:
+    """
+        whether the needle equals one of the values, errors are deferred like in some
+    """
+    needle = needle_expr(data)
+    error = None
+    for value_expr in value_exprs:
+        try:
+            if needle == value_expr(data):
+                return True
+        except Exception as e:
+            error = error or e
+
+    if error is not None:
+        raise error
+    return False
+
+
 def find(data, left_expr, right_expr):
     list, needle = dual_expr(data, left_expr, right_expr)
     return next(iter([item for item in list if item == needle]), None)
@@ -207,18 +498,479 @@ def find_all(data, left_expr, right_expr):
 
 # aggregating functions
 
+# all and some stop at the first operand that decides the result. an operand that raises
+# doesn't decide on its own, the first error is raised only when no other operand decides,
+# so the outcome doesn't depend on the operand order
+
 def _all(data, *expressions):
-    return all([expression(data) for expression in expressions])
+    error = None
+    for expression in expressions:
+        try:
+            if not expression(data):
+                return False
+        except Exception as e:
+            error = error or e
+
+    if error is not None:
+        raise error
+    return True
 
 
 def some(data, *expressions):
-    return any([expression(data) for expression in expressions])
+    error = None
+    for expression in expressions:
+        try:
+            if expression(data):
+                return True
+        except Exception as e:
+            error = error or e
+
+    if error is not None:
+        raise error
+    return False
 
 
 def none(data, *expressions):
     return not _all(data, *expressions)
 
 
+# quantifiers, the body is evaluated for every element of a list, with data still the validated
+# object. relative paths like @.price read the element from the scope of the current thread.
+# every and any stop at the first element deciding the result, errors are raised like in _all
+
+_scope = threading.local()
+
+
+def scoped_values(function_name: str, values) -> list:
+    if values.__class__ is not list:
+        raise Exception(f"{function_name} expects a list, {type(values).__name__} found")
+    return values
+
+
+def every(data, list_expr, body_expr) -> bool:
+    values = scoped_values("every", list_expr(data))
+    scope = _scope
+    outer = getattr(scope, 'element', _NO_MATCH)
+    error = None
+    try:
+        for element in values:
+            scope.element = element
+            try:
+                if not body_expr(data):
+                    return False
+            except Exception as e:
+                error = error or e
+    finally:
+        scope.element = outer
+
+    if error is not None:
+        raise error
+    return True
+
+
+def _any(data, list_expr, body_expr) -> bool:
+    values = scoped_values("any", list_expr(data))
+    scope = _scope
+    outer = getattr(scope, 'element', _NO_MATCH)
+    error = None
+    try:
+        for element in values:
+            scope.element = element
+            try:
+                if body_expr(data):
+                    return True
+            except Exception as e:
+                error = error or e
+    finally:
+        scope.element = outer
+
+    if error is not None:
+        raise error
+    return False
+
+
+def count_where(data, list_expr, body_expr) -> int:
+    values = scoped_values("count-where", list_expr(data))
+    scope = _scope
+    outer = getattr(scope, 'element', _NO_MATCH)
+    count = 0
+    try:
+        for element in values:
+            scope.element = element
+            if body_expr(data):
+                count += 1
+    finally:
+        scope.element = outer
+    return count
+
+
+def relative_value(absolute: str, steps: Optional[tuple]):
+    """
+        handler of a relative path, absolute is the path with its @ replaced by $
+    """
+    scope = _scope
+    if steps is None:
+        return lambda data: path_value(scope.element, absolute)
+    return lambda data: resolve_steps(scope.element, steps, absolute)
+
+
+class AdaptiveOperands:
+    """
+        operands of an all/some node that get reordered while validating: every sample_every-th
+        call evaluates all of them and records their cost and how often they decide the result,
+        every reorder_every samples the cheapest, most decisive operands are moved to the front
+    """
+
+    def __init__(self, expressions: list, sample_every: int = 32, reorder_every: int = 32) -> None:
+        self.expressions = list(expressions)
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self._calls = 0
+        self._samples = 0
+        # expression -> [samples, cumulated ns, times it decided the result]
+        self._stats = {expression: [0, 0, 0] for expression in self.expressions}
+
+    def all(self, data) -> bool:
+        self._calls += 1
+        if self._calls % self.sample_every:
+            return _all(data, *self.expressions)
+        return not self._sample(data, False)
+
+    def some(self, data) -> bool:
+        self._calls += 1
+        if self._calls % self.sample_every:
+            return some(data, *self.expressions)
+        return self._sample(data, True)
+
+    def _sample(self, data, decisive: bool) -> bool:
+        """
+            evaluates every operand, returns whether one of them evaluated to decisive,
+            raises like _all and some when none did and an operand raised
+        """
+        decided = False
+        error = None
+        for expression in self.expressions:
+            stats = self._stats[expression]
+            started = time.perf_counter_ns()
+            try:
+                if bool(expression(data)) == decisive:
+                    decided = True
+                    stats[2] += 1
+            except Exception as e:
+                error = error or e
+            stats[0] += 1
+            stats[1] += time.perf_counter_ns() - started
+
+        self._samples += 1
+        if self._samples % self.reorder_every == 0:
+            self.reorder()
+        if not decided and error is not None:
+            raise error
+        return decided
+
+    def reorder(self) -> None:
+        def expected_cost(expression):
+            samples, cost, decided = self._stats[expression]
+            if samples == 0:
+                return 0
+            # cost of the operand over the chance it ends the evaluation
+            return (cost / samples) / ((decided + 1) / (samples + 1))
+
+        self.expressions = sorted(self.expressions, key=expected_cost)
+
+
+class SlotTable:
+    """
+        per-object results of subexpressions shared by several rules. a slot holds the object
+        and the epoch its value was computed for, Validator starts a new epoch for every object
+        so a mutated object is never served stale values
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.epoch = 0
+        self._slots = [(None, -1, None)] * size
+        self._handlers = [None] * size
+
+    def handler(self, index: int, build: Callable) -> Callable:
+        """
+            memoized handler of the slot, build() is only called for the first node using it
+        """
+        if self._handlers[index] is None:
+            self._handlers[index] = self._memoize(index, build())
+        return self._handlers[index]
+
+    def _memoize(self, index: int, expression: Callable) -> Callable:
+        slots = self._slots
+
+        def memoized(data):
+            slot_data, slot_epoch, value = slots[index]
+            epoch = self.epoch
+            if slot_data is data and slot_epoch == epoch:
+                return value
+            value = expression(data)
+            slots[index] = (data, epoch, value)
+            return value
+
+        memoized.__wrapped__ = expression
+        return memoized
+
+
+# functions keeping state across the validated objects, see unique_handler
+
+def key_digest(value) -> bytes:
+    # hashlib loads openssl, only rules like unique need it
+    import hashlib
+    if value.__class__ is str:
+        encoded = b"s" + value.encode("utf-8")
+    elif value.__class__ is int:
+        # same as json.dumps, several times faster
+        encoded = b"j" + str(value).encode()
+    else:
+        # 1, 1.0 and true are different keys
+        encoded = b"j" + json.dumps(value, sort_keys=True, default=repr).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+class UniqueKeys:
+    """
+        keys seen so far, as 64 bit digests: two different keys are taken for duplicates with a
+        probability below 1e-6 up to 6 million keys
+    """
+
+    def __init__(self) -> None:
+        self._seen = set()
+        # validate_async runs validations in threads, checking and adding has to be atomic
+        self._lock = threading.Lock()
+
+    def add(self, value) -> bool:
+        """
+            False when value was already added
+        """
+        digest = int.from_bytes(key_digest(value)[:8], "little")
+        with self._lock:
+            if digest in self._seen:
+                return False
+            self._seen.add(digest)
+            return True
+
+    def reset(self) -> None:
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class BloomFilter:
+    """
+        approximate UniqueKeys using a fixed amount of memory: a key seen before is always
+        reported, a new key is wrongly reported with about false_positive_rate probability
+        as long as at most capacity keys were added
+    """
+
+    def __init__(self, false_positive_rate: float = 0.001, capacity: int = 1000000) -> None:
+        if not 0 < false_positive_rate < 1 or capacity < 1:
+            raise Exception("the false positive rate must be between 0 and 1 and the capacity positive")
+        self.bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._filter = bytearray((self.bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def positions(self, value) -> List[int]:
+        digest = key_digest(value)
+        # double hashing, the k positions are h1 + i * h2
+        bits = self.bits
+        position = int.from_bytes(digest[:8], "little") % bits
+        step = (int.from_bytes(digest[8:], "little") | 1) % bits
+        positions = [position]
+        for _ in range(self.hashes - 1):
+            position += step
+            if position >= bits:
+                position -= bits
+            positions.append(position)
+        return positions
+
+    def add(self, value) -> bool:
+        """
+            False when value was probably already added
+        """
+        bloom = self._filter
+        added = False
+        positions = self.positions(value)
+        with self._lock:
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not bloom[position >> 3] & mask:
+                    bloom[position >> 3] |= mask
+                    added = True
+            return added
+
+    def __contains__(self, value) -> bool:
+        bloom = self._filter
+        return all(bloom[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+    def reset(self) -> None:
+        self._filter = bytearray(len(self._filter))
+
+
+# aggregates of all the validated objects, see aggregate_handler. they update in constant time
+# per object, and merge with the aggregates of another validator of the same rules, like the
+# ones of the ParallelValidator workers
+
+def is_missing(value) -> bool:
+    return value is None or (value.__class__ is list and len(value) == 0)
+
+
+class Aggregate:
+    """
+        add() takes the value of one object, result(name) gives the aggregate function name evaluates to
+    """
+
+    def __init__(self) -> None:
+        # validate_async runs validations in threads
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+    def __getstate__(self) -> dict:
+        # sent back by the worker processes, locks can't be pickled
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class Presence(Aggregate):
+    """
+        count of the objects and of the ones where the value is missing or null
+    """
+
+    def reset(self) -> None:
+        self.objects = 0
+        self.missing = 0
+
+    def add(self, value) -> None:
+        with self._lock:
+            self.objects += 1
+            self.missing += is_missing(value)
+
+    def merge(self, other: 'Presence') -> None:
+        with self._lock:
+            self.objects += other.objects
+            self.missing += other.missing
+
+    def result(self, name: str):
+        if name == "count":
+            return self.objects - self.missing
+        return self.missing / self.objects if self.objects else 0.0
+
+
+class Moments(Aggregate):
+    """
+        count, sum, mean, variance (welford's algorithm), min and max of the numbers,
+        missing and null values are skipped
+    """
+
+    def reset(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        # sum of the squared differences to the mean
+        self.m2 = 0.0
+        self.low = None
+        self.high = None
+
+    def add(self, value) -> None:
+        if is_missing(value):
+            return
+        number_value(value)
+        with self._lock:
+            self.count += 1
+            self.total += value
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+            if self.low is None or value < self.low:
+                self.low = value
+            if self.high is None or value > self.high:
+                self.high = value
+
+    def merge(self, other: 'Moments') -> None:
+        if other.count == 0:
+            return
+        with self._lock:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            # chan's parallel algorithm
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.mean += delta * other.count / count
+            self.count = count
+            self.total += other.total
+            self.low = other.low if self.low is None else min(self.low, other.low)
+            self.high = other.high if self.high is None else max(self.high, other.high)
+
+    def result(self, name: str):
+        if name == "sum":
+            return self.total
+        if self.count == 0:
+            raise Exception(f"{name} of no values")
+        if name == "mean":
+            return self.mean
+        if name == "stddev":
+            return math.sqrt(self.m2 / self.count)
+        return self.low if name == "min" else self.high
+
+
+class HyperLogLog(Aggregate):
+    """
+        approximate count of the distinct values, missing and null ones excluded. 2 ** precision
+        one byte registers, the standard error is 1.04 / sqrt(2 ** precision), 0.8% by default
+    """
+
+    def __init__(self, precision: int = 14) -> None:
+        if precision.__class__ is not int or not 4 <= precision <= 18:
+            raise Exception(f"the precision of distinct must be an integer from 4 to 18, got {precision}")
+        self.precision = precision
+        super().__init__()
+
+    def reset(self) -> None:
+        self._registers = bytearray(1 << self.precision)
+
+    def add(self, value) -> None:
+        if is_missing(value):
+            return
+        hashed = int.from_bytes(key_digest(value)[:8], "little")
+        # the first bits pick the register, it keeps the longest run of leading zeros of the others
+        bits = 64 - self.precision
+        register = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        registers = self._registers
+        with self._lock:
+            if rank > registers[register]:
+                registers[register] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise Exception("distinct counts of different precisions can't be merged")
+        with self._lock:
+            self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def result(self, name: str) -> int:
+        registers = self._registers
+        size = len(registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(math.ldexp(1.0, -rank) for rank in registers)
+        empty = registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            # linear counting is more accurate while many registers are empty
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+
 # logic functions
 
 def _not(data, expr) -> bool:
@@ -315,4 +1067,4 @@ def lookup(data, expr):
         raise Exception(
             f"JSON path string expected {type(value).__name__} found")
 
-    return path(value)(data)
+    return path_cache.finder(value)(data)
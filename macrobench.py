@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Sequence
+from validator import Validator
+
+# seeded, two runs of the suite validate the same documents with the same rules
+SEED = 20240501
+EVENT_TYPES = ["order", "refund", "shipment", "invoice", "return"]
+CURRENCIES = ["EUR", "USD", "GBP"]
+
+
+def deep_path(depth: int) -> str:
+    return "$.nested" + ".level" * depth + ".value"
+
+
+def generate_document(rng: random.Random, size: int, depth: int = 8, index: int = 0) -> dict:
+    """
+        order-like document of about size bytes of JSON: a few scalar fields, a customer object,
+        a chain of depth nested objects and as many line items as it takes to reach size
+    """
+    nested = {"value": 1, "name": "leaf"}
+    for _ in range(depth):
+        nested = {"level": nested, "kind": "node"}
+    document = {
+        "id": f"order-{index}",
+        "type": rng.choice(EVENT_TYPES),
+        "amount": round(rng.uniform(1, 999), 2),
+        "quantity": rng.randint(1, 20),
+        "currency": rng.choice(CURRENCIES),
+        "email": f"user{index}@example.com",
+        "code": f"AB{index % 1000000:06d}",
+        "created": "2024-05-01T12:00:00Z",
+        "paid": rng.random() < 0.5,
+        "note": None,
+        "path": "$.amount",
+        "tags": ["new", "web"],
+        "customer": {
+            "id": f"customer-{rng.randint(0, 10000)}",
+            "name": "Jane Doe",
+            "address": {"city": "Paris", "zip": "75001", "country": "FR"},
+        },
+        "nested": nested,
+        "items": [],
+    }
+
+    def item(number: int) -> dict:
+        return {"sku": f"SKU-{number:06d}", "price": round(rng.uniform(1, 99), 2), "quantity": rng.randint(1, 5),
+                "tags": ["a", "b"], "description": "lorem ipsum dolor sit amet " * 2}
+
+    document["items"].append(item(0))
+    base = len(json.dumps(document))
+    item_size = len(json.dumps(document["items"][0])) + 2
+    document["items"].extend(item(number) for number in range(1, max(1, (size - base) // item_size + 1)))
+    return document
+
+
+def rule_templates(depth: int, reference_file: str) -> list:
+    """
+        (function, template) pairs covering every builtin function, a template gives the rule of
+        number i. every rule passes on generate_document documents
+    """
+    return [
+        ("neq", lambda i: ["neq", "$.quantity", -i]),
+        ("eq_delta", lambda i: ["eq_delta", "$.amount", ["abs", "$.amount"], 0.001]),
+        ("in-range", lambda i: ["in-range", "$.amount", 0, 1000 + i]),
+        ("ceil", lambda i: ["lt", ["ceil", "$.amount"], 1001 + i]),
+        ("floor", lambda i: ["lte", ["floor", "$.amount"], 1000 + i]),
+        ("round", lambda i: ["gt", ["round", "$.amount"], -1 - i]),
+        ("gte", lambda i: ["gte", "$.quantity", -i]),
+        ("not", lambda i: ["not", ["eq", "$.currency", f"X{i}"]]),
+        ("all", lambda i: ["all", ["is_number", "$.amount"], ["neq", "$.id", f"other-{i}"]]),
+        ("and", lambda i: ["and", ["is_float", "$.amount"], ["is_integer", "$.quantity"], ["neq", "$.quantity", -i]]),
+        ("some", lambda i: ["some", ["eq", "$.type", "order"], ["neq", "$.type", f"type-{i}"]]),
+        ("or", lambda i: ["or", ["eq", "$.currency", "EUR"], ["eq", "$.currency", "USD"], ["eq", "$.currency", "GBP"],
+                          ["eq", "$.currency", f"C{i}"]]),
+        ("none", lambda i: ["none", ["eq", "$.type", f"type-{i}"], ["is_null", "$.amount"]]),
+        ("in", lambda i: ["in", "$.currency", "EUR", "USD", "GBP", f"C{i}"]),
+        ("not-in", lambda i: ["not-in", "$.type", f"banned-{i}", "spam"]),
+        ("unique", lambda i: ["unique", ["concat", "$.id", f"-{i}"]]),
+        ("unique-approx", lambda i: ["unique-approx", ["concat", "$.id", f"-{i}"], 0.001, 100000]),
+        ("in-reference", lambda i: ["in-reference", "$.currency", reference_file]),
+        ("if", lambda i: ["if", ["eq", "$.currency", "EUR"], ["gt", "$.amount", -i], True]),
+        ("starts-with", lambda i: ["starts-with", "$.email", "user"]),
+        ("ends-with", lambda i: ["ends-with", "$.email", "@example.com"]),
+        ("contains", lambda i: ["contains", "$.email", "@example"]),
+        ("split", lambda i: ["eq", ["length", ["split", "$.email", "@example."]], 2]),
+        ("first", lambda i: ["eq", ["first", "$.tags"], "new"]),
+        ("last", lambda i: ["neq", ["last", "$.tags"], f"tag-{i}"]),
+        ("exists", lambda i: ["exists", "$.customer.address.city"]),
+        ("is_string", lambda i: ["is_string", "$.customer.name"]),
+        ("is_alphanumeric", lambda i: ["is_alphanumeric", "$.code"]),
+        ("to-upper", lambda i: ["eq", ["to-upper", "$.currency"], "$.currency"]),
+        ("to-lower", lambda i: ["neq", ["to-lower", "$.currency"], "$.currency"]),
+        ("substring", lambda i: ["eq", ["substring", "$.code", 0, 2], "AB"]),
+        ("index", lambda i: ["gte", ["index", "$.email", "@example"], 0]),
+        ("find", lambda i: ["eq", ["find", "$.tags", "web"], "web"]),
+        ("find-all", lambda i: ["eq", ["length", ["find-all", "$.tags", "new"]], 1]),
+        ("is_boolean", lambda i: ["is_boolean", "$.paid"]),
+        ("is_object", lambda i: ["is_object", "$.customer"]),
+        ("is_list", lambda i: ["is_list", "$.items"]),
+        ("is_null", lambda i: ["is_null", "$.note"]),
+        ("is_empty", lambda i: ["not", ["is_empty", "$.tags"]]),
+        ("matches", lambda i: ["matches", "$.code", "AB[0-9]{6}"]),
+        ("regex-search", lambda i: ["regex-search", "$.email", "@example"]),
+        ("regex-extract", lambda i: ["eq", ["regex-extract", "$.email", "@(.*)"], "example.com"]),
+        ("lookup", lambda i: ["exists", ["lookup", "$.path"]]),
+        ("every", lambda i: ["every", "$.items", ["gt", "@.price", -i]]),
+        ("any", lambda i: ["any", "$.items", ["is_string", "@.sku"]]),
+        ("count-where", lambda i: ["gte", ["count-where", "$.items", ["gt", "@.quantity", 0]], 1]),
+        ("count", lambda i: ["gt", ["count", "$.id"], -i]),
+        ("null-rate", lambda i: ["lt", ["null-rate", "$.email"], 0.5]),
+        ("sum", lambda i: ["gt", ["sum", "$.amount"], -i]),
+        ("mean", lambda i: ["in-range", ["mean", "$.amount"], 0, 1000 + i]),
+        ("min", lambda i: ["gte", ["min", "$.quantity"], -i]),
+        ("max", lambda i: ["lte", ["max", "$.quantity"], 100 + i]),
+        ("stddev", lambda i: ["gte", ["stddev", "$.amount"], -i]),
+        ("distinct", lambda i: ["gte", ["distinct", "$.customer.id"], 0]),
+        ("deep path", lambda i: ["eq", deep_path(depth), 1]),
+        ("array path", lambda i: ["is_string", "$.items[0].sku"]),
+    ]
+
+
+def generate_rules(count: int, reference_file: str, depth: int = 8) -> List[dict]:
+    templates = rule_templates(depth, reference_file)
+    rules = []
+    for i in range(count):
+        function, template = templates[i % len(templates)]
+        rules.append({"name": f"{function} {i}", "error_message": f"{function} {i} failed", "rule": template(i)})
+    return rules
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def write_reference_file(directory: str) -> str:
+    """
+        the currencies in-reference rules look up, in directory
+    """
+    reference_file = os.path.join(directory, "currencies.txt")
+    with open(reference_file, "w", encoding="utf-8") as reference:
+        reference.write("\n".join(CURRENCIES) + "\n")
+    return reference_file
+
+
+def run_case(rule_count: int, document_size: int, backend: str = "closures", depth: int = 8,
+             max_records: int = 1000, max_time: float = 2.0, reference_file: Optional[str] = None) -> dict:
+    """
+        compiles rule_count rules and validates documents of document_size bytes until max_records
+        were validated or max_time elapsed. without reference_file in-reference reads a temporary one
+    """
+    if reference_file is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return run_case(rule_count, document_size, backend, depth, max_records, max_time, write_reference_file(directory))
+
+    rng = random.Random(SEED)
+    rules = json.dumps(generate_rules(rule_count, reference_file, depth))
+    # a few large documents or more small ones, about 4MB of JSON
+    documents = [generate_document(rng, document_size, depth, index) for index in range(max(1, min(20, (4 << 20) // document_size)))]
+
+    started = time.perf_counter()
+    validator = Validator(rules, backend=backend)
+    compile_seconds = time.perf_counter() - started
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_records and (time.perf_counter() - started < max_time or len(latencies) < 3):
+        # unique rules would fail on the next pass otherwise
+        validator.reset()
+        for document in documents:
+            validate_started = time.perf_counter_ns()
+            errors = validator.validate(document)
+            latencies.append((time.perf_counter_ns() - validate_started) / 1e3)
+            if errors:
+                raise Exception(f"generated rules failed on a generated document: {errors[0][:200]}")
+    validator.validate_dataset()
+
+    # compiling and validating one document under tracemalloc, it slows everything down
+    tracemalloc.start()
+    try:
+        Validator(rules, backend=backend).validate(documents[0])
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "rules": rule_count,
+        "document_bytes": sum(len(json.dumps(document)) for document in documents) // len(documents),
+        "backend": backend,
+        "records": len(latencies),
+        "compile_s": compile_seconds,
+        "records_per_s": len(latencies) / (sum(latencies) / 1e6),
+        "p50_us": percentile(latencies, 0.5),
+        "p95_us": percentile(latencies, 0.95),
+        "p99_us": percentile(latencies, 0.99),
+        "peak_bytes": peak_bytes,
+    }
+
+
+def case_name(rule_count: int, document_size: int, backend: str) -> str:
+    return f"rules={rule_count},size={document_size},backend={backend}"
+
+
+def run_suite(rule_counts: Sequence[int], sizes: Sequence[int], backend: str = "closures", depth: int = 8,
+              max_records: int = 1000, max_time: float = 2.0) -> Dict[str, dict]:
+    """
+        every rule count with every document size, the scaling curves of report()
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        reference_file = write_reference_file(directory)
+        return {case_name(rule_count, size, backend): run_case(rule_count, size, backend, depth, max_records, max_time, reference_file)
+                for rule_count in rule_counts for size in sizes}
+
+
+# metric -> whether higher is better
+METRICS = {"records_per_s": True, "p95_us": False, "compile_s": False, "peak_bytes": False}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.25) -> List[str]:
+    """
+        regressions of the results beyond threshold (0.25 is 25% worse) on the cases of both
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, reference = result[metric], expected[metric]
+            if reference <= 0:
+                continue
+            change = value / reference - 1
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f"{name} {metric}: {reference:.6g} -> {value:.6g} ({change:+.0%})")
+    return regressions
+
+
+def report(results: Dict[str, dict]) -> str:
+    """
+        records/s and p95 latency by rule count (rows) and document size (columns)
+    """
+    rule_counts = sorted({result["rules"] for result in results.values()})
+    sizes = sorted({int(name.split("size=")[1].split(",")[0]) for name in results})
+    backend = next(iter(results.values()))["backend"]
+    lines = []
+    for title, metric, format_value in [("records/s", "records_per_s", "{:.0f}"), ("p95 latency (us)", "p95_us", "{:.1f}"),
+                                        ("peak memory (KB)", "peak_bytes", "{:.0f}")]:
+        lines.append(f"{title}, {backend}")
+        lines.append(f"{'rules':>8}" + "".join(f"{size:>14}" for size in sizes))
+        for rule_count in rule_counts:
+            cells = []
+            for size in sizes:
+                result = results.get(case_name(rule_count, size, backend))
+                value = None if result is None else result[metric] / (1024 if metric == "peak_bytes" else 1)
+                cells.append(f"{format_value.format(value) if value is not None else '-':>14}")
+            lines.append(f"{rule_count:>8}" + "".join(cells))
+        lines.append("")
+    lines.append("compile time (ms): " + ", ".join(
+        f"{rule_count} rules {min(result['compile_s'] for result in results.values() if result['rules'] == rule_count) * 1e3:.1f}"
+        for rule_count in rule_counts))
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m macrobench", description="validate generated documents with generated rule sets")
+    parser.add_argument("--rules", default="10,100,1000,10000", help="comma separated rule counts")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma separated document sizes in bytes")
+    parser.add_argument("--backend", default="closures")
+    parser.add_argument("--depth", type=int, default=8, help="nesting depth of the documents")
+    parser.add_argument("--max-records", type=int, default=1000, help="documents validated per case at most")
+    parser.add_argument("--max-time", type=float, default=2.0, help="seconds spent validating per case at most")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="worst accepted change, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = run_suite([int(count) for count in args.rules.split(",")], [int(size) for size in args.sizes.split(",")],
+                        args.backend, args.depth, args.max_records, args.max_time)
+    print(report(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
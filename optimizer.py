@@ -0,0 +1,302 @@
+import json
+from collections import Counter
+from typing import Optional, Tuple
+from handlers import SlotTable, eq
+from registry import function_spec
+from tree import TreeNode, as_constant, as_tree, get_handler_for, if_handler, in_handler, is_constant_node, is_path_node, is_primitive_node, is_relative_path_node, is_scalar_literal_node
+
+
+def fold_constants(tree: TreeNode) -> TreeNode:
+    """
+        partial evaluation pass run between as_tree() and as_validation_tree():
+        collapses literal-only subtrees into constants, simplifies all/some/none/not/if
+        around constant operands and drops rules that always pass
+    """
+    rules = []
+    for rule in tree._leafs:
+        rule._leafs = [fold(leaf) for leaf in rule._leafs]
+        expression = rule._leafs[0]
+        if is_constant(expression) and expression._expression:
+            continue
+        rules.append(rule)
+
+    tree._leafs = rules
+    return tree
+
+
+def is_constant(node: TreeNode):
+    return is_constant_node(node) or (not is_path_node(node) and is_primitive_node(node))
+
+
+def fold(node: TreeNode) -> TreeNode:
+    if not hasattr(node, '_leafs'):
+        return node
+
+    node._leafs = [fold(leaf) for leaf in node._leafs]
+    expression = node._expression
+
+    if expression in ["all", "and", "none"]:
+        return fold_operands(node, True)
+    if expression in ["some", "or"]:
+        return merge_equalities(fold_operands(node, False))
+    if expression == "if":
+        return fold_if(node)
+    spec = function_spec(expression)
+    # unknown functions go to evaluate too, it raises the compile error
+    if (spec is None or spec.foldable) and all(is_constant(leaf) for leaf in node._leafs):
+        return evaluate(node)
+
+    return node
+
+
+def evaluate(node: TreeNode) -> TreeNode:
+    # building the handler keeps arity and unknown function errors at compile time
+    handler = get_handler_for(node)(node)
+    try:
+        return as_constant(handler(None))
+    except Exception:
+        # the failure has to be reported for every validated object, keep the node as it is
+        return node
+
+
+def discard(node: TreeNode):
+    # dropped subtrees must still fail compilation the way they did before folding
+    get_handler_for(node)(node)
+
+
+def fold_operands(node: TreeNode, neutral: bool) -> TreeNode:
+    """
+        drops operands that can't change the result: true ones in all/and/none, false ones in some/or.
+        an operand with the opposite constant decides the result alone, operands that raise
+        don't change that
+    """
+    operands = []
+    for leaf in node._leafs:
+        if not is_constant(leaf):
+            operands.append(leaf)
+        elif bool(leaf._expression) == neutral:
+            discard(leaf)
+        else:
+            discard(node)
+            node._leafs = [leaf]
+            return evaluate(node)
+
+    node._leafs = operands
+    if all(is_constant(leaf) for leaf in operands):
+        return evaluate(node)
+
+    return node
+
+
+# some/or operands comparing the same expression to at least that many literals are merged into one in
+MIN_MERGED_EQUALITIES = 4
+
+
+def compared_expression(node: TreeNode) -> Optional[tuple]:
+    """
+        (expression, literal) of eq nodes comparing a pure expression to a literal
+    """
+    if node._expression != "eq" or not hasattr(node, '_leafs') or len(node._leafs) != 2 \
+            or is_constant_node(node) or function_spec("eq").function is not eq:
+        return None
+    left, right = node._leafs
+    if is_constant(left) and not is_constant(right):
+        left, right = right, left
+    if is_constant(left) or not is_constant(right) or not is_pure_tree(left):
+        return None
+    return left, right
+
+
+def merge_equalities(node: TreeNode) -> TreeNode:
+    """
+        some(eq(x, 1), eq(x, 2), eq(2, x)...) becomes some(in(x, 1, 2...)), one set lookup instead
+        of an evaluation per value. x raising makes in raise, which some handles like the eq errors
+    """
+    if is_constant(node) or not hasattr(node, '_leafs') or node._expression not in ["some", "or"]:
+        return node
+
+    keys = {}
+    groups = {}
+    for leaf in node._leafs:
+        compared = compared_expression(leaf)
+        # lists and objects can't go into the set of in
+        if compared is not None and is_scalar_literal_node(compared[1]):
+            groups.setdefault(subexpression_key(compared[0], keys), []).append(compared)
+
+    merged = {key: compared for key, compared in groups.items() if len(compared) >= MIN_MERGED_EQUALITIES}
+    if not merged:
+        return node
+
+    operands = []
+    for leaf in node._leafs:
+        compared = compared_expression(leaf)
+        key = subexpression_key(compared[0], keys) if compared is not None and is_scalar_literal_node(compared[1]) else None
+        if key not in merged:
+            operands.append(leaf)
+        elif merged[key] is not None:
+            membership = TreeNode.__new__(TreeNode)
+            membership._expression = "in"
+            membership._leafs = [compared[0]] + [literal for _, literal in merged[key]]
+            operands.append(membership)
+            merged[key] = None
+
+    if len(operands) == 1:
+        return operands[0]
+    node._leafs = operands
+    return node
+
+
+def rule_guard(node: TreeNode) -> Optional[tuple]:
+    """
+        (path, values, otherwise) of rules if(eq(path, value), ...) and if(in(path, value...), ...)
+        with a literal or no else branch: on objects whose path is none of the values the rule
+        evaluates to otherwise without evaluating anything else
+    """
+    if node._expression != "if" or not hasattr(node, '_leafs') or is_constant_node(node) \
+            or len(node._leafs) not in [2, 3] or function_spec("if").build is not if_handler:
+        return None
+    condition, _, *otherwise = node._leafs
+    if otherwise and not is_constant(otherwise[0]):
+        return None
+    otherwise = otherwise[0]._expression if otherwise else None
+
+    # the values are looked up in a dict, lists and objects can't be
+    compared = compared_expression(condition)
+    if compared is not None and is_path_node(compared[0]) and is_scalar_literal_node(compared[1]):
+        return compared[0], [compared[1]._expression], otherwise
+    if condition._expression == "in" and hasattr(condition, '_leafs') and not is_constant_node(condition) \
+            and len(condition._leafs) > 1 and function_spec("in").build is in_handler and is_path_node(condition._leafs[0]) \
+            and all(is_scalar_literal_node(candidate) for candidate in condition._leafs[1:]):
+        return condition._leafs[0], [candidate._expression for candidate in condition._leafs[1:]], otherwise
+    return None
+
+
+def is_pure_tree(node: TreeNode) -> bool:
+    if not hasattr(node, '_leafs'):
+        return True
+    return is_pure(node) and all(is_pure_tree(leaf) for leaf in node._leafs)
+
+
+def fold_if(node: TreeNode) -> TreeNode:
+    condition, *branches = node._leafs
+    if not is_constant(condition) or len(branches) not in [1, 2]:
+        return node
+
+    discard(node)
+    if condition._expression:
+        return branches[0]
+    if len(branches) == 2:
+        return branches[1]
+
+    return as_constant(None)
+
+
+def mark_adaptive(tree: TreeNode) -> TreeNode:
+    """
+        lets all/some/none nodes with several operands reorder them at runtime, see AdaptiveOperands
+    """
+    def mark(node: TreeNode):
+        if not hasattr(node, '_leafs') or is_constant_node(node):
+            return
+        # sampling evaluates every operand, the ones short-circuiting would have skipped included
+        if node._expression in ["all", "and", "some", "or", "none"] and len(node._leafs) > 1 \
+                and all(is_pure_tree(leaf) for leaf in node._leafs):
+            node._adaptive = True
+        for leaf in node._leafs:
+            mark(leaf)
+
+    for rule in tree._leafs:
+        mark(rule._leafs[0])
+    return tree
+
+
+def is_pure(node: TreeNode) -> bool:
+    spec = function_spec(node._expression)
+    return spec is None or spec.pure
+
+
+def subexpression_key(node: TreeNode, keys: dict) -> tuple:
+    """
+        hashable key equal for structurally identical subtrees, keys caches it by node id
+    """
+    key = keys.get(id(node))
+    if key is None:
+        if is_constant(node):
+            # 1, 1.0 and true are equal in python but not interchangeable here
+            key = ("=", node._expression.__class__.__name__, repr(node._expression))
+        elif is_path_node(node):
+            key = ("$", node._expression)
+        elif is_relative_path_node(node):
+            # takes another value for every element within one object
+            key = ("!", id(node))
+        elif hasattr(node, '_leafs') and not is_pure(node):
+            # every evaluation counts, never shared
+            key = ("!", id(node))
+        elif hasattr(node, '_leafs'):
+            key = (node._expression,) + tuple(subexpression_key(leaf, keys) for leaf in node._leafs)
+        else:
+            key = ("?", repr(node._expression))
+        keys[id(node)] = key
+    return key
+
+
+def eliminate_common_subexpressions(tree: TreeNode) -> SlotTable:
+    """
+        finds paths and function subtrees used more than once across all rules and gives every
+        distinct one a slot, so it's evaluated once per validated object.
+        the returned table's epoch has to be bumped before validating each object
+    """
+    keys = {}
+    nodes = []
+
+    def collect(node: TreeNode):
+        if is_constant(node):
+            return
+        nodes.append(node)
+        for leaf in getattr(node, '_leafs', []):
+            collect(leaf)
+
+    for rule in tree._leafs:
+        collect(rule._leafs[0])
+
+    # the subtree of a repeated node is only evaluated under its first occurrence,
+    # count uses the way they will happen at runtime
+    counts = Counter(subexpression_key(node, keys) for node in nodes)
+    uses = Counter()
+    seen = set()
+
+    def count_uses(node: TreeNode):
+        if is_constant(node):
+            return
+        key = subexpression_key(node, keys)
+        uses[key] += 1
+        if counts[key] > 1:
+            if key in seen:
+                return
+            seen.add(key)
+        for leaf in getattr(node, '_leafs', []):
+            count_uses(leaf)
+
+    for rule in tree._leafs:
+        count_uses(rule._leafs[0])
+
+    slots = {key: index for index, key in enumerate(key for key, used in uses.items() if used > 1)}
+    table = SlotTable(len(slots))
+    for node in nodes:
+        slot = slots.get(subexpression_key(node, keys))
+        if slot is not None:
+            node._slot = slot
+            node._slots = table
+
+    return table
+
+
+def compile_rules(rules: str, adaptive: bool = False) -> Tuple[TreeNode, SlotTable]:
+    """
+        the compile steps that don't depend on the backend: parsing, constant folding,
+        adaptive marking and common subexpression elimination
+    """
+    tree = fold_constants(as_tree(json.loads(rules)))
+    if adaptive:
+        mark_adaptive(tree)
+    return tree, eliminate_common_subexpressions(tree)
@@ -0,0 +1,82 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from validator import Validator
+
+# rule closures can't be pickled, every worker compiles the rules JSON once in the pool initializer
+_worker_validator: Optional[Validator] = None
+
+
+def _init_worker(rules: str) -> None:
+    global _worker_validator
+    _worker_validator = Validator(rules)
+
+
+def _validate_chunk(records: List[dict]) -> Tuple[List[list], Optional[list]]:
+    errors = _worker_validator.validate_many(records)
+    if not _worker_validator.aggregated:
+        return errors, None
+    # the aggregates of the chunk, merged by the caller
+    states = _worker_validator.aggregate_states()
+    _worker_validator.reset()
+    return errors, states
+
+
+class ParallelValidator:
+    """
+        spreads chunks of records over a process pool, results come back in input order.
+        the aggregates of the workers are merged here, see validate_dataset
+    """
+
+    def __init__(self, rules: str, workers: Optional[int] = None, chunk_size: int = 1000,
+                 max_pending: Optional[int] = None) -> None:
+        # compiled here as well so broken rules fail in the caller, not in the workers
+        self._validator = Validator(rules)
+        if self._validator.stateful:
+            raise Exception("rules like unique depend on every record validated before, they can't be split over processes")
+        self.rules = rules
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        # chunks in flight, bounds memory when records come from a large stream
+        self.max_pending = max_pending or 2 * self.workers
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(rules,))
+
+    def validate_many(self, records: Iterable[dict]) -> List[list]:
+        return list(self.iter_validate(records))
+
+    def iter_validate(self, records: Iterable[dict]) -> Iterator[list]:
+        records = iter(records)
+        pending = deque()
+        while True:
+            while len(pending) < self.max_pending:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(self._pool.submit(_validate_chunk, chunk))
+
+            if not pending:
+                return
+            errors, states = pending.popleft().result()
+            if states is not None:
+                self._validator.merge_aggregates(states)
+            yield from errors
+
+    def validate_dataset(self) -> list:
+        """
+            same as Validator.validate_dataset, over the records of every chunk validated so far
+        """
+        return self._validator.validate_dataset()
+
+    def reset(self) -> None:
+        self._validator.reset()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    def __enter__(self) -> 'ParallelValidator':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
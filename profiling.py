@@ -0,0 +1,229 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from tree import TreeNode, is_constant_node, is_path_node, is_relative_path_node, node_hook
+
+
+def node_type(node: TreeNode) -> Optional[str]:
+    """
+        what node timings are grouped by, None for literals that aren't timed
+    """
+    if is_path_node(node):
+        return "path"
+    if is_relative_path_node(node):
+        return "relative path"
+    if hasattr(node, '_leafs') and not is_constant_node(node):
+        return node._expression
+    return None
+
+
+class RuleStats:
+    """
+        evaluations of one rule, times in ns. node types are timed without their arguments,
+        so the slowest one is where the time of the rule goes
+    """
+
+    def __init__(self, index: int, name: Optional[str] = None) -> None:
+        self.index = index
+        self.name = name
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.passed = 0
+        self.failed = 0
+        self.errors = 0
+        # node type -> [evaluations, ns]
+        self.nodes: Dict[str, List[int]] = {}
+
+    def record(self, elapsed: int, passed: Optional[bool]) -> None:
+        self.calls += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+        if passed is None:
+            self.errors += 1
+        elif passed:
+            self.passed += 1
+        else:
+            self.failed += 1
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0.0
+
+    @property
+    def slowest_node(self) -> Optional[str]:
+        if not self.nodes:
+            return None
+        return max(self.nodes, key=lambda name: self.nodes[name][1])
+
+    def as_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "name": self.name,
+            "calls": self.calls,
+            "total_ns": self.total_ns,
+            "mean_ns": self.mean_ns,
+            "max_ns": self.max_ns,
+            "passed": self.passed,
+            "failed": self.failed,
+            "errors": self.errors,
+            "slowest_node": self.slowest_node,
+            "nodes": {name: {"calls": calls, "total_ns": total} for name, (calls, total) in self.nodes.items()},
+        }
+
+
+def prometheus_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Profile:
+    """
+        statistics of the rules of a Validator created with profile=True. the rule functions and,
+        with the closures backend, every node handler are wrapped when the rules are built,
+        validators without a profile run the unwrapped functions
+    """
+
+    def __init__(self) -> None:
+        self.rules: List[RuleStats] = []
+        # ns spent in the arguments of the nodes being evaluated, one entry per open node
+        self._children = threading.local()
+
+    def build(self, backend: Callable) -> Callable:
+        """
+            backend building the rules with their nodes timed, see TreeNode.as_validation_tree
+        """
+        def build_rule(node: TreeNode) -> Callable:
+            stats = RuleStats(len(self.rules))
+            self.rules.append(stats)
+            with node_hook(lambda node, handler: self.wrap_node(stats, node, handler)):
+                return backend(node)
+        return build_rule
+
+    def wrap_rule(self, index: int, validate: Callable) -> Callable:
+        stats = self.rules[index]
+        clock = time.perf_counter_ns
+
+        def profiled(obj):
+            started = clock()
+            try:
+                result = validate(obj)
+            except Exception:
+                stats.record(clock() - started, None)
+                raise
+            stats.record(clock() - started, bool(result))
+            return result
+        return profiled
+
+    def wrap_node(self, stats: RuleStats, node: TreeNode, handler: Callable) -> Callable:
+        name = node_type(node)
+        if name is None:
+            return handler
+        timings = stats.nodes.setdefault(name, [0, 0])
+        local = self._children
+        clock = time.perf_counter_ns
+
+        def profiled(data):
+            children = getattr(local, 'stack', None)
+            if children is None:
+                children = local.stack = [0]
+            children.append(0)
+            started = clock()
+            try:
+                return handler(data)
+            finally:
+                elapsed = clock() - started
+                inner = children.pop()
+                children[-1] += elapsed
+                timings[0] += 1
+                timings[1] += elapsed - inner
+        return profiled
+
+    def top(self, count: int = 10) -> List[RuleStats]:
+        """
+            the rules that took the most time
+        """
+        return sorted(self.rules, key=lambda stats: stats.total_ns, reverse=True)[:count]
+
+    def reset(self) -> None:
+        for stats in self.rules:
+            stats.__init__(stats.index, stats.name)
+
+    def to_json(self) -> str:
+        return json.dumps([stats.as_dict() for stats in self.rules])
+
+    def to_prometheus(self, prefix: str = "json_validator") -> str:
+        """
+            prometheus text exposition format, one series per rule and per rule and node type
+        """
+        metrics = [
+            ("rule_evaluations_total", "counter", "Rule evaluations.", lambda stats: [("", stats.calls)]),
+            ("rule_seconds_total", "counter", "Time spent evaluating the rule.", lambda stats: [("", stats.total_ns / 1e9)]),
+            ("rule_max_seconds", "gauge", "Longest evaluation of the rule.", lambda stats: [("", stats.max_ns / 1e9)]),
+            ("rule_results_total", "counter", "Rule evaluations by result.",
+             lambda stats: [(",result=\"passed\"", stats.passed), (",result=\"failed\"", stats.failed),
+                            (",result=\"error\"", stats.errors)]),
+            ("node_seconds_total", "counter", "Time spent in the nodes of a type, without their arguments.",
+             lambda stats: [(f",node=\"{prometheus_label(name)}\"", total / 1e9) for name, (_, total) in stats.nodes.items()]),
+        ]
+        lines = []
+        for name, kind, description, samples in metrics:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for stats in self.rules:
+                labels = f"rule=\"{prometheus_label(stats.name)}\",index=\"{stats.index}\""
+                for extra, value in samples(stats):
+                    lines.append(f"{prefix}_{name}{{{labels}{extra}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def report(self, count: int = 10) -> str:
+        """
+            table of the count hottest rules
+        """
+        lines = [f"{'rule':<40} {'calls':>9} {'total ms':>10} {'mean us':>9} {'max us':>9} "
+                 f"{'failed':>8} {'errors':>8}  slowest node"]
+        for stats in self.top(count):
+            lines.append(f"{str(stats.name)[:40]:<40} {stats.calls:>9} {stats.total_ns / 1e6:>10.3f} "
+                         f"{stats.mean_ns / 1e3:>9.2f} {stats.max_ns / 1e3:>9.2f} {stats.failed:>8} "
+                         f"{stats.errors:>8}  {stats.slowest_node or '-'}")
+        return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m profiling", description="validate sample NDJSON records and report the hottest rules")
+    parser.add_argument("rules", help="JSON file with the validation rules")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON sample, stdin by default")
+    parser.add_argument("--top", type=int, default=10, help="number of rules reported")
+    parser.add_argument("--format", choices=["text", "json", "prometheus"], default="text")
+    parser.add_argument("--backend", default="closures", help="node types are only timed with closures")
+    args = parser.parse_args(argv)
+
+    from validator import Validator
+    with open(args.rules, encoding="utf-8") as rules_file:
+        validator = Validator(rules_file.read(), backend=args.backend, profile=True)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        for line in source:
+            if line.strip():
+                validator.validate(json.loads(line))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    profile = validator.profile
+    if args.format == "json":
+        print(json.dumps([stats.as_dict() for stats in profile.top(args.top)], indent=2))
+    elif args.format == "prometheus":
+        print(profile.to_prometheus(), end="")
+    else:
+        print(profile.report(args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
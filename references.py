@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import io
+import mmap
+import os
+import stat as stat_module
+import struct
+import tempfile
+import zlib
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+# magic, number of values, number of hash table slots, source size, source mtime in ns
+_HEADER = struct.Struct("<8sQQQq")
+_MAGIC = b"JVREF001"
+
+# where the indexes of reference files are written, shared by the processes of one user
+INDEX_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "json-validator", "references")
+
+
+def private_directory(path: str) -> bool:
+    """
+        creates the directory if needed, True when it is a real directory of this user that
+        other users can't write to, files found in any other one could have been planted there
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        stat = os.lstat(path)
+    except OSError:
+        return False
+    if not stat_module.S_ISDIR(stat.st_mode):
+        return False
+    # no owners nor permission bits to check on windows
+    return not hasattr(os, "getuid") or (stat.st_uid == os.getuid() and not stat.st_mode & 0o077)
+
+
+def value_hash(value: bytes) -> int:
+    # not cryptographic, equal hashes are confirmed by comparing the values. stable across
+    # processes unlike hash(), and several times cheaper than hashlib
+    return zlib.crc32(value) << 32 | zlib.adler32(value)
+
+
+# fibonacci hashing, crc32 and adler32 of values differing in a few characters only differ
+# in a few bits, the multiplication spreads them over the top bits the slot is taken from
+_FIBONACCI = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def read_values(source: str, column: Optional[str] = None) -> Iterator[str]:
+    """
+        values of a reference file: a column of a CSV file with a header row (the first one by
+        default), every non blank line of any other file
+    """
+    with open(source, encoding="utf-8", newline="") as lines:
+        if not source.lower().endswith(".csv"):
+            for line in lines:
+                value = line.rstrip("\r\n")
+                if value.strip():
+                    yield value
+            return
+
+        rows = csv.reader(lines)
+        header = next(rows, [])
+        if column is None:
+            position = 0
+        elif column in header:
+            position = header.index(column)
+        else:
+            raise Exception(f"column {column} not found in {source}, columns are {', '.join(header)}")
+        for row in rows:
+            if len(row) > position:
+                yield row[position]
+
+
+class ReferenceIndex:
+    """
+        set of the values of a reference file, kept in an index file that is memory mapped so every
+        process validating with it shares the same pages. the index is an open addressing hash table
+        of value numbers, then the 64 bit hashes of the values and their offsets in the utf-8
+        encoded values that follow
+    """
+
+    def __init__(self, index_path: str, data: Optional[bytes] = None) -> None:
+        # data is an index kept in memory instead of a file
+        if data is None:
+            with open(index_path, "rb") as index:
+                data = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map = data
+        magic, self.size, slots, self.source_size, self.source_mtime_ns = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise Exception(f"{index_path} is not a reference index")
+
+        view = memoryview(self._map)
+        table_end = _HEADER.size + 4 * slots
+        hashes_end = table_end + 8 * self.size
+        offsets_end = hashes_end + 8 * (self.size + 1)
+        self._shift = 65 - slots.bit_length()
+        self._mask = slots - 1
+        self._table = view[_HEADER.size:table_end].cast("I")
+        self._hashes = view[table_end:hashes_end].cast("Q")
+        self._offsets = view[hashes_end:offsets_end].cast("Q")
+        self._values = view[offsets_end:]
+
+    @staticmethod
+    def write(source: str, index, column: Optional[str] = None) -> None:
+        stat = os.stat(source)
+        values = list({value.encode("utf-8") for value in read_values(source, column)})
+        hashes = array("Q", map(value_hash, values))
+        offsets = array("Q", [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+
+        # at most half full, slots hold the value number + 1, 0 is a free slot
+        slots = 1 << max(1, (2 * len(values)).bit_length())
+        shift = 65 - slots.bit_length()
+        mask = slots - 1
+        table = array("I", bytes(4 * slots))
+        for number, hashed in enumerate(hashes):
+            slot = (hashed * _FIBONACCI & _MASK64) >> shift
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = number + 1
+
+        index.write(_HEADER.pack(_MAGIC, len(values), slots, stat.st_size, stat.st_mtime_ns))
+        index.write(table.tobytes())
+        index.write(hashes.tobytes())
+        index.write(offsets.tobytes())
+        for value in values:
+            index.write(value)
+
+    @staticmethod
+    def build(source: str, index_path: str, column: Optional[str] = None) -> None:
+        # written to a temporary file first, other processes never map half an index
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as index:
+                ReferenceIndex.write(source, index, column)
+            os.replace(temporary, index_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def __contains__(self, value) -> bool:
+        if value.__class__ is int:
+            # postal codes and the like are often numbers in the records
+            value = str(value)
+        elif value.__class__ is not str:
+            return False
+        encoded = value.encode("utf-8")
+        hashed = value_hash(encoded)
+        mask = self._mask
+        table = self._table
+        slot = (hashed * _FIBONACCI & _MASK64) >> self._shift
+        number = table[slot]
+        while number:
+            number -= 1
+            if self._hashes[number] == hashed \
+                    and self._values[self._offsets[number]:self._offsets[number + 1]] == encoded:
+                return True
+            slot = (slot + 1) & mask
+            number = table[slot]
+        return False
+
+    def __len__(self) -> int:
+        return self.size
+
+
+# (source, column) -> index, every reference file is mapped once per process
+_indexes: Dict[Tuple[str, Optional[str]], ReferenceIndex] = {}
+
+
+def reference_index(source: str, column: Optional[str] = None) -> ReferenceIndex:
+    """
+        index of a reference file, built on first use and again whenever the file changes
+    """
+    source = os.path.abspath(source)
+    try:
+        stat = os.stat(source)
+    except OSError:
+        raise Exception(f"reference file {source} not found")
+
+    index = _indexes.get((source, column))
+    if index is not None and (index.source_size, index.source_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+        return index
+
+    if not private_directory(INDEX_DIR):
+        # not shared with the other processes, but never read from a file someone else wrote
+        data = io.BytesIO()
+        ReferenceIndex.write(source, data, column)
+        index = _indexes[(source, column)] = ReferenceIndex(source, data.getvalue())
+        return index
+
+    index_path = os.path.join(INDEX_DIR, hashlib.sha256(f"{source}\0{column}".encode()).hexdigest() + ".index")
+    try:
+        index = ReferenceIndex(index_path)
+        if (index.source_size, index.source_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            index = None
+    except Exception:
+        # missing, truncated or from another version
+        index = None
+    if index is None:
+        ReferenceIndex.build(source, index_path, column)
+        index = ReferenceIndex(index_path)
+
+    _indexes[(source, column)] = index
+    return index
@@ -0,0 +1,50 @@
+from typing import Callable, Dict, NamedTuple, Optional
+
+
+class FunctionSpec(NamedTuple):
+    """
+        what the compiler knows about a rule function
+    """
+    name: str
+    # handlers.py style function(data, *argument_handlers), called with the handlers of the node arguments
+    function: Optional[Callable]
+    # number of arguments, None when any number is accepted
+    arity: Optional[int]
+    # node -> handler, used instead of calling function for nodes that need more, see tree.all_handler
+    build: Optional[Callable] = None
+    # the result only depends on the arguments and the validated object, evaluating it changes nothing
+    pure: bool = True
+    # may be evaluated at compile time when every argument is a literal, with None as the object
+    foldable: bool = False
+    # columnar.py has an array version of it
+    vectorizable: bool = False
+    # codegen.py has a template inlining it
+    inline: bool = False
+    # evaluated over all the validated objects instead of one, see Validator.validate_dataset
+    aggregate: bool = False
+
+
+# function name -> FunctionSpec, the builtin functions are registered by tree.py
+FUNCTIONS: Dict[str, FunctionSpec] = {}
+
+
+def register_function(name: str, function: Optional[Callable] = None, arity: Optional[int] = None,
+                      build: Optional[Callable] = None, pure: bool = True, foldable: bool = False,
+                      vectorizable: bool = False, inline: bool = False, aggregate: bool = False) -> FunctionSpec:
+    """
+        makes name usable in rules, replacing the function registered under that name if any.
+        functions are only folded when they declare foldable, that is they never read the object
+        but through their arguments. impure functions, aggregates included, are never folded,
+        shared between rules or evaluated speculatively
+    """
+    if function is None and build is None:
+        raise Exception(f"function {name} needs a function or a build callable")
+    pure = pure and not aggregate
+    foldable = foldable and pure
+    spec = FunctionSpec(name, function, arity, build, pure, foldable, vectorizable, inline, aggregate)
+    FUNCTIONS[name] = spec
+    return spec
+
+
+def function_spec(name) -> Optional[FunctionSpec]:
+    return FUNCTIONS.get(name) if isinstance(name, str) else None
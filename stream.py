@@ -0,0 +1,109 @@
+import argparse
+import json
+import sys
+import time
+from itertools import islice
+from typing import IO, TYPE_CHECKING, Iterable, NamedTuple, Union
+from validator import Validator
+
+if TYPE_CHECKING:
+    # process pools are only started with --workers, see main
+    from parallel import ParallelValidator
+
+
+class StreamStats(NamedTuple):
+    records: int
+    failed: int
+    seconds: float
+    # rules checking aggregates of all the records that failed
+    dataset_failed: int = 0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"validated {self.records} records in {self.seconds:.3f}s " \
+            f"({self.records_per_second:.0f} records/s), {self.failed} failed" + \
+            (f", {self.dataset_failed} dataset rules failed" if self.dataset_failed else "")
+
+
+def validate_ndjson(validator: Union[Validator, 'ParallelValidator'], source: Iterable[str], sink: IO[str], chunk_size: int = 1000) -> StreamStats:
+    """
+        validates NDJSON lines read from source chunk by chunk, so memory use doesn't depend on
+        the input size, and writes one {"line": n, "errors": [...]} line to sink per failed record.
+        blank lines are skipped, lines that aren't valid JSON are reported as failures. the
+        failures of the rules checking aggregates end the output as one {"dataset": true, "errors": [...]} line
+    """
+    started = time.perf_counter()
+    records = failed = 0
+    line_number = 0
+
+    while True:
+        lines = list(islice(source, chunk_size))
+        if not lines:
+            break
+
+        numbers, batch, output = [], [], []
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                batch.append(json.loads(line))
+                numbers.append(line_number)
+            except ValueError as e:
+                output.append((line_number, [f"invalid JSON: {e}"]))
+
+        records += len(batch) + len(output)
+        output.extend((number, errors) for number, errors in zip(numbers, validator.validate_many(batch)) if errors)
+        output.sort(key=lambda failure: failure[0])
+        failed += len(output)
+        sink.writelines(json.dumps({"line": number, "errors": errors}) + "\n" for number, errors in output)
+
+    dataset_errors = validator.validate_dataset()
+    if dataset_errors:
+        sink.write(json.dumps({"dataset": True, "errors": dataset_errors}) + "\n")
+    sink.flush()
+    return StreamStats(records, failed, time.perf_counter() - started, len(dataset_errors))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m stream", description="validate NDJSON records, failures are written as NDJSON")
+    parser.add_argument("rules", help="JSON file with the validation rules")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON file to validate, stdin by default")
+    parser.add_argument("-o", "--output", default="-", help="where failures are written, stdout by default")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records validated per batch")
+    parser.add_argument("--workers", type=int, default=1, help="validate in that many processes")
+    args = parser.parse_args(argv)
+
+    with open(args.rules, encoding="utf-8") as rules_file:
+        rules = rules_file.read()
+    chunk_size = args.chunk_size
+    if args.workers > 1:
+        from parallel import ParallelValidator
+        validator = ParallelValidator(rules, args.workers, args.chunk_size)
+        # one read chunk keeps every worker busy
+        chunk_size *= 2 * args.workers
+    else:
+        validator = Validator(rules)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", buffering=1 << 20)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", buffering=1 << 20)
+    try:
+        stats = validate_ndjson(validator, source, sink, chunk_size)
+    finally:
+        if args.workers > 1:
+            validator.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(stats, file=sys.stderr)
+    return 1 if stats.failed or stats.dataset_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
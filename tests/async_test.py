@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestAsyncValidation:
+
+    rule = '''
+            [
+                {"name": "foo in range", "rule": ["in-range", "$.foo", 0, 5]},
+                {"name": "bar prefix", "rule": ["starts-with", "$.bar", "some_"]}
+            ]
+        '''
+
+    records = [{"foo": i % 7, "bar": "some_string" if i % 3 else "x"} for i in range(1000)]
+
+    async def source(self, records, delay=0):
+        for record in records:
+            if delay:
+                await asyncio.sleep(delay)
+            yield record
+
+    def test_validate_async(self):
+        validator = Validator(self.rule, max_in_flight=2)
+
+        async def run():
+            return await asyncio.gather(*[validator.validate_async(record) for record in self.records[:50]])
+
+        assert asyncio.run(run()) == validator.validate_many(self.records[:50])
+
+    def test_several_event_loops(self):
+        validator = Validator(self.rule, max_in_flight=1)
+
+        async def run():
+            return await asyncio.gather(*[validator.validate_async(record) for record in self.records[:10]])
+
+        assert asyncio.run(run()) == asyncio.run(run()) == validator.validate_many(self.records[:10])
+
+    def test_iter_validate_async_keeps_order(self):
+        validator = Validator(self.rule, executor=ThreadPoolExecutor(4), max_in_flight=3)
+
+        async def run():
+            return [errors async for errors in validator.iter_validate_async(self.source(self.records), batch_size=7)]
+
+        assert asyncio.run(run()) == validator.validate_many(self.records)
+
+    def test_backpressure(self):
+        validator = Validator(self.rule, max_in_flight=2)
+        pulled = []
+
+        async def source():
+            for record in self.records:
+                pulled.append(record)
+                yield record
+
+        async def run():
+            results = validator.iter_validate_async(source(), batch_size=10)
+            await results.__anext__()
+            await asyncio.sleep(0.05)
+            return len(pulled)
+
+        # two batches in flight plus the one being filled
+        assert asyncio.run(run()) <= 30
+
+    def test_event_loop_stays_responsive(self):
+        rules = json.dumps([{"rule": ["eq", ["length", ["split", "$.text", "_"]], 20001]} for _ in range(300)])
+        validator = Validator(rules)
+        document = {"text": "_".join(["x"] * 20001)}
+
+        async def run():
+            delays = []
+
+            async def ticker():
+                while True:
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    delays.append(time.perf_counter() - started)
+
+            task = asyncio.create_task(ticker())
+            await asyncio.sleep(0.01)
+            started = time.perf_counter()
+            assert await validator.validate_async(document) == []
+            elapsed = time.perf_counter() - started
+            task.cancel()
+            return elapsed, sorted(delays)
+
+        elapsed, delays = asyncio.run(run())
+        p99 = delays[int(len(delays) * 0.99) - 1]
+        assert p99 < max(elapsed / 4, 0.02)
+
+    def test_iter_validate_async(self, benchmark):
+        validator = Validator(self.rule)
+
+        async def run():
+            return [errors async for errors in validator.iter_validate_async(self.source(self.records))]
+
+        benchmark(lambda: asyncio.run(run()))
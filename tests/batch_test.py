@@ -0,0 +1,55 @@
+import pytest
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestBatchValidation:
+
+    rule = '''
+            [
+                {
+                    "name": "foo is positive",
+                    "error_message": "foo must be positive",
+                    "rule": ["in-range", "$.foo", 1, 1000]
+                },
+                {
+                    "name": "bar prefix",
+                    "rule": ["starts-with", "$.bar", "some_"]
+                },
+                {
+                    "name": "baz rounds to foo",
+                    "rule": ["eq", ["round", "$.baz"], "$.foo"]
+                }
+            ]
+        '''
+
+    records = [
+        {"foo": i % 7, "bar": "some_string" if i % 50 else 1, "baz": (i % 7) + 0.25}
+        for i in range(1000)
+    ]
+
+    def test_validate_many_matches_validate(self):
+        validator = Validator(self.rule)
+        expected = [validator.validate(record) for record in self.records]
+        assert validator.validate_many(self.records) == expected
+        assert list(validator.iter_validate(iter(self.records))) == expected
+        assert any(expected) and not all(expected)
+
+    def test_iter_validate_is_lazy(self):
+        validator = Validator(self.rule)
+
+        def records():
+            yield {"foo": 1, "bar": "some_string", "baz": 1}
+            raise AssertionError("consumed too far")
+
+        assert next(validator.iter_validate(records())) == []
+
+    def test_validate_loop(self, benchmark):
+        validator = Validator(self.rule)
+        benchmark(lambda: [validator.validate(record) for record in self.records])
+
+    def test_validate_many(self, benchmark):
+        validator = Validator(self.rule)
+        benchmark(validator.validate_many, self.records)
@@ -0,0 +1,82 @@
+import json
+import os
+import pytest
+import cache
+import handlers
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+def forget_parsed_paths():
+    handlers.path.cache_clear()
+    handlers._parsed_paths.clear()
+
+
+@pytest.mark.benchmark(min_rounds=5, warmup=False)
+class TestRuleCache:
+
+    rule = json.dumps([
+        {"name": f"rule {i}", "rule": ["all",
+                                       ["in-range", f"$.a{i % 50}.b", 0, i],
+                                       ["eq", ["length", f"$.items[*].d{i % 10}"], 2],
+                                       ["eq", ["concat", "x", "y"], "xy"]]}
+        for i in range(500)])
+
+    records = [{"a1": {"b": 1}, "items": [{"d1": 1}, {"d1": 2}]}, {"a3": {"b": 9}, "items": []}, {}]
+
+    def test_warm_start_validates_the_same(self, tmp_path):
+        expected = Validator(self.rule).validate_many(self.records)
+        Validator(self.rule, cache_dir=str(tmp_path))
+        assert len(os.listdir(tmp_path)) == 1
+        forget_parsed_paths()
+        assert Validator(self.rule, cache_dir=str(tmp_path)).validate_many(self.records) == expected
+        assert Validator(self.rule, adaptive=True, backend="codegen", cache_dir=str(tmp_path)) \
+            .validate_many(self.records) == expected
+
+    def test_keys(self, tmp_path, monkeypatch):
+        rule_cache = cache.RuleCache(str(tmp_path))
+        key = rule_cache.key(self.rule, adaptive=False)
+        assert key == rule_cache.key(self.rule, adaptive=False)
+        assert key != rule_cache.key(self.rule, adaptive=True)
+        assert key != rule_cache.key(self.rule + " ", adaptive=False)
+        monkeypatch.setattr(cache, "__version__", "0.0.0")
+        cache.compiler_fingerprint.cache_clear()
+        try:
+            assert key != rule_cache.key(self.rule, adaptive=False)
+        finally:
+            monkeypatch.undo()
+            cache.compiler_fingerprint.cache_clear()
+
+    def test_broken_entry_is_recompiled(self, tmp_path):
+        Validator(self.rule, cache_dir=str(tmp_path))
+        entry, = tmp_path.iterdir()
+        entry.write_bytes(b"not a pickle")
+        assert len(Validator(self.rule, cache_dir=str(tmp_path)).validate({})) == 500
+        assert entry.stat().st_size > 100
+
+    def test_shared_directory_is_not_used(self, tmp_path):
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        shared.chmod(0o777)
+        Validator(self.rule, cache_dir=str(shared))
+        assert list(shared.iterdir()) == []
+        Validator(self.rule, cache_dir=str(tmp_path / "private"))
+        assert len(os.listdir(tmp_path / "private")) == 1 and (tmp_path / "private").stat().st_mode & 0o777 == 0o700
+
+    def test_size_is_bounded(self, tmp_path):
+        rule_cache = cache.RuleCache(str(tmp_path), max_bytes=50000)
+        for i in range(10):
+            rule_cache.compile(json.dumps([{"rule": ["eq", f"$.foo{j}", i]} for j in range(50)]))
+        sizes = [entry.stat().st_size for entry in tmp_path.iterdir()]
+        assert 1 <= len(sizes) < 10 and sum(sizes) <= 50000
+
+    def start(self, cache_dir=None):
+        Validator(self.rule, cache_dir=cache_dir).validate(self.records[0])
+
+    def test_cold_start(self, benchmark):
+        benchmark.pedantic(self.start, setup=forget_parsed_paths, rounds=5)
+
+    def test_warm_start(self, benchmark, tmp_path):
+        self.start(str(tmp_path))
+        benchmark.pedantic(self.start, args=(str(tmp_path),), setup=forget_parsed_paths, rounds=5)
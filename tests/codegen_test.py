@@ -0,0 +1,129 @@
+import gc
+import json
+import linecache
+import warnings
+import pytest
+from codegen import TEMPLATES
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestCodegen:
+
+    data = {
+        "foo": 1,
+        "bar": 1.6,
+        "baz": {"foo": [{"bar": "some_string"}], "empty": []},
+        "flag": True,
+        "text": "some_string",
+        "path": "$.foo"
+    }
+
+    rules = [
+        ["eq", "$.foo", 1],
+        ["neq", "$.foo", "$.bar"],
+        ["eq_delta", "$.bar", 1.61, 0.01],
+        ["in-range", "$.foo", ["floor", "$.bar"], ["ceil", "$.bar"]],
+        ["in-range", "$.foo", 2, ["ceil", "$.text"]],
+        ["eq", ["round", "$.bar"], ["abs", -2]],
+        ["ceil", "$.text"],
+        ["and", "$.flag", ["not", ["eq", "$.foo", 2]], ["starts-with", "$.text", "some"]],
+        ["or", ["ceil", "$.text"], "$.flag"],
+        ["or", ["ceil", "$.text"], ["eq", "$.foo", 2]],
+        ["none", ["eq", "$.foo", 2], ["ends-with", "$.text", "_string"]],
+        ["if", "$.flag", ["eq", "$.foo", 1]],
+        ["if", ["not", "$.flag"], ["eq", "$.foo", 1]],
+        ["if", ["not", "$.flag"], ["eq", "$.foo", 1], ["contains", "$.text", "e_s"]],
+        ["eq", ["first", ["split", "$.text", "_"]], "some"],
+        ["eq", ["last", ["split", "$.baz.foo[0].bar", "_"]], "string"],
+        ["eq", ["length", "$.baz.empty"], 0],
+        ["first", "$.baz.empty"],
+        ["split", "$.foo", "_"],
+        ["contains", "$.foo", "_"],
+        ["eq", ["concat", "$.text", "_", "x"], "some_string_x"],
+        ["concat", "$.text", "$.foo"],
+        ["exists", "$.missing"],
+        ["exists", ["lookup", "$.path"]],
+        ["and", ["is_number", "$.foo"], ["is_integer", "$.foo"], ["is_float", "$.bar"], ["is_string", "$.text"]],
+        ["is_alphanumeric", "$.foo"],
+        ["eq", ["length", "$.baz.foo[*].bar"], 11],
+        ["exists", "$.baz.foo.bar"],
+    ]
+
+    def validate(self, benchmark, rule, backend):
+        validator = Validator(rule, backend=backend)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_same_results_as_closures(self):
+        rules = json.dumps([{"name": f"rule {index}", "rule": rule} for index, rule in enumerate(self.rules)])
+        closures, generated = Validator(rules), Validator(rules, backend="codegen")
+        for data in [self.data, dict(self.data, flag=False, foo=2), {}, {"foo": "1", "bar": None, "text": 1}]:
+            assert generated.validate(data) == closures.validate(data)
+
+    def test_literal_operands(self):
+        # every template with literals in one position and a path in the others
+        rules = []
+        for name, (arity, _) in TEMPLATES.items():
+            for position in range(arity or 2):
+                for literal in [1, -1, 1.5, "ab", True]:
+                    arguments = ["$.foo"] * (arity or 2)
+                    arguments[position] = literal
+                    rules.append({"name": f"{name} {position} {literal}", "rule": [name] + arguments})
+        rules = json.dumps(rules)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            generated = Validator(rules, backend="codegen")
+        assert "compiled to closures" not in generated.source()
+        closures = Validator(rules)
+        for data in [self.data, {"foo": "ab1"}, {"foo": [1]}, {}]:
+            assert generated.validate(data) == closures.validate(data)
+
+    def test_linecache_entries_are_removed(self):
+        def generated():
+            gc.collect()
+            return {filename for filename in linecache.cache if filename.startswith("<generated rule")}
+
+        before = generated()
+        validator = Validator(json.dumps([{"rule": ["eq", "$.foo", i]} for i in range(50)]), backend="codegen")
+        assert len(generated() - before) >= 50
+        del validator
+        assert generated() <= before
+
+    def test_source(self):
+        validator = Validator('[{"name": "foo is one", "rule": ["eq", "$.foo", 1]}]', backend="codegen")
+        source = validator.source()
+        assert "# rule 0: foo is one" in source and "def rule(data):" in source and "== 1" in source
+
+    def test_arity_errors(self):
+        with pytest.raises(Exception, match="eq expects 2 arguments"):
+            Validator('[{"rule": ["eq", "$.foo"]}]', backend="codegen")
+        with pytest.raises(Exception, match="unknown backend"):
+            Validator('[{"rule": ["eq", "$.foo", 1]}]', backend="llvm")
+
+    def test_deep_trees_fall_back_to_closures(self):
+        rule = "$.flag"
+        for _ in range(40):
+            rule = ["and", rule, ["not", ["eq", "$.foo", 2]]]
+        rules = json.dumps([{"rule": rule}])
+        assert Validator(rules, backend="codegen").validate(self.data) == []
+
+    complex_rule = '''
+            [
+                {
+                    "rule": ["and",
+                        ["in-range", "$.foo", ["floor", "$.bar"], ["ceil", "$.bar"]],
+                        ["eq", ["first", ["split", "$.text", "_"]], "some"],
+                        ["if", "$.flag", ["eq", ["round", "$.bar"], 2], false],
+                        ["none", ["eq", "$.baz.foo[0].bar", "x"], ["eq", "$.foo", 3]]
+                    ]
+                }
+            ]
+        '''
+
+    def test_closures_0(self, benchmark):
+        self.validate(benchmark, self.complex_rule, "closures")
+
+    def test_codegen_0(self, benchmark):
+        self.validate(benchmark, self.complex_rule, "codegen")
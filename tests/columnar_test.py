@@ -0,0 +1,94 @@
+import pytest
+import numpy as np
+from columnar import ColumnarEngine
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestColumnarEngine:
+
+    rule = '''
+            [
+                {"name": "foo in range", "rule": ["in-range", "$.foo", 0, 5]},
+                {"name": "bar ceil", "rule": ["eq", ["ceil", "$.bar"], "$.foo"]},
+                {"name": "bar floor", "rule": ["neq", ["floor", "$.bar"], "$.foo"]},
+                {"name": "bar round", "rule": ["eq", ["round", "$.bar"], ["abs", "$.baz.foo"]]},
+                {"name": "close", "rule": ["eq_delta", "$.bar", "$.foo", 0.5]},
+                {"name": "is number", "rule": ["and", ["is_number", "$.foo"], ["not", ["is_number", "$.baz"]]]},
+                {"name": "some", "rule": ["some", ["eq", "$.foo", 1], ["eq", "$.foo", 2]]},
+                {"name": "not vectorized", "rule": ["starts-with", "$.name", "rec"]}
+            ]
+        '''
+
+    records = [
+        {"foo": i % 7, "bar": (i % 7) - 0.5, "baz": {"foo": -(i % 5)}, "name": f"rec_{i}"}
+        for i in range(2000)
+    ]
+
+    odd_records = [
+        {"foo": "1", "bar": 0.5, "baz": {"foo": 1}, "name": "rec"},
+        {"foo": True, "bar": float("nan"), "baz": {"foo": None}, "name": 1},
+        {"foo": 2 ** 60, "bar": 2.5, "baz": [], "name": "rec"},
+        {"bar": float("inf"), "baz": {"foo": -1.5}},
+        {"foo": [1], "bar": [0.5], "baz": {"foo": "x"}, "name": "rec"},
+        {},
+    ]
+
+    def test_same_results_as_validator(self):
+        validator = Validator(self.rule)
+        engine = ColumnarEngine(validator)
+        assert engine.vectorized_rules == 7
+        for records in [self.records[:100], self.odd_records]:
+            assert engine.validate_many(records) == validator.validate_many(records)
+
+    def test_paths_raising_for_some_records(self):
+        validator = Validator('[{"name": "r", "rule": ["eq", "$.l[1]", 1]}, {"name": "n", "rule": ["is_number", "$.l[1]"]}]')
+        engine = ColumnarEngine(validator)
+        records = [{"l": [0, 1]}, {"l": 1.5}, {"l": "ab"}, {"l": [0]}, {"l": {"1": 1}}, {}]
+        errors = engine.validate_many(records)
+        assert errors == validator.validate_many(records)
+        assert errors[0] == [] and len(errors[1]) == 2
+        assert engine.mask(records)[:, 0].tolist() == [True, False, False, False, False, False]
+
+    def test_mask(self):
+        validator = Validator(self.rule)
+        mask = ColumnarEngine(validator).mask(self.records[:14])
+        assert mask.shape == (14, 8) and mask.dtype == np.bool_
+        assert mask[:, 0].tolist() == [True] * 6 + [False] + [True] * 6 + [False]
+        expected = [[not errors for errors in [validator.validate_many([record])[0]]] for record in self.records[:14]]
+        assert mask.all(axis=1).tolist() == [row[0] for row in expected]
+
+    def test_constant_rules(self):
+        validator = Validator('[{"rule": ["eq", ["floor", 1.5], 2]}, {"rule": ["eq_delta", "$.foo", 1, -0.1]}]')
+        engine = ColumnarEngine(validator)
+        assert engine.validate_many(self.records[:3]) == validator.validate_many(self.records[:3])
+
+    numeric_rule = '''
+            [
+                {"rule": ["in-range", "$.foo", 0, 10]},
+                {"rule": ["eq", ["ceil", "$.bar"], "$.foo"]},
+                {"rule": ["eq", ["round", "$.bar"], ["abs", "$.baz.foo"]]},
+                {"rule": ["eq_delta", "$.bar", "$.foo", 0.5]},
+                {"rule": ["is_number", "$.foo"]}
+            ]
+        '''
+
+    numeric_records = [
+        {"foo": i % 7 + 1, "bar": i % 7 + 0.75, "baz": {"foo": -(i % 7) - 1}}
+        for i in range(10000)
+    ]
+
+    def test_numeric_records_pass(self):
+        validator = Validator(self.numeric_rule)
+        assert ColumnarEngine(validator).mask(self.numeric_records).all()
+        assert not any(validator.validate_many(self.numeric_records))
+
+    def test_columnar_validate_many(self, benchmark):
+        engine = ColumnarEngine(Validator(self.numeric_rule))
+        benchmark(engine.validate_many, self.numeric_records)
+
+    def test_closures_validate_many(self, benchmark):
+        validator = Validator(self.numeric_rule)
+        benchmark(validator.validate_many, self.numeric_records)
@@ -0,0 +1,73 @@
+import json
+import pytest
+import tree
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=100, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestCommonSubexpressions:
+
+    data = {
+        "customer": {"country": "DE", "name": "some_name"},
+        "foo": "some_string"
+    }
+
+    rule = '''
+            [
+                {"rule": ["eq", "$.customer.country", "DE"]},
+                {"rule": ["neq", "$.customer.country", "FR"]},
+                {"rule": ["eq", ["first", ["split", "$.foo", "_"]], "some"]},
+                {"rule": ["eq", ["last", ["split", "$.foo", "_"]], "string"]},
+                {"rule": ["starts-with", "$.customer.name", ["first", ["split", "$.foo", "_"]]]}
+            ]
+        '''
+
+    def validate(self, benchmark, rule, data=None):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=data or self.data)) == 0
+
+    def count_path_lookups(self, monkeypatch):
+        resolved = []
+        resolve_steps = tree.resolve_steps
+
+        def counting(data, steps, expression):
+            resolved.append(expression)
+            return resolve_steps(data, steps, expression)
+
+        monkeypatch.setattr(tree, "resolve_steps", counting)
+        return resolved
+
+    def test_shared_paths_resolved_once(self, monkeypatch):
+        resolved = self.count_path_lookups(monkeypatch)
+        validator = Validator(self.rule)
+        assert validator._slot_table.size == 3
+        assert validator.validate(self.data) == []
+        assert sorted(resolved) == ["$.customer.country", "$.customer.name", "$.foo"]
+
+    def test_new_object_is_evaluated_again(self):
+        validator = Validator(self.rule)
+        data = json.loads(json.dumps(self.data))
+        assert validator.validate(data) == []
+        data["customer"]["country"] = "FR"
+        data["foo"] = "other_string"
+        assert len(validator.validate(data)) == 4
+        assert [len(errors) for errors in validator.validate_many([self.data, data, self.data])] == [0, 4, 0]
+
+    def test_literals_are_not_confused(self):
+        rule = '''
+                [
+                    {"rule": ["eq", ["abs", 1], 1]},
+                    {"rule": ["eq", ["abs", "$.one"], true]},
+                    {"rule": ["neq", ["abs", "$.one"], 1.5]}
+                ]
+            '''
+        assert Validator(rule).validate({"one": -1}) == []
+
+    shared_rules = json.dumps([
+        {"rule": ["eq", ["length", ["split", "$.text", "_"]], 200]} for _ in range(20)
+    ])
+
+    def test_shared_subexpressions_0(self, benchmark):
+        self.validate(benchmark, self.shared_rules, {"text": "_".join(["x"] * 200)})
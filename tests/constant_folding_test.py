@@ -0,0 +1,99 @@
+import pytest
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestConstantFolding:
+
+    data = {
+        "foo": 1,
+        "bar": "$.foo"
+    }
+
+    def validate(self, benchmark, rule):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_constant_rules_are_dropped(self):
+        rule = '''
+                [
+                    {"rule": ["eq", 2, ["ceil", 1.1]]},
+                    {"rule": ["in-range", 1, 1, 1]},
+                    {"rule": ["and", true, ["not", false]]},
+                    {"rule": ["eq", "foo_bar", ["concat", "foo", "_", "bar"]]}
+                ]
+            '''
+        validator = Validator(rule)
+        assert validator.val_tree == []
+        assert validator.validate(self.data) == []
+
+    def test_constant_false_rule_still_fails(self):
+        rule = '''
+                [
+                    {
+                        "name": "always false",
+                        "error_message": "never equal",
+                        "rule": ["eq", 1, ["floor", 2.5]]
+                    }
+                ]
+            '''
+        validator = Validator(rule)
+        errors = validator.validate(self.data)
+        assert len(errors) == 1 and errors[0].startswith(
+            "validation failed for rule \"always false\" with message: \"never equal\"")
+
+    def test_raising_constant_is_not_folded(self):
+        rule = '''
+                [
+                    {
+                        "name": "ceil of a string",
+                        "rule": ["eq", 1, ["ceil", "foo"]]
+                    }
+                ]
+            '''
+        validator = Validator(rule)
+        errors = validator.validate(self.data)
+        assert len(errors) == 1 and "foo must be a number" in errors[0]
+
+    def test_folded_string_is_not_a_path(self):
+        rule = '''
+                [
+                    {"rule": ["eq", ["concat", "$", ".foo"], "$.bar"]}
+                ]
+            '''
+        validator = Validator(rule)
+        assert validator.validate(self.data) == []
+
+    def test_partial_evaluation(self):
+        rule = '''
+                [
+                    {"rule": ["and", true, ["eq", "$.foo", 1]]},
+                    {"rule": ["or", false, ["eq", "$.foo", 2]]},
+                    {"rule": ["if", ["eq", 1, 1], ["eq", "$.foo", 1], false]},
+                    {"rule": ["if", false, ["eq", "$.foo", 1]]}
+                ]
+            '''
+        validator = Validator(rule)
+        assert len(validator.val_tree) == 4
+        assert len(validator.validate(self.data)) == 2
+
+    def test_dropped_branch_still_checked(self):
+        rule = '''
+                [
+                    {"rule": ["if", false, ["eq", 1]]}
+                ]
+            '''
+        with pytest.raises(Exception):
+            Validator(rule)
+
+    def test_folded_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["and", ["eq", "$.foo", ["round", 1.1]], ["in-range", 1, 1, 1]]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
@@ -0,0 +1,104 @@
+import io
+import json
+import math
+import statistics
+import pytest
+from parallel import ParallelValidator
+from stream import validate_ndjson
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestDatasetRules:
+
+    rule = '''
+            [
+                {"name": "amount is a number", "rule": ["is_number", "$.amount"]},
+                {"name": "mean amount", "error_message": "mean amount out of range",
+                 "rule": ["in-range", ["mean", "$.amount"], 10, 20]},
+                {"name": "few emails missing", "rule": ["lt", ["null-rate", "$.email"], 0.01]},
+                {"name": "many customers", "rule": ["gt", ["distinct", "$.customer"], 500]},
+                {"name": "amounts", "rule": ["all", ["eq", ["count", "$.amount"], ["count", "$.customer"]],
+                                                    ["gte", ["min", "$.amount"], 0], ["lte", ["max", "$.amount"], 30],
+                                                    ["gt", ["sum", "$.amount"], 0], ["lt", ["stddev", "$.amount"], 10]]}
+            ]
+        '''
+
+    records = [{"amount": i % 31, "customer": f"customer-{i % 700}", "email": None if i % 50 == 0 else f"{i}@example.com"}
+               for i in range(2000)]
+
+    def test_aggregates(self):
+        validator = Validator(self.rule)
+        assert validator.aggregated and not validator.stateful
+        # objects only update the aggregates
+        assert validator.validate_many(self.records) == [[]] * 2000
+        amounts = [record["amount"] for record in self.records]
+        aggregates = validator.aggregates()
+        assert math.isclose(aggregates["mean($.amount)"], statistics.mean(amounts))
+        assert math.isclose(aggregates["stddev($.amount)"], statistics.pstdev(amounts))
+        assert (aggregates["sum($.amount)"], aggregates["min($.amount)"], aggregates["max($.amount)"]) == (sum(amounts), 0, 30)
+        assert aggregates["count($.customer)"] == 2000
+        assert aggregates["null-rate($.email)"] == 0.02
+        assert abs(aggregates["distinct($.customer)"] - 700) < 15
+
+        errors = validator.validate_dataset()
+        assert len(errors) == 1 and "few emails missing" in errors[0] and "null-rate($.email)" in errors[0]
+        validator.reset()
+        assert validator.validate_dataset_structured()[0].name == "mean amount"
+
+    def test_backends_agree(self):
+        expected = Validator(self.rule)
+        expected.validate_many(self.records)
+        for validator in [Validator(self.rule, backend="codegen"), Validator(self.rule, adaptive=True)]:
+            for record in self.records:
+                validator.validate(record, fail_fast=True)
+            assert validator.aggregates() == expected.aggregates()
+            assert validator.validate_dataset() == expected.validate_dataset()
+
+    def test_merge(self):
+        expected = Validator(self.rule)
+        expected.validate_many(self.records)
+        merged = Validator(self.rule)
+        for start in range(0, 2000, 300):
+            worker = Validator(self.rule)
+            worker.validate_many(self.records[start:start + 300])
+            merged.merge_aggregates(worker.aggregate_states())
+        for name, value in expected.aggregates().items():
+            assert math.isclose(merged.aggregates()[name], value), name
+
+        with ParallelValidator(self.rule, workers=2, chunk_size=300) as parallel:
+            assert parallel.validate_many(self.records) == [[]] * 2000
+            assert parallel.validate_dataset()[0].startswith('validation failed for rule "few emails missing"')
+            assert len(parallel.validate_dataset()) == 1
+
+    def test_invalid_values(self):
+        validator = Validator('[{"name": "mean", "rule": ["gt", ["mean", "$.amount"], 1]}]')
+        assert validator.validate_dataset_structured()[0].message.args[0] == "mean of no values"
+        assert validator.validate({"amount": "12"})[0].endswith("\"12 must be a number\" on object {'amount': '12'}")
+        assert validator.validate_many([{}, {"amount": None}, {"amount": 3}]) == [[], [], []]
+        assert validator.validate_dataset() == []
+
+    def test_compile_errors(self):
+        with pytest.raises(Exception, match=r"\$.limit must be inside aggregate functions"):
+            Validator('[{"rule": ["lt", ["mean", "$.amount"], "$.limit"]}]')
+        with pytest.raises(Exception, match="can't use aggregates"):
+            Validator('[{"rule": ["gt", ["max", ["mean", "$.amount"]], 1]}]')
+        with pytest.raises(Exception, match="precision of distinct"):
+            Validator('[{"rule": ["gt", ["distinct", "$.id", 30], 1]}]')
+
+    def test_stream(self):
+        source = io.StringIO("".join(json.dumps(record) + "\n" for record in self.records))
+        sink = io.StringIO()
+        stats = validate_ndjson(Validator(self.rule), source, sink, chunk_size=300)
+        assert (stats.failed, stats.dataset_failed) == (0, 1)
+        assert json.loads(sink.getvalue())["dataset"]
+
+    def test_aggregates_0(self, benchmark):
+        validator = Validator(self.rule)
+        benchmark(validator.validate_many, self.records[:100])
+
+    def test_no_aggregates_0(self, benchmark):
+        validator = Validator('[{"name": "amount is a number", "rule": ["is_number", "$.amount"]}]')
+        benchmark(validator.validate_many, self.records[:100])
@@ -0,0 +1,67 @@
+import json
+import random
+import pytest
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestFailFast:
+
+    rule = '''
+            [
+                {"name": "foo is positive", "rule": ["in-range", "$.foo", 1, 100]},
+                {"name": "bar is a string", "rule": ["is_string", "$.bar"]},
+                {"name": "bar starts with x", "rule": ["starts-with", "$.bar", "x"]},
+                {"name": "foo is a number", "rule": ["ceil", "$.foo"]}
+            ]
+        '''
+
+    records = [{"foo": random.choice([0, 1, 50, "a"]), "bar": random.choice(["x1", "y", 3])} for _ in range(500)]
+
+    def test_outcome_unchanged(self):
+        validator = Validator(self.rule)
+        for _ in range(5):
+            complete = validator.validate_many(self.records)
+            first = validator.validate_many(self.records, fail_fast=True)
+            two = validator.validate_many(self.records, max_errors=2)
+            for errors, first_errors, two_errors in zip(complete, first, two):
+                assert bool(first_errors) == bool(errors)
+                assert len(first_errors) == min(1, len(errors)) and set(first_errors) <= set(errors)
+                assert len(two_errors) == min(2, len(errors)) and set(two_errors) <= set(errors)
+                # reported in rule order
+                assert two_errors == [error for error in errors if error in two_errors]
+
+    def test_structured(self):
+        validator = Validator(self.rule)
+        failures = validator.validate_structured({"foo": 0, "bar": 3}, max_errors=3)
+        assert [failure.rule for failure in failures] == sorted(failure.rule for failure in failures)
+        assert len(failures) == 3
+
+    def test_invalid_limit(self):
+        with pytest.raises(Exception):
+            Validator(self.rule).validate({}, max_errors=0)
+
+    def test_likely_failures_go_first(self):
+        validator = Validator(self.rule)
+        validator.validate_many([{"foo": 50, "bar": "y"}] * 32 * 32, fail_fast=True)
+        assert validator._ordering.order[0] == 2
+
+    # twenty rules walking a list through jsonpath pass, the last one fails
+    slow_rules = json.dumps([{"name": f"slow {i}", "rule": ["neq", ["length", "$.items[*]"], i]} for i in range(20)]
+                            + [{"name": "kind", "rule": ["eq", "$.kind", "order"]}])
+    invalid = {"kind": "refund", "items": list(range(200))}
+
+    def test_complete_0(self, benchmark):
+        validator = Validator(self.slow_rules)
+        assert len(benchmark(validator.validate_structured, self.invalid)) == 1
+
+    def test_fail_fast_0(self, benchmark):
+        validator = Validator(self.slow_rules)
+        validator.validate_many([self.invalid] * 32 * 32, fail_fast=True)
+        assert len(benchmark(validator.validate_structured, self.invalid, fail_fast=True)) == 1
+
+    def test_fail_fast_unordered_0(self, benchmark):
+        validator = Validator(self.slow_rules, reorder_rules=False)
+        assert len(benchmark(validator.validate_structured, self.invalid, fail_fast=True)) == 1
@@ -0,0 +1,96 @@
+import json
+import pytest
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=100, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestGuardIndex:
+
+    rules = json.dumps([
+        {"name": "order amount", "rule": ["if", ["eq", "$.type", "order"], ["gt", "$.amount", 0], True]},
+        {"name": "id", "rule": ["exists", "$.id"]},
+        {"name": "refund amount", "rule": ["if", ["eq", "refund", "$.type"], ["lt", "$.amount", 0], True]},
+        {"name": "no else", "rule": ["if", ["eq", "$.type", "order"], ["exists", "$.customer"]]},
+        {"name": "false else", "rule": ["if", ["eq", "$.type", "refund"], ["exists", "$.order"], False]},
+        {"name": "shipped", "rule": ["if", ["in", "$.type", "order", "shipment"], ["is_string", "$.address"], True]},
+        {"name": "computed else", "rule": ["if", ["eq", "$.type", "shipment"], True, ["exists", "$.amount"]]},
+        {"name": "unique order id", "rule": ["if", ["eq", "$.type", "order"], ["unique", "$.id"], True]}
+    ])
+
+    records = [
+        {"type": "order", "id": 1, "amount": 5, "customer": "a", "address": "b"},
+        {"type": "order", "id": 1, "amount": -5},
+        {"type": "refund", "id": 2, "amount": -5, "order": 1},
+        {"type": "refund", "amount": 5},
+        {"type": "shipment", "id": 3, "address": 1},
+        {"type": "other", "id": 4},
+        {"id": 5, "amount": 1},
+        {"type": None, "id": 6},
+        {"type": ["order"], "id": 7},
+        {"type": {"order": 1}, "id": 8},
+        {"type": 1, "id": 9},
+        "not an object"
+    ]
+
+    @pytest.mark.parametrize("backend", ["closures", "codegen"])
+    def test_same_errors(self, backend):
+        indexed = Validator(self.rules, backend=backend)
+        plain = Validator(self.rules, backend=backend, guard_index=False)
+        assert indexed._index is not None and plain._index is None
+        assert indexed.validate_many(self.records) == plain.validate_many(self.records)
+        indexed.reset()
+        plain.reset()
+        assert [indexed.validate(record) for record in self.records] == [plain.validate(record) for record in self.records]
+        indexed.reset()
+        plain.reset()
+        assert list(indexed.iter_validate_structured(self.records)) == list(plain.iter_validate_structured(self.records))
+        for options in [{"fail_fast": True}, {"max_errors": 2}]:
+            indexed.reset()
+            plain.reset()
+            for _ in range(50):
+                assert indexed.validate_many(self.records, **options) == plain.validate_many(self.records, **options)
+
+    def test_selected_rules(self):
+        index = Validator(self.rules)._index
+        assert index.path == "$.type" and len(index) == 3
+        assert index.select({"type": "order"})[0] == [0, 1, 3, 4, 5, 6, 7]
+        assert index.select({"type": "refund"})[0] == [1, 2, 3, 4, 6]
+        # the rules without else fail and stay in place, the ones with a true else are skipped
+        assert index.select({"type": "other"})[0] == [1, 3, 4, 6]
+        assert index.select({"type": []})[0] == list(range(8))
+
+    def test_unique_only_sees_its_type(self):
+        validator = Validator(json.dumps([{"rule": ["if", ["eq", "$.type", "order"], ["unique", "$.id"], True]},
+                                          {"rule": ["if", ["eq", "$.type", "refund"], ["unique", "$.id"], True]}]))
+        records = [{"type": "refund", "id": 1}, {"type": "order", "id": 1}, {"type": "refund", "id": 2}, {"type": "order", "id": 2}]
+        assert validator.validate_many(records) == [[]] * 4
+        assert len(validator.validate({"type": "order", "id": 1})) == 1
+
+    def test_not_indexed(self):
+        assert Validator(json.dumps([{"rule": ["if", ["eq", "$.type", "a"], ["exists", "$.a"], True]}]))._index is None
+        assert Validator(json.dumps([{"rule": ["if", ["eq", "$.type", "a"], ["exists", "$.a"], True]},
+                                     {"rule": ["if", ["eq", "$.kind", "a"], ["exists", "$.a"], True]},
+                                     {"rule": ["if", ["gt", "$.type", "a"], ["exists", "$.a"], True]}]))._index is None
+        assert Validator(self.rules, profile=True)._index is None
+        split = ["split", "a_b", "_"]
+        validator = Validator(json.dumps([{"rule": ["if", ["eq", "$.t", split], ["exists", "$.a"], True]},
+                                          {"rule": ["if", ["in", "$.t", split, "c"], ["exists", "$.a"], True]},
+                                          {"rule": ["if", ["eq", "$.t", split], ["exists", "$.b"], True]}]))
+        assert validator._index is None
+        assert len(validator.validate({"t": ["a", "b"]})) == 3
+        assert len(validator.validate({"t": "c"})) == 1
+
+    types = [f"type-{i}" for i in range(40)]
+    typed_rules = json.dumps([{"name": f"{kind} {i}", "rule": ["if", ["eq", "$.type", kind], ["in-range", f"$.field_{i}", 0, 10], True]}
+                              for kind in types for i in range(10)])
+    typed_records = [dict({"type": kind}, **{f"field_{i}": i for i in range(10)}) for kind in types]
+
+    def test_40_types_indexed_0(self, benchmark):
+        validator = Validator(self.typed_rules)
+        assert benchmark(validator.validate_many, self.typed_records) == [[]] * 40
+
+    def test_40_types_not_indexed_0(self, benchmark):
+        validator = Validator(self.typed_rules, guard_index=False)
+        assert benchmark(validator.validate_many, self.typed_records) == [[]] * 40
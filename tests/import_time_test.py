@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+sys.path.append("..")
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# cumulated microseconds python -X importtime reports for import validator, best of RUNS
+IMPORT_BUDGET_US = 50000
+RUNS = 5
+
+
+def import_env() -> dict:
+    # bytecode has to be written, compiling the sources isn't part of the budget
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def import_time(module: str) -> int:
+    """
+        cumulated import time of module in a fresh interpreter, in microseconds
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=PACKAGE, env=import_env(), capture_output=True, text=True, check=True)
+    for line in completed.stderr.splitlines():
+        _, _, cumulative, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        if name == module:
+            return int(cumulative)
+    raise Exception(f"{module} not found in the -X importtime output")
+
+
+def loaded_modules(code: str) -> set:
+    completed = subprocess.run([sys.executable, "-c", code + "\nimport sys\nprint(' '.join(sys.modules))"],
+                               cwd=PACKAGE, capture_output=True, text=True, check=True)
+    return set(completed.stdout.split())
+
+
+class TestImportTime:
+
+    def test_budget(self):
+        # an untimed run first compiles the sources of a fresh checkout to bytecode
+        subprocess.run([sys.executable, "-c", "import validator"], cwd=PACKAGE, env=import_env(), check=True)
+        assert min(import_time("validator") for _ in range(RUNS)) <= IMPORT_BUDGET_US
+
+    def test_heavy_modules_are_lazy(self):
+        modules = loaded_modules(
+            "from validator import Validator\n"
+            "Validator('[{\"rule\": [\"eq\", \"$.foo.bar[0]\", 1]}]').validate({'foo': {'bar': [1]}})")
+        assert not {"jsonpath_ng", "ply", "asyncio", "concurrent.futures", "pickle"} & modules
+
+    def test_full_parser_is_loaded_when_needed(self):
+        modules = loaded_modules(
+            "from validator import Validator\n"
+            "assert Validator('[{\"rule\": [\"eq\", [\"length\", \"$.foo[*]\"], 2]}]').validate({'foo': [1, 2]}) == []")
+        assert "jsonpath_ng" in modules
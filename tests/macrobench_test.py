@@ -0,0 +1,92 @@
+import json
+import random
+import pytest
+import registry
+from macrobench import compare, deep_path, generate_document, generate_rules, main, run_case
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+def functions(expression) -> set:
+    if not isinstance(expression, list):
+        return set()
+    return {expression[0]}.union(*[functions(argument) for argument in expression[1:]])
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestMacrobench:
+
+    @pytest.fixture
+    def reference_file(self, tmp_path):
+        reference = tmp_path / "currencies.txt"
+        reference.write_text("EUR\nUSD\nGBP\n")
+        return str(reference)
+
+    def test_document_sizes(self):
+        rng = random.Random(0)
+        for size in [1000, 10000, 100000, 1000000]:
+            assert size * 0.9 < len(json.dumps(generate_document(rng, size))) < size * 1.1
+        document = generate_document(rng, 1000, depth=30)
+        assert Validator(json.dumps([{"rule": ["eq", deep_path(30), 1]}])).validate(document) == []
+
+    def test_covers_every_builtin(self, reference_file):
+        builtins = {name for name, spec in registry.FUNCTIONS.items()
+                    if getattr(spec.function or spec.build, '__module__', None) in ["handlers", "tree"]}
+        used = set().union(*[functions(rule["rule"]) for rule in generate_rules(200, reference_file)])
+        assert builtins - used == set()
+
+    @pytest.mark.parametrize("backend", ["closures", "codegen"])
+    def test_generated_rules_pass(self, backend, reference_file):
+        validator = Validator(json.dumps(generate_rules(300, reference_file)), backend=backend)
+        rng = random.Random(1)
+        assert validator.validate_many([generate_document(rng, 5000, index=index) for index in range(10)]) == [[]] * 10
+        assert validator.validate_dataset() == []
+
+    def test_run_case(self, reference_file):
+        result = run_case(60, 2000, max_records=50, reference_file=reference_file)
+        assert result["records"] == 60
+        assert result["p50_us"] <= result["p95_us"] <= result["p99_us"]
+        assert result["records_per_s"] > 0 and result["compile_s"] > 0 and result["peak_bytes"] > 0
+
+    def test_run_case_without_reference_file(self):
+        assert run_case(30, 1000, max_records=10)["rules"] == 30
+
+    def test_compare(self):
+        baseline = {"a": {"records_per_s": 1000, "p95_us": 10, "compile_s": 0.5, "peak_bytes": 100}}
+        assert compare({"a": {"records_per_s": 800, "p95_us": 12, "compile_s": 0.6, "peak_bytes": 100}}, baseline) == []
+        regressions = compare({"a": {"records_per_s": 700, "p95_us": 5, "compile_s": 0.5, "peak_bytes": 200},
+                               "b": {"records_per_s": 1, "p95_us": 1, "compile_s": 1, "peak_bytes": 1}}, baseline)
+        assert [regression.split(":")[0] for regression in regressions] == ["a records_per_s", "a peak_bytes"]
+        assert compare({"a": {"records_per_s": 700, "p95_us": 10, "compile_s": 0.5, "peak_bytes": 100}}, baseline, 0.5) == []
+
+    def test_cli_baseline(self, tmp_path, capsys):
+        baseline = tmp_path / "baseline.json"
+        arguments = ["--rules", "10", "--sizes", "1000", "--max-records", "20"]
+        assert main(arguments + ["-o", str(baseline)]) == 0
+        assert "records/s, closures" in capsys.readouterr().out
+        results = json.loads(baseline.read_text())
+        assert list(results) == ["rules=10,size=1000,backend=closures"]
+
+        results["rules=10,size=1000,backend=closures"]["records_per_s"] *= 100
+        baseline.write_text(json.dumps(results))
+        assert main(arguments + ["--baseline", str(baseline)]) == 1
+        assert "records_per_s" in capsys.readouterr().err
+
+    documents = [generate_document(random.Random(2), 100000, index=index) for index in range(5)]
+
+    def test_100_rules_100kb_0(self, benchmark, reference_file):
+        validator = Validator(json.dumps(generate_rules(100, reference_file)))
+
+        def validate():
+            validator.reset()
+            return validator.validate_many(self.documents)
+        assert benchmark(validate) == [[]] * 5
+
+    def test_100_rules_100kb_codegen_0(self, benchmark, reference_file):
+        validator = Validator(json.dumps(generate_rules(100, reference_file)), backend="codegen")
+
+        def validate():
+            validator.reset()
+            return validator.validate_many(self.documents)
+        assert benchmark(validate) == [[]] * 5
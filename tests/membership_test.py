@@ -0,0 +1,77 @@
+import json
+import pytest
+import optimizer
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestMembership:
+
+    data = {
+        "status": "status-999",
+        "code": 404,
+        "allowed": ["a", "b"]
+    }
+
+    statuses = [f"status-{i}" for i in range(1000)]
+
+    def validate(self, benchmark, rule):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_results(self):
+        validator = Validator('''
+            [
+                {"name": "literals", "rule": ["in", "$.status", "status-1", "status-999"]},
+                {"name": "numbers", "rule": ["in", "$.code", 200, 404.0]},
+                {"name": "not in", "rule": ["not-in", "$.code", 200, 500]},
+                {"name": "list", "rule": ["in", "a", "$.allowed"]},
+                {"name": "computed", "rule": ["in", "$.code", ["abs", -404], "$.status"]},
+                {"name": "missing", "rule": ["in", "$.missing", "a"]},
+                {"name": "unhashable", "rule": ["in", "$.allowed", "a"]}
+            ]
+        ''')
+        assert [error.split('"')[1] for error in validator.validate(self.data)] == ["missing", "unhashable"]
+        with pytest.raises(Exception):
+            Validator('[{"rule": ["in", "$.status"]}]')
+
+    def test_equalities_are_merged(self, monkeypatch):
+        rules = json.dumps([{"rule": ["or", ["eq", ["to-lower", "$.status"], "x"], "$.flag"]
+                             + [["eq", "$.status", status] for status in self.statuses[:5]]
+                             + [["eq", status, "$.status"] for status in self.statuses[5:10]]}])
+        validator = Validator(rules)
+        operands = validator.val_tree[0]["node"]._leafs
+        assert [operand._expression for operand in operands] == ["eq", "$.flag", "in"]
+        assert len(operands[2]._leafs) == 11
+        monkeypatch.setattr(optimizer, "MIN_MERGED_EQUALITIES", 100)
+        unmerged = Validator(rules)
+        assert [operand._expression for operand in unmerged.val_tree[0]["node"]._leafs].count("eq") == 11
+        for record in [{"status": "status-3"}, {"status": "status-7"}, {"status": "X"}, {"status": "status-10"}, {"status": None}]:
+            assert validator.validate(record) == unmerged.validate(record)
+        assert len(validator.validate({"status": "status-10"})) == 1
+        assert len(validator.validate({"status": None})) == 1
+
+    def test_unhashable_literals(self):
+        split = ["split", "a_b", "_"]
+        validator = Validator(json.dumps([
+            {"name": "or", "rule": ["or", ["eq", "$.x", split], ["eq", "$.x", 1], ["eq", "$.x", 2], ["eq", "$.x", 3]]},
+            {"name": "in", "rule": ["in", "$.x", split, "c"]},
+            {"name": "in list", "rule": ["in", "$.x", split]}
+        ]))
+        for x, failed in [(["a", "b"], ["in list"]), ("c", ["or", "in list"]), ("a", ["or", "in"]), (2, ["in", "in list"])]:
+            assert [error.split('"')[1] for error in validator.validate({"x": x})] == failed
+
+    def test_or_chain_0(self, benchmark):
+        self.validate(benchmark, json.dumps([{"rule": ["or"] + [["eq", "$.status", status] for status in self.statuses]}]))
+
+    def test_or_chain_unmerged_0(self, benchmark, monkeypatch):
+        monkeypatch.setattr(optimizer, "MIN_MERGED_EQUALITIES", 10000)
+        self.validate(benchmark, json.dumps([{"rule": ["or"] + [["eq", "$.status", status] for status in self.statuses]}]))
+
+    def test_in_0(self, benchmark):
+        self.validate(benchmark, json.dumps([{"rule": ["in", "$.status"] + self.statuses}]))
+
+    def test_not_in_0(self, benchmark):
+        self.validate(benchmark, json.dumps([{"rule": ["not-in", "$.code"] + list(range(1000))[:404] + list(range(405, 1000))}]))
@@ -0,0 +1,36 @@
+import pytest
+from parallel import ParallelValidator
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1, min_time=0.5, max_time=2, min_rounds=3, warmup=False)
+class TestParallelValidation:
+
+    rule = '''
+            [
+                {"name": "foo in range", "rule": ["in-range", "$.foo", 0, 5]},
+                {"name": "bar prefix", "rule": ["starts-with", ["concat", "$.bar", "_", "$.baz"], "some_"]},
+                {"name": "baz", "rule": ["eq", ["length", ["split", "$.baz", "_"]], 2]}
+            ]
+        '''
+
+    records = [{"foo": i % 7, "bar": "some", "baz": "a_b" if i % 11 else "a"} for i in range(20000)]
+
+    def test_same_results_in_input_order(self):
+        expected = Validator(self.rule).validate_many(self.records[:2000])
+        with ParallelValidator(self.rule, workers=2, chunk_size=128, max_pending=3) as validator:
+            assert validator.validate_many(self.records[:2000]) == expected
+            assert list(validator.iter_validate(iter(self.records[:10]))) == expected[:10]
+            assert validator.validate_many([]) == []
+
+    def test_broken_rules_fail_in_caller(self):
+        with pytest.raises(Exception):
+            ParallelValidator('[{"rule": ["eq", 1]}]', workers=1)
+
+    @pytest.mark.parametrize("workers", [1, 2, 4])
+    def test_parallel_scaling(self, benchmark, workers):
+        with ParallelValidator(self.rule, workers=workers, chunk_size=1000) as validator:
+            validator.validate_many(self.records[:workers * 1000])
+            benchmark(validator.validate_many, self.records)
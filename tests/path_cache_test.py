@@ -0,0 +1,47 @@
+import pytest
+from handlers import PathCache, lookup, parse_path, path_cache
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestPathCache:
+
+    data = {"foo": 1, "empty": [], "nested": {"list": [{"value": 2}]}, "text": "abc", "null": None}
+
+    def test_same_matches_as_jsonpath(self):
+        for path in ["$.foo", "$.empty", "$.missing", "$.nested.list[0].value", "$.nested.list[1]", "$.nested.list[*].value",
+                     "$.text[0]", "$.foo.bar", "$.nested.list.value", "$.null", "$.nested['list']"]:
+            assert [match.value for match in lookup(self.data, lambda _: path)] == \
+                [match.value for match in parse_path(path).find(self.data)], path
+
+    def test_counters(self):
+        cache = PathCache(max_size=2)
+        finders = [cache.finder(path) for path in ["$.a", "$.b", "$.a", "$.c", "$.b"]]
+        assert finders[0] is finders[2]
+        assert cache.stats() == (2, 2, 1, 4, 2)
+        assert cache.stats().hit_rate == 0.2
+        cache.warm(["$.x", "$.y[*]"])
+        assert cache.stats() == (2, 2, 1, 4, 4)
+        cache.resize(1)
+        assert len(cache) == 1 and cache.stats().evictions == 5
+        cache.clear()
+        assert cache.stats() == (0, 1, 0, 0, 0)
+        with pytest.raises(Exception, match="at least one path"):
+            cache.resize(0)
+
+    def test_shared_by_validators(self):
+        rule = '[{"rule": ["exists", ["lookup", ["concat", "$", ".", "$.field"]]]}]'
+        path_cache.warm(["$.shared_by_validators"])
+        hits = path_cache.hits
+        for _ in range(3):
+            assert Validator(rule).validate({"field": "shared_by_validators", "shared_by_validators": []}) == []
+        assert path_cache.hits == hits + 3
+
+    fields = [{"field": f"field_{i}", f"field_{i}": i} for i in range(5000)]
+    rule = '[{"rule": ["exists", ["lookup", ["concat", "$", ".", "$.field"]]]}]'
+
+    def test_lookup_5000_paths_0(self, benchmark):
+        validator = Validator(self.rule)
+        assert benchmark(validator.validate_many, self.fields) == [[]] * 5000
@@ -0,0 +1,88 @@
+import pytest
+from handlers import path_steps, path_value, resolve_steps
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestSimplePaths:
+
+    data = {
+        "foo": 1,
+        "bar": None,
+        "baz": {
+            "foo": [{"bar": 1}, {"bar": "2"}],
+            "bar": "some_string",
+            "empty": []
+        },
+        "items": [[1, 2], []]
+    }
+
+    paths = [
+        "$.foo",
+        "$.bar",
+        "$.missing",
+        "$.foo.bar",
+        "$.baz.foo",
+        "$.baz.foo[0].bar",
+        "$.baz.foo[1].bar",
+        "$.baz.foo[2].bar",
+        "$.baz.foo.bar",
+        "$.baz.bar.foo",
+        "$.baz.bar[0]",
+        "$.baz.empty[0]",
+        "$.items[0][1]",
+        "$.items[1]",
+        "$.items[1][0]",
+    ]
+
+    def validate(self, benchmark, rule):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_path_steps(self):
+        assert path_steps("$.foo") == ("foo",)
+        assert path_steps("$.baz.foo[0].bar") == ("baz", "foo", 0, "bar")
+        assert path_steps("$.foo-bar_1") == ("foo-bar_1",)
+        assert path_steps("$") == ()
+
+    def test_path_steps_fallback(self):
+        for expression in ["$.foo[*]", "$..foo", "$.foo[0:1]", "$.foo[-1]", "$.'foo'", "$.foo.where", "$.foo[?(@.bar)]", "foo"]:
+            assert path_steps(expression) is None
+
+    def test_resolve_steps_same_as_jsonpath(self):
+        for expression in self.paths:
+            steps = path_steps(expression)
+            assert steps is not None
+            assert resolve_steps(self.data, steps, expression) == path_value(self.data, expression), expression
+
+    def test_simple_path_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["eq", "$.baz.foo[0].bar", "$.foo"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
+
+    def test_simple_path_1(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["eq", "$.baz.bar", "some_string"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
+
+    def test_jsonpath_fallback_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["eq", ["length", "$.baz.foo[*].bar"], 2]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
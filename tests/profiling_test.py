@@ -0,0 +1,68 @@
+import json
+import pytest
+from profiling import main
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestProfiling:
+
+    rules = json.dumps([
+        {"name": "amount in range", "rule": ["in-range", "$.amount", 0, 100]},
+        {"name": "email", "rule": ["matches", "$.email", "[a-z]+@[a-z]+[.]com"]},
+        {"name": "prices", "rule": ["every", "$.items", ["gt", "@.price", 0]]}
+    ])
+
+    records = [{"amount": i, "email": "ab@cd.com" if i % 4 else 1, "items": [{"price": j} for j in range(20)]}
+               for i in range(90, 110)]
+
+    def test_rule_stats(self):
+        validator = Validator(self.rules, profile=True)
+        validator.validate_many(self.records)
+        amount, email, prices = validator.profile.rules
+        assert (amount.name, amount.calls, amount.passed, amount.failed, amount.errors) == ("amount in range", 20, 11, 9, 0)
+        assert (email.passed, email.errors) == (15, 5)
+        assert prices.failed == 20 and prices.slowest_node in ["every", "gt", "relative path"]
+        assert set(prices.nodes) == {"path", "every", "gt", "relative path"}
+        assert prices.nodes["gt"][0] == 20
+        assert 0 < amount.max_ns <= amount.total_ns
+        assert validator.profile.top(1)[0] is prices
+
+        validator.profile.reset()
+        assert validator.profile.rules[0].calls == 0 and validator.profile.rules[0].name == "amount in range"
+
+    def test_disabled(self):
+        validator = Validator(self.rules)
+        assert validator.profile is None
+        assert [rule[0] for rule in validator._rules] == [rule['validate'] for rule in validator.val_tree]
+
+    def test_exports(self):
+        validator = Validator(json.dumps([{"name": "say \"hi\"", "rule": ["eq", "$.a", 1]}]), profile=True)
+        validator.validate({"a": 2})
+        assert json.loads(validator.profile.to_json())[0]["failed"] == 1
+        metrics = validator.profile.to_prometheus()
+        assert '# TYPE json_validator_rule_evaluations_total counter' in metrics
+        assert 'json_validator_rule_evaluations_total{rule="say \\"hi\\"",index="0"} 1' in metrics
+        assert 'json_validator_rule_results_total{rule="say \\"hi\\"",index="0",result="failed"} 1' in metrics
+        assert 'node="eq"' in metrics
+
+    def test_cli(self, tmp_path, capsys):
+        rules = tmp_path / "rules.json"
+        rules.write_text(self.rules)
+        sample = tmp_path / "sample.ndjson"
+        sample.write_text("".join(json.dumps(record) + "\n" for record in self.records))
+        assert main([str(rules), str(sample), "--top", "2"]) == 0
+        report = capsys.readouterr().out.splitlines()
+        assert len(report) == 3 and report[1].startswith("prices")
+        main([str(rules), str(sample), "--format", "json", "--backend", "codegen"])
+        assert [stats["calls"] for stats in json.loads(capsys.readouterr().out)] == [20, 20, 20]
+
+    def test_disabled_0(self, benchmark):
+        validator = Validator(self.rules)
+        benchmark(validator.validate, obj=self.records[0])
+
+    def test_enabled_0(self, benchmark):
+        validator = Validator(self.rules, profile=True)
+        benchmark(validator.validate, obj=self.records[0])
@@ -0,0 +1,113 @@
+import json
+import pytest
+from registry import FUNCTIONS, register_function
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestQuantifiers:
+
+    rules = json.dumps([
+        {"name": "prices", "rule": ["every", "$.items", ["gt", "@.price", 0]]},
+        {"name": "big item", "rule": ["any", "$.items", ["gte", "@.price", "$.min_price"]]},
+        {"name": "two cheap items", "rule": ["eq", ["count-where", "$.items", ["lt", "@.price", 10]], 2]},
+        {"name": "skus", "rule": ["every", "$.orders", ["every", "@.items", ["is_string", "@.sku"]]]},
+        {"name": "emails", "rule": ["every", "$.emails", ["ends-with", "@", "@example.com"]]},
+        {"name": "pair of one", "rule": ["any", "$.pairs", ["eq", "@[0]", 1]]}
+    ])
+
+    records = [
+        {"items": [{"price": 1}, {"price": 5}, {"price": 20}], "min_price": 10,
+         "orders": [{"items": [{"sku": "a"}]}, {"items": []}], "emails": ["a@example.com"], "pairs": [[2, 1], [1, 2]]},
+        {"items": [{"price": 0}, {"price": "12"}], "min_price": 10, "orders": [{"items": [{"sku": 1}]}], "emails": [1], "pairs": [[2, 1], []]},
+        {"items": {"price": 1}, "orders": [{}], "emails": []},
+        {}
+    ]
+
+    @pytest.mark.parametrize("backend", ["closures", "codegen"])
+    def test_quantifiers(self, backend):
+        validator = Validator(self.rules, backend=backend)
+        failed = [[error.split('"')[1] for error in errors] for errors in validator.validate_many(self.records)]
+        assert failed == [
+            [],
+            ["prices", "big item", "two cheap items", "skus", "emails", "pair of one"],
+            ["prices", "big item", "two cheap items", "pair of one"],
+            ["big item", "two cheap items", "pair of one"],
+        ]
+        errors = validator.validate(self.records[1])
+        # "12" < 10 raises, the element before decides every
+        assert "error in rule: every" in errors[0]
+        assert "'<' not supported" in errors[2]
+        assert "every expects a list, dict found" in validator.validate(self.records[2])[0]
+
+    def test_backends_agree(self):
+        records = self.records + [{"items": [{"price": price} for price in prices], "min_price": 3}
+                                  for prices in [[1, "x"], ["x", 1], ["x", 5], [None], [5, "x"]]]
+        closures, codegen = Validator(self.rules), Validator(self.rules, backend="codegen")
+        assert closures.validate_many(records) == codegen.validate_many(records)
+
+    @pytest.mark.parametrize("backend", ["closures", "codegen"])
+    def test_relative_paths_need_a_scope(self, backend):
+        # strings everywhere but in the rule of a quantifier
+        for rule in ['["contains", "$.email", "@"]', '["eq", "$.at", "@.price"]', '["eq", "$.at", "@home"]']:
+            validator = Validator(f'[{{"rule": {rule}}}]', backend=backend)
+            assert validator.validate({"email": "a@b.com", "at": json.loads(rule)[2]}) == []
+        assert len(Validator('[{"rule": ["every", "@.items", ["gt", "@.price", 0]]}]', backend=backend).validate({})) == 1
+        # @@ is a literal @ in the rule of a quantifier
+        validator = Validator('[{"rule": ["every", "$.emails", ["all", ["contains", "@", "@@"], ["neq", "@", "@@.x"]]]}]', backend=backend)
+        assert validator.validate({"emails": ["a@b.com", "@"]}) == []
+        assert len(validator.validate({"emails": ["a@b.com", "ab.com"]})) == 1
+        assert len(validator.validate({"emails": ["@.x"]})) == 1
+
+    def test_early_exit(self):
+        evaluated = []
+
+        def positive(data, expr):
+            evaluated.append(expr(data))
+            return evaluated[-1] > 0
+
+        register_function("quantifiers-test-positive", positive, 1)
+        items = [{"price": 1}, {"price": 0}] + [{"price": 1}] * 1000
+        try:
+            for backend in ["closures", "codegen"]:
+                evaluated.clear()
+                validator = Validator('[{"rule": ["every", "$.items", ["quantifiers-test-positive", "@.price"]]}]', backend=backend)
+                assert len(validator.validate({"items": items})) == 1
+                assert evaluated == [1, 0]
+        finally:
+            # a closure over a list, rule caches can't tell it from other functions
+            FUNCTIONS.pop("quantifiers-test-positive")
+
+    def items(self, count):
+        return {"items": [{"price": i + 1, "sku": f"sku-{i}"} for i in range(count)]}
+
+    def validate(self, benchmark, rule, data, backend="closures"):
+        validator = Validator(rule, backend=backend)
+        assert len(benchmark(validator.validate, obj=data)) == 0
+
+    every_rule = '[{"rule": ["every", "$.items", ["gt", "@.price", 0]]}]'
+    match_list_rule = '[{"rule": ["gt", ["length", "$.items[*].price"], 0]}]'
+
+    def test_every_10(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(10))
+
+    def test_every_100(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(100))
+
+    def test_every_1000(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(1000))
+
+    def test_every_codegen_10(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(10), "codegen")
+
+    def test_every_codegen_100(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(100), "codegen")
+
+    def test_every_codegen_1000(self, benchmark):
+        self.validate(benchmark, self.every_rule, self.items(1000), "codegen")
+
+    def test_match_list_1000(self, benchmark):
+        # what every replaces: the whole match list of a jsonpath wildcard
+        self.validate(benchmark, self.match_list_rule, self.items(1000))
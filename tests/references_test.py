@@ -0,0 +1,98 @@
+import json
+import tracemalloc
+import pytest
+import references
+from references import reference_index
+from validator import Validator
+import sys
+sys.path.append("..")
+
+SKUS = [f"SKU-{i:07d}" for i in range(100000)]
+
+
+@pytest.fixture(scope="module")
+def reference_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("references")
+    index_dir = references.INDEX_DIR
+    references.INDEX_DIR = str(directory / "indexes")
+    with open(directory / "skus.csv", "w", encoding="utf-8") as skus:
+        skus.write("id,sku\n" + "".join(f"{i},{sku}\n" for i, sku in enumerate(SKUS)))
+    with open(directory / "codes.txt", "w", encoding="utf-8") as codes:
+        codes.write("75001\n\n75002\nÉcole\n")
+    yield directory
+    references.INDEX_DIR = index_dir
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestReferences:
+
+    data = {
+        "sku": "SKU-0050000",
+        "code": 75002
+    }
+
+    def validate(self, benchmark, rule):
+        validator = Validator(json.dumps([{"rule": rule}]))
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_results(self, reference_files):
+        rules = json.dumps([
+            {"name": "sku", "rule": ["in-reference", "$.sku", str(reference_files / "skus.csv"), "sku"]},
+            {"name": "id", "rule": ["in-reference", "$.sku", str(reference_files / "skus.csv")]},
+            {"name": "code", "rule": ["in-reference", "$.code", str(reference_files / "codes.txt")]},
+            {"name": "school", "rule": ["in-reference", "École", str(reference_files / "codes.txt")]},
+            {"name": "missing", "rule": ["in-reference", "$.missing", str(reference_files / "codes.txt")]}
+        ])
+        assert [error.split('"')[1] for error in Validator(rules).validate(self.data)] == ["id", "missing"]
+        assert [error.split('"')[1] for error in Validator(rules).validate({"sku": "SKU-0100000", "code": "75001"})] == ["sku", "id", "missing"]
+
+    def test_errors(self, reference_files):
+        with pytest.raises(Exception, match="not found"):
+            Validator(json.dumps([{"rule": ["in-reference", "$.sku", str(reference_files / "nope.csv")]}]))
+        with pytest.raises(Exception, match="column price not found"):
+            Validator(json.dumps([{"rule": ["in-reference", "$.sku", str(reference_files / "skus.csv"), "price"]}]))
+        with pytest.raises(Exception, match="literal strings"):
+            Validator(json.dumps([{"rule": ["in-reference", "$.sku", "$.file"]}]))
+
+    def test_changed_file_is_indexed_again(self, reference_files):
+        source = reference_files / "changing.txt"
+        source.write_text("a\n")
+        rule = json.dumps([{"rule": ["in-reference", "$.value", str(source)]}])
+        assert Validator(rule).validate({"value": "b"})
+        source.write_text("a\nb\n")
+        assert Validator(rule).validate({"value": "b"}) == []
+
+    def test_shared_index_directory_is_not_used(self, reference_files, monkeypatch):
+        shared = reference_files / "shared"
+        shared.mkdir(mode=0o700)
+        shared.chmod(0o777)
+        (reference_files / "link").symlink_to(reference_files / "indexes")
+        for index_dir in [shared, reference_files / "link"]:
+            assert not references.private_directory(str(index_dir))
+            monkeypatch.setattr(references, "INDEX_DIR", str(index_dir))
+            references._indexes.clear()
+            index = reference_index(str(reference_files / "codes.txt"))
+            assert "75001" in index and "75003" not in index and len(index) == 3
+        assert list(shared.iterdir()) == []
+        assert references.private_directory(str(reference_files / "indexes"))
+        references._indexes.clear()
+
+    def test_memory_per_process(self, reference_files):
+        reference_index(str(reference_files / "skus.csv"), "sku")
+        references._indexes.clear()
+
+        tracemalloc.start()
+        index = reference_index(str(reference_files / "skus.csv"), "sku")
+        mapped = tracemalloc.get_traced_memory()[0]
+        in_memory = frozenset(SKUS)
+        held = tracemalloc.get_traced_memory()[0] - mapped
+        tracemalloc.stop()
+
+        # the index pages belong to the page cache, shared by every process mapping the file
+        assert len(index) == len(in_memory) and mapped * 100 < held
+
+    def test_in_reference_0(self, benchmark, reference_files):
+        self.validate(benchmark, ["in-reference", "$.sku", str(reference_files / "skus.csv"), "sku"])
+
+    def test_in_0(self, benchmark):
+        self.validate(benchmark, ["in", "$.sku"] + SKUS)
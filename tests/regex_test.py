@@ -0,0 +1,65 @@
+import pytest
+from handlers import regex_pattern, use_regex_engine
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestRegex:
+
+    data = {
+        "foo": "some_string",
+        "sku": "AB-1234",
+        "pattern": "^[A-Z]{2}-[0-9]+$"
+    }
+
+    def validate(self, benchmark, rule):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_results(self):
+        validator = Validator('''
+            [
+                {"rule": ["matches", "$.foo", "some"]},
+                {"rule": ["regex-search", "$.foo", "^some"]},
+                {"rule": ["eq", ["regex-extract", "$.sku", "[0-9]+"], "1234"]},
+                {"rule": ["is_null", ["regex-extract", "$.sku", "x(y)"]]},
+                {"rule": ["regex-search", 12, "1"]}
+            ]
+        ''')
+        assert [error.split('"')[1] for error in validator.validate(self.data)] == [
+            "validation rule: matches", "validation rule: regex-search"]
+
+    def test_literal_pattern_compiled_once(self):
+        with pytest.raises(Exception):
+            Validator('[{"rule": ["matches", "$.foo", "("]}]')
+        validator = Validator('[{"rule": ["matches", "$.sku", "[A-Z]{2}-[0-9]{4}"]}]')
+        misses = regex_pattern.cache_info().misses
+        hits = regex_pattern.cache_info().hits
+        for _ in range(10):
+            assert validator.validate(self.data) == []
+        assert regex_pattern.cache_info()[:2] == (hits, misses)
+
+    def test_dynamic_pattern_cache(self):
+        validator = Validator('[{"rule": ["matches", "$.sku", "$.pattern"]}]')
+        regex_pattern.cache_clear()
+        for _ in range(10):
+            assert validator.validate(self.data) == []
+        assert regex_pattern.cache_info()[:2] == (9, 1)
+
+    def test_engines(self):
+        with pytest.raises(Exception, match="unknown regex engine"):
+            use_regex_engine("pcre")
+        try:
+            use_regex_engine("re2")
+        except Exception as e:
+            assert "not installed" in str(e)
+        finally:
+            use_regex_engine("re")
+
+    def test_literal_pattern_0(self, benchmark):
+        self.validate(benchmark, '[{"rule": ["matches", "$.sku", "^[A-Z]{2}-[0-9]+$"]}]')
+
+    def test_dynamic_pattern_0(self, benchmark):
+        self.validate(benchmark, '[{"rule": ["matches", "$.sku", "$.pattern"]}]')
@@ -0,0 +1,102 @@
+import json
+import pytest
+from registry import FUNCTIONS, function_spec, register_function
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.fixture
+def restore_registry():
+    functions = dict(FUNCTIONS)
+    yield
+    FUNCTIONS.clear()
+    FUNCTIONS.update(functions)
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestRegistry:
+
+    data = {
+        "foo": 3,
+        "bar": "some_string",
+        "flag": True,
+        "nothing": None
+    }
+
+    def validate(self, benchmark, rule):
+        validator = Validator(rule)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_gt_0(self, benchmark):
+        self.validate(benchmark, '[{"rule": ["all", ["gt", "$.foo", 2], ["gte", "$.foo", 3], ["lt", "$.foo", 4], ["lte", "$.foo", 3]]}]')
+
+    def test_to_upper_0(self, benchmark):
+        self.validate(benchmark, '[{"rule": ["eq", ["to-upper", ["substring", "$.bar", 0, 4]], "SOME"]}]')
+
+    def test_is_null_0(self, benchmark):
+        self.validate(benchmark, '[{"rule": ["all", ["is_null", "$.nothing"], ["is_boolean", "$.flag"], ["not", ["is_boolean", "$.foo"]]]}]')
+
+    def test_arity(self):
+        with pytest.raises(Exception, match="gt expects 2 arguments"):
+            Validator('[{"rule": ["gt", "$.foo"]}]')
+        with pytest.raises(Exception, match="Unsupported expression"):
+            Validator('[{"rule": ["greater", "$.foo", 1]}]')
+
+    def test_custom_function(self, restore_registry):
+        register_function("is_even", lambda data, expr: expr(data) % 2 == 0, 1, foldable=True)
+        validator = Validator('[{"rule": ["is_even", "$.foo"]}, {"rule": ["is_even", 4]}]')
+        assert len(validator.val_tree) == 1
+        assert len(validator.validate(self.data)) == 1
+        assert validator.validate({"foo": 2}) == []
+
+    def test_not_folded_by_default(self, restore_registry):
+        register_function("has-key", lambda data, key: isinstance(data, dict) and key(data) in data, 1)
+        validator = Validator('[{"rule": ["has-key", "foo"]}]')
+        assert len(validator.val_tree) == 1
+        assert validator.validate({"foo": 1}) == []
+        assert len(validator.validate({"bar": 1})) == 1
+
+    def test_impure_function(self, restore_registry):
+        calls = []
+
+        def tick(data, expr):
+            calls.append(expr(data))
+            return True
+
+        spec = register_function("tick", tick, 1, pure=False, foldable=True)
+        assert not spec.foldable
+        validator = Validator(json.dumps([{"rule": ["tick", 1]}, {"rule": ["tick", 1]}]))
+        validator.validate(self.data)
+        assert calls == [1, 1]
+
+    @pytest.mark.parametrize("backend", ["closures", "codegen"])
+    def test_replace_builtin(self, restore_registry, backend):
+        register_function("eq", lambda data, left, right: str(left(data)) == str(right(data)), 2)
+        assert not function_spec("eq").inline
+        assert Validator('[{"rule": ["eq", "$.foo", "3"]}]', backend=backend).validate(self.data) == []
+
+    def test_cache_key(self, restore_registry, tmp_path):
+        from cache import RuleCache
+        rule_cache = RuleCache(str(tmp_path))
+        key = rule_cache.key("[]")
+        register_function("is_even", lambda data, expr: expr(data) % 2 == 0, 1)
+        assert rule_cache.key("[]") != key
+        key = rule_cache.key("[]")
+        # same qualified name, other code
+        register_function("is_even", lambda data, expr: expr(data) % 2 == 1, 1)
+        assert rule_cache.key("[]") != key
+
+        def divisible(divisor):
+            return lambda data, expr: expr(data) % divisor == 0
+
+        register_function("is_even", divisible(2), 1)
+        key = rule_cache.key("[]")
+        register_function("is_even", divisible(3), 1)
+        assert rule_cache.key("[]") != key
+
+        # closures over objects can't be told apart, nothing is cached
+        register_function("is_even", divisible([2]), 1)
+        assert rule_cache.key("[]") is None
+        assert Validator('[{"rule": ["eq", "$.foo", 3]}]', cache_dir=str(tmp_path)).validate(self.data) == []
+        assert list(tmp_path.iterdir()) == []
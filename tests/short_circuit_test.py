@@ -0,0 +1,82 @@
+import json
+import time
+import pytest
+from handlers import AdaptiveOperands, _all, some
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+def fail(_):
+    raise Exception("must not be evaluated")
+
+
+@pytest.mark.benchmark(warmup_iterations=1000, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestShortCircuit:
+
+    data = {
+        "foo": True,
+        "bar": False,
+        "baz": "not a number",
+        "text": "_".join(["x"] * 200)
+    }
+
+    def validate(self, benchmark, rule, **kwargs):
+        validator = Validator(rule, **kwargs)
+        assert len(benchmark(validator.validate, obj=self.data)) == 0
+
+    def test_short_circuit(self):
+        assert _all(None, lambda _: False, fail) is False
+        assert some(None, lambda _: True, fail) is True
+
+    def test_errors_do_not_depend_on_order(self):
+        assert _all(None, fail, lambda _: 0) is False
+        assert some(None, fail, lambda _: 1) is True
+        with pytest.raises(Exception, match="must not be evaluated"):
+            _all(None, lambda _: True, fail)
+        with pytest.raises(Exception, match="must not be evaluated"):
+            some(None, fail, lambda _: False)
+
+    def test_absorbing_constants_are_folded(self):
+        rule = '''
+                [
+                    {"rule": ["or", ["ceil", "$.baz"], true]},
+                    {"rule": ["not", ["and", false, ["ceil", "$.baz"]]]}
+                ]
+            '''
+        assert Validator(rule).val_tree == []
+
+    def test_adaptive_reorders_operands(self):
+        def slow(_):
+            time.sleep(0.0001)
+            return True
+
+        def fast(_):
+            return False
+
+        operands = AdaptiveOperands([slow, fast], sample_every=2, reorder_every=4)
+        assert [operands.all(None) for _ in range(16)] == [False] * 16
+        assert operands.expressions == [fast, slow]
+
+    def test_adaptive_same_results(self):
+        rule = '''
+                [
+                    {"rule": ["and", ["eq", ["length", ["split", "$.text", "_"]], 200], "$.foo", ["not", "$.bar"]]},
+                    {"rule": ["or", ["ceil", "$.baz"], ["eq", "$.foo", "$.bar"], "$.bar"]},
+                    {"rule": ["none", ["ceil", "$.baz"], "$.bar"]},
+                    {"rule": ["or", ["ceil", "$.baz"], "$.bar"]}
+                ]
+            '''
+        validator, adaptive = Validator(rule), Validator(rule, adaptive=True)
+        records = [dict(self.data, foo=i % 3 == 0, bar=i % 5 == 0) for i in range(3000)]
+        assert adaptive.validate_many(records) == validator.validate_many(records)
+
+    rule_last_decides = json.dumps([
+        {"rule": ["some"] + [["eq", ["length", ["split", "$.text", "_"]], i] for i in range(10)] + ["$.foo"]}
+    ])
+
+    def test_fixed_order_0(self, benchmark):
+        self.validate(benchmark, self.rule_last_decides)
+
+    def test_adaptive_order_0(self, benchmark):
+        self.validate(benchmark, self.rule_last_decides, adaptive=True)
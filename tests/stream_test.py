@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import subprocess
+import tracemalloc
+import pytest
+from stream import validate_ndjson
+from validator import Validator
+import sys
+sys.path.append("..")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.benchmark(warmup_iterations=1, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestStreamValidation:
+
+    rule = '''
+            [
+                {
+                    "name": "foo in range",
+                    "error_message": "foo out of range",
+                    "rule": ["in-range", "$.foo", 0, 5]
+                }
+            ]
+        '''
+
+    def lines(self, count):
+        for i in range(count):
+            yield json.dumps({"foo": i % 7, "bar": "x" * 20}) + "\n"
+
+    def test_failures_with_line_numbers(self):
+        source = io.StringIO('{"foo": 1}\n\n{"foo": 9}\nnot json\n{"foo": 2}\n{"foo": 6}\n')
+        sink = io.StringIO()
+        stats = validate_ndjson(Validator(self.rule), source, sink, chunk_size=2)
+        failures = [json.loads(line) for line in sink.getvalue().splitlines()]
+        assert [failure["line"] for failure in failures] == [3, 4, 6]
+        assert failures[0]["errors"] == Validator(self.rule).validate({"foo": 9})
+        assert failures[1]["errors"][0].startswith("invalid JSON")
+        assert stats.records == 5 and stats.failed == 3
+
+    def test_memory_stays_flat(self):
+        class NullSink:
+            def writelines(self, lines):
+                for _ in lines:
+                    pass
+
+            def flush(self):
+                pass
+
+        def peak(count):
+            tracemalloc.start()
+            validate_ndjson(Validator(self.rule), self.lines(count), NullSink(), chunk_size=500)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak
+
+        assert peak(20000) < peak(2000) * 1.5
+
+    def test_command_line(self, tmp_path):
+        rules = tmp_path / "rules.json"
+        rules.write_text(self.rule)
+        records = tmp_path / "records.ndjson"
+        records.write_text("".join(self.lines(14)))
+        output = tmp_path / "failures.ndjson"
+
+        result = subprocess.run([sys.executable, "-m", "stream", str(rules), str(records), "-o", str(output)],
+                                cwd=ROOT, capture_output=True, text=True)
+        assert result.returncode == 1
+        assert "validated 14 records" in result.stderr and "records/s" in result.stderr
+        assert [json.loads(line)["line"] for line in output.read_text().splitlines()] == [7, 14]
+
+        result = subprocess.run([sys.executable, "-m", "stream", str(rules), str(records), "--workers", "2",
+                                 "--chunk-size", "3"], cwd=ROOT, capture_output=True, text=True)
+        assert [json.loads(line)["line"] for line in result.stdout.splitlines()] == [7, 14]
+
+        result = subprocess.run([sys.executable, "-m", "stream", str(rules)], input='{"foo": 1}\n',
+                                cwd=ROOT, capture_output=True, text=True)
+        assert result.returncode == 0 and result.stdout == ""
+
+    def test_stream_throughput(self, benchmark):
+        validator = Validator(self.rule)
+        lines = list(self.lines(10000))
+        stats = benchmark(lambda: validate_ndjson(validator, iter(lines), io.StringIO()))
+        assert stats.records == 10000
@@ -75,3 +75,43 @@ class TestStringMatchingsShouldPass:
                 ]
             '''
         self.validate(benchmark, rule)
+
+    def test_regex_extract_first_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["eq", ["regex-extract", "$.foo", "^([^_]*)"], "some"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
+
+    def test_regex_extract_last_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["eq", ["regex-extract", "$.foo", "([^_]*)$"], "string"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
+
+    def test_matches_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["matches", "$.foo", "some_[a-z]+"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
+
+    def test_regex_search_0(self, benchmark):
+        rule = '''
+                [
+                    {
+                        "rule": ["regex-search", "$.foo", "me_str"]
+                    }
+                ]
+            '''
+        self.validate(benchmark, rule)
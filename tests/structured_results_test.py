@@ -0,0 +1,69 @@
+import json
+import pytest
+from validator import RULE_ERROR, RULE_FAILED, ValidationFailure, Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestStructuredResults:
+
+    data = {
+        "foo": 1,
+        "bar": "some_string",
+        "items": [{"sku": f"sku-{i}", "description": "x" * 100} for i in range(2000)]
+    }
+
+    rule = '''
+            [
+                {"name": "foo is one", "rule": ["eq", "$.foo", 1]},
+                {"name": "foo is two", "error_message": "foo should be two", "rule": ["eq", "$.foo", 2]},
+                {"name": "bar is a number", "rule": ["ceil", "$.bar"]},
+                {"name": "empty", "rule": ["first", "$.missing"]}
+            ]
+        '''
+
+    def test_failure_records(self):
+        failures = Validator(self.rule).validate_structured(self.data)
+        assert [failure[:3] for failure in failures] == [
+            (1, "foo is two", RULE_FAILED), (2, "bar is a number", RULE_ERROR), (3, "empty", RULE_FAILED)]
+        assert failures[0].message == "foo should be two" and failures[0].value is False
+        assert isinstance(failures[1].message, Exception) and failures[1].value is None
+        assert isinstance(failures[0], ValidationFailure)
+
+    @pytest.mark.parametrize("options", [{}, {"max_errors": 3}])
+    def test_positions_in_the_rules(self, options):
+        # the rules always passing are folded away, failures still give the position in the JSON
+        validator = Validator(json.dumps([
+            {"rule": ["eq", 1, 1]},
+            {"name": "b", "rule": ["eq", "$.x", 2]},
+            {"rule": ["gt", 2, 1]},
+            {"name": "d", "rule": ["eq", "$.y", 2]},
+            {"name": "e", "rule": ["eq", 1, 2]}
+        ]), profile=not options)
+        assert len(validator.val_tree) == 3
+        failures = validator.validate_structured({"x": 1, "y": 1}, **options)
+        assert [(failure.rule, failure.name) for failure in failures] == [(1, "b"), (3, "d"), (4, "e")]
+        if validator.profile is not None:
+            assert [stats.index for stats in validator.profile.rules] == [1, 3, 4]
+
+    def test_render_matches_validate(self):
+        validator = Validator(self.rule)
+        records = [self.data, {"foo": 2, "bar": 1}, {}]
+        for record, failures in zip(records, validator.iter_validate_structured(records)):
+            assert [failure.render(record) for failure in failures] == validator.validate(record)
+
+    failing_rules = json.dumps([{"rule": ["eq", "$.foo", i]} for i in range(2, 42)])
+    passing_rules = json.dumps([{"rule": ["neq", "$.foo", i]} for i in range(2, 42)])
+
+    def test_text_failing_0(self, benchmark):
+        validator = Validator(self.failing_rules)
+        assert len(benchmark(validator.validate, self.data)) == 40
+
+    def test_structured_failing_0(self, benchmark):
+        validator = Validator(self.failing_rules)
+        assert len(benchmark(validator.validate_structured, self.data)) == 40
+
+    def test_structured_passing_0(self, benchmark):
+        validator = Validator(self.passing_rules)
+        assert len(benchmark(validator.validate_structured, self.data)) == 0
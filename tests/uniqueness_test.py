@@ -0,0 +1,78 @@
+import json
+import pytest
+from handlers import BloomFilter
+from parallel import ParallelValidator
+from validator import Validator
+import sys
+sys.path.append("..")
+
+
+@pytest.mark.benchmark(warmup_iterations=10, min_time=0.5, max_time=1, min_rounds=5, warmup=True)
+class TestUniqueness:
+
+    rule = '''
+            [
+                {"name": "order id is unique", "rule": ["unique", "$.order_id"]},
+                {"name": "order id is probably unique", "rule": ["unique-approx", "$.order_id", 0.0001, 1000]},
+                {"name": "amount is positive", "rule": ["in-range", "$.amount", 1, 1000]}
+            ]
+        '''
+
+    records = [{"order_id": i % 80, "amount": i % 5} for i in range(100)]
+
+    def test_duplicates(self):
+        validator = Validator(self.rule)
+        assert validator.stateful
+        errors = validator.validate_many(self.records)
+        duplicated = [i for i, record_errors in enumerate(errors) if any("order id is unique" in error for error in record_errors)]
+        assert duplicated == list(range(80, 100))
+        assert [bool(any("probably" in error for error in record_errors)) for record_errors in errors] == \
+            [i >= 80 for i in range(100)]
+        # keys are kept across calls until reset
+        assert len(validator.validate(self.records[0])) == 3
+        validator.reset()
+        assert len(validator.validate(self.records[0])) == 1
+
+    def test_keys(self):
+        validator = Validator('[{"rule": ["unique", "$.key"]}]')
+        keys = ["1", 1, 1.0, True, [1], {"a": 1, "b": 2}, {"b": 2, "a": 1}, None]
+        assert [len(validator.validate({"key": key})) for key in keys] == [0, 0, 0, 0, 0, 0, 1, 0]
+        # objects without the key are never duplicates
+        assert validator.validate({}) == validator.validate({}) == []
+
+    def test_fail_fast_still_records_keys(self):
+        validator = Validator(self.rule)
+        for _ in range(3):
+            validator.reset()
+            errors = validator.validate_many(self.records, fail_fast=True)
+            assert [bool(record_errors) for record_errors in errors] == [i >= 80 or i % 5 == 0 for i in range(100)]
+
+    def test_not_optimized_away(self):
+        rules = json.dumps([{"rule": ["some", ["eq", "$.kind", "refund"], ["unique", "$.id"]]},
+                            {"rule": ["some", ["eq", "$.kind", "refund"], ["unique", "$.id"]]}])
+        for validator in [Validator(rules), Validator(rules, adaptive=True), Validator(rules, backend="codegen")]:
+            assert not validator.val_tree[0]["node"]._adaptive
+            assert validator.val_tree[0]["node"]._leafs[1]._slot is None
+            records = [{"id": 2}, {"id": 2}, {"id": 2, "kind": "refund"}] * 40
+            assert [len(errors) for errors in validator.validate_many(records)] == [0] + [2, 0, 2] * 39 + [2, 0]
+
+    def test_parallel_is_refused(self):
+        with pytest.raises(Exception, match="can't be split"):
+            ParallelValidator(self.rule, workers=2)
+
+    def test_bloom_filter_false_positives(self):
+        bloom = BloomFilter(0.01, 10000)
+        assert sum(bloom.add(f"key-{i}") for i in range(10000)) > 9900
+        assert not any(bloom.add(f"key-{i}") for i in range(10000))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        assert false_positives < 200
+
+    ids = [{"order_id": f"order-{i}"} for i in range(1000)]
+
+    def test_unique_0(self, benchmark):
+        validator = Validator('[{"rule": ["unique", "$.order_id"]}]')
+        benchmark(lambda: (validator.reset(), validator.validate_many(self.ids)))
+
+    def test_unique_approx_0(self, benchmark):
+        validator = Validator('[{"rule": ["unique-approx", "$.order_id", 0.001, 1000000]}]')
+        benchmark(lambda: (validator.reset(), validator.validate_many(self.ids)))
@@ -1,7 +1,8 @@
-from functools import lru_cache
-from typing import List, Optional
+from contextlib import contextmanager
+from typing import Callable, List, Optional
 
-from handlers import _abs, _all, _if, _not, _round, ceil, concat, contains, ends_with, eq, eq_delta, exists, first, floor, in_range, is_alphanumeric, is_float, is_integer, is_number, is_string, last, length, lookup, neq, none, path, some, split, starts_with
+from handlers import AdaptiveOperands, BloomFilter, HyperLogLog, Moments, Presence, SlotTable, UniqueKeys, _abs, _all, _any, _if, _not, _round, ceil, concat, contains, count_where, ends_with, every, eq, eq_delta, exists, extract_value, find, find_all, first, floor, gt, gte, in_list, in_range, in_values, index, is_alphanumeric, is_boolean, is_empty, is_float, is_integer, is_list, is_null, is_number, is_object, is_string, last, length, lookup, lt, lte, match_value, matches, member, neq, none, path_steps, path_value, regex_extract, regex_pattern, regex_search, relative_value, resolve_steps, search_value, some, split, starts_with, string_values, substring, to_lower, to_upper
+from registry import FunctionSpec, function_spec, register_function
 
 
 class TreeNode:
@@ -9,6 +10,19 @@ class TreeNode:
     _error_message: Optional[str]
     _expression: Optional[str]
     _leafs: List['TreeNode']
+    # set on nodes produced by the optimizer, _expression then holds an already evaluated value
+    _constant: bool = False
+    # set by the optimizer on all/some/none nodes whose operands may be reordered at runtime
+    _adaptive: bool = False
+    # set by the optimizer on subexpressions shared between rules, evaluated once per object
+    _slot: Optional[int] = None
+    _slots: Optional[SlotTable] = None
+    # what functions keeping state across the validated objects remember, see Validator.reset
+    _state = None
+    # set on the @ strings of the rule of a quantifier, see scope_relative_paths
+    _relative: bool = False
+    # position of a rule in the rules JSON, constant folding drops the rules that always pass
+    _position: Optional[int] = None
 
     def __init__(self, obj: list, is_parent=False):
         if not is_parent:
@@ -17,6 +31,8 @@ class TreeNode:
             if isinstance(obj, list) and len(obj) > 1:
                 self._leafs: list[TreeNode] = [
                     as_tree(item, is_parent) for item in obj[1:]]
+                if self._expression in QUANTIFIERS and len(self._leafs) > 1:
+                    scope_relative_paths(self._leafs[1])
             elif isinstance(obj, dict) and "rule" in obj and isinstance(obj['rule'], list):
                 self._name = obj.get(
                     'name', f'validation rule: {obj["rule"][0]}')
@@ -25,15 +41,20 @@ class TreeNode:
                 self._leafs: list[TreeNode] = [as_tree(obj['rule'], is_parent)]
         else:
             self._leafs = [as_tree(leaf, False) for leaf in obj]
+            for position, leaf in enumerate(self._leafs):
+                leaf._position = position
 
-    def as_validation_tree(self):
+    def as_validation_tree(self, build=None):
+        build = build or build_handler
         result = []
         for leaf in self._leafs:
-            handler = rule_node_handler(leaf)
+            assert len(leaf._leafs) == 1
             result.append({
+                "index": leaf._position,
                 "name": leaf._name or leaf._expression,
                 "error_message": leaf._error_message,
-                "validate": handler(leaf._leafs[0])
+                "validate": build(leaf._leafs[0]),
+                "node": leaf._leafs[0]
             })
 
         return result
@@ -43,6 +64,13 @@ def as_tree(obj: list, is_parent=True) -> TreeNode:
     return TreeNode(obj, is_parent)
 
 
+def as_constant(value) -> TreeNode:
+    node = TreeNode.__new__(TreeNode)
+    node._expression = value
+    node._constant = True
+    return node
+
+
 def ensure_leafs(node: TreeNode, n):
     if len(node._leafs) != n:
         raise Exception(
@@ -50,8 +78,12 @@ def ensure_leafs(node: TreeNode, n):
 
 
 def get_handler_for(node: TreeNode):
+    if is_constant_node(node):
+        return literal_handler
     if is_path_node(node):
         return path_handler
+    if is_relative_path_node(node):
+        return relative_path_handler
     if is_primitive_node(node):
         return literal_handler
     if is_function_node(node._expression):
@@ -62,251 +94,133 @@ def get_handler_for(node: TreeNode):
     raise Exception(f'Unsupported expression {node._expression}')
 
 
+# called with every node and its handler while rules are built, see profiling.Profile
+_node_hook: Optional[Callable] = None
+
+
+@contextmanager
+def node_hook(hook: Callable):
+    global _node_hook
+    previous, _node_hook = _node_hook, hook
+    try:
+        yield
+    finally:
+        _node_hook = previous
+
+
+def build_handler(node: TreeNode):
+    if node._slot is None:
+        handler = get_handler_for(node)(node)
+    else:
+        handler = node._slots.handler(node._slot, lambda: get_handler_for(node)(node))
+    return handler if _node_hook is None else _node_hook(node, handler)
+
+
 def get_handlers(node: TreeNode):
     result = []
     for leaf in node._leafs:
-        result.append(get_handler_for(leaf)(leaf))
+        result.append(build_handler(leaf))
 
     return result
 
 
+def is_constant_node(value: TreeNode):
+    return value._constant
+
+
 def is_path_node(value: TreeNode):
     expr = value._expression
     return isinstance(expr, str) and expr.startswith('$.') and not hasattr(value, '_leafs')
 
 
+def is_relative_path_node(value: TreeNode):
+    return value._relative and not hasattr(value, '_leafs') and not value._constant
+
+
 def is_primitive_node(value: TreeNode):
     expr = value._expression
-    return isinstance(expr, (str, int, float, bool)) and not hasattr(value, '_leafs')
+    return isinstance(expr, (str, int, float, bool)) and not hasattr(value, '_leafs') and not is_relative_path_node(value)
 
 # in case we are going to support nested rules sometime
 
 
-def is_root_rule_node(value: TreeNode):
-    return value._expression is None and isinstance(value._name, str) and isinstance(value._error_message, str)
-
-
-def is_function_node(expr: str):
-    return expr in [
-        "eq",
-        "eq_delta",
-        "neq",
-        "split",
-        "length",
-        "not",
-        "starts-with",
-        "ends-with",
-        "contains",
-        "first",
-        "last",
-        "all",
-        "some",
-        "none",
-        "and",
-        "or",
-        "if",
-        "in-range",
-        "abs",
-        "ceil",
-        "floor",
-        "round",
-        "exists",
-        "concat",
-        "lookup",
-        "is_number",
-        "is_integer",
-        "is_float",
-        "is_alphanumeric",
-        "is_string",
-        "is_boolean",
-        "is_null"
-    ]
-
-
-@lru_cache(500)
-def get_function_handler(node_expression: str):
-    if node_expression == "eq":
-        return eq_handler
-    if node_expression == "eq_delta":
-        return eq_delta_handler
-    if node_expression == "neq":
-        return neq_handler
-    if node_expression == "length":
-        return length_handler
-    if node_expression == "split":
-        return split_handler
-    if node_expression == "not":
-        return not_handler
-    if node_expression == "starts-with":
-        return starts_with_handler
-    if node_expression == "ends-with":
-        return ends_with_handler
-    if node_expression == "contains":
-        return contains_handler
-    if node_expression == "first":
-        return first_handler
-    if node_expression == "last":
-        return last_handler
-    if node_expression in ["all", "and"]:
-        return all_handler
-    if node_expression in ["some", "or"]:
-        return some_handler
-    if node_expression == "none":
-        return none_handler
-    if node_expression == "if":
-        return if_handler
-    if node_expression == "in-range":
-        return in_range_handler
-    if node_expression == "abs":
-        return abs_handler
-    if node_expression == "ceil":
-        return ceil_handler
-    if node_expression == "floor":
-        return floor_handler
-    if node_expression == "round":
-        return round_handler
-    if node_expression == "exists":
-        return exists_handler
-    if node_expression == "concat":
-        return concat_handler
-    if node_expression == "lookup":
-        return lookup_handler
-    if node_expression == "is_number":
-        return is_number_handler
-    if node_expression == "is_integer":
-        return is_integer_handler
-    if node_expression == "is_float":
-        return is_float_handler
-    if node_expression == "is_alphanumeric":
-        return is_alphanumeric_handler
-    if node_expression == "is_string":
-        return is_string_handler
-    raise Exception(f'handler {node_expression} not implemented or unknown')
-
-
-def eq_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: eq(data, *args)
-
+def is_literal_node(value: TreeNode):
+    return is_constant_node(value) or (not is_path_node(value) and is_primitive_node(value))
 
-def rule_node_handler(node: TreeNode):
-    assert len(node._leafs) == 1
-    return get_handler_for(node._leafs[0])
 
+def is_scalar_literal_node(value: TreeNode):
+    """
+        literals that can go into sets, folded constants may also be lists or objects
+    """
+    return is_literal_node(value) and isinstance(value._expression, (str, int, float, bool, type(None)))
 
-def eq_delta_handler(node: TreeNode):
-    ensure_leafs(node, 3)
-    args = get_handlers(node)
-    return lambda data: eq_delta(data, *args)
 
-
-def neq_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: neq(data, *args)
-
-
-def in_range_handler(node: TreeNode):
-    ensure_leafs(node, 3)
-    args = get_handlers(node)
-    return lambda data: in_range(data, *args)
-
-
-def abs_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: _abs(data, *args)
+def is_root_rule_node(value: TreeNode):
+    return value._expression is None and isinstance(value._name, str) and isinstance(value._error_message, str)
 
 
-def ceil_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: ceil(data, *args)
+def is_function_node(expr: str):
+    return function_spec(expr) is not None
 
 
-def floor_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: floor(data, *args)
+def get_function_handler(node_expression: str):
+    spec = function_spec(node_expression)
+    if spec is None:
+        raise Exception(f'handler {node_expression} not implemented or unknown')
+    if spec.build is not None:
+        return spec.build
+    return lambda node: call_handler(node, spec)
 
 
-def round_handler(node: TreeNode):
-    ensure_leafs(node, 1)
+def call_handler(node: TreeNode, spec: FunctionSpec):
+    if spec.arity is not None:
+        ensure_leafs(node, spec.arity)
     args = get_handlers(node)
-    return lambda data: _round(data, *args)
+    function = spec.function
+    return lambda data: function(data, *args)
 
 
-def length_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: length(data, *args)
+def rule_node_handler(node: TreeNode):
+    assert len(node._leafs) == 1
+    return get_handler_for(node._leafs[0])
 
 
 def path_handler(node: TreeNode):
-    def extract_single(obj: list):
-        return obj[0] if len(obj) == 1 else obj
-    return lambda data: extract_single([match.value for match in path(node._expression)(data)])
+    expression = node._expression
+    steps = path_steps(expression)
+    if steps is None:
+        return lambda data: path_value(data, expression)
+    return lambda data: resolve_steps(data, steps, expression)
 
 
-def split_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: split(data, *args)
+def relative_path_handler(node: TreeNode):
+    absolute = "$" + node._expression[1:]
+    return relative_value(absolute, path_steps(absolute))
 
 
 def literal_handler(node: TreeNode):
     return lambda _: node._expression
 
 
-def not_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: _not(data, *args)
-
-
-def starts_with_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: starts_with(data, *args)
-
-
-def ends_with_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: ends_with(data, *args)
-
-
-def contains_handler(node: TreeNode):
-    ensure_leafs(node, 2)
-    args = get_handlers(node)
-    return lambda data: contains(data, *args)
-
-
-def first_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: first(data, *args)
-
-
-def last_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: last(data, *args)
-
-
 def all_handler(node: TreeNode):
     args = get_handlers(node)
+    if node._adaptive:
+        return AdaptiveOperands(args).all
     return lambda data: _all(data, *args)
 
 
 def some_handler(node: TreeNode):
     args = get_handlers(node)
+    if node._adaptive:
+        return AdaptiveOperands(args).some
     return lambda data: some(data, *args)
 
 
 def none_handler(node: TreeNode):
     args = get_handlers(node)
+    if node._adaptive:
+        operands = AdaptiveOperands(args)
+        return lambda data: not operands.all(data)
     return lambda data: none(data, *args)
 
 
@@ -318,10 +232,153 @@ def if_handler(node: TreeNode):
     return lambda data: _if(data, *args)
 
 
-def exists_handler(node: TreeNode):
+def regex_handler(value):
+    """
+        builder of the regex functions, a literal pattern is compiled here once, a pattern computed
+        at runtime goes through the regex_pattern cache on every call
+    """
+    def build(node: TreeNode):
+        ensure_leafs(node, 2)
+        string_node, pattern_node = node._leafs
+        source = pattern_node._expression
+        if not is_literal_node(pattern_node) or not isinstance(source, str):
+            return call_handler(node, function_spec(node._expression))
+
+        name = node._expression
+        pattern = regex_pattern(source)
+        string_expr = build_handler(string_node)
+
+        def handler(data):
+            string, _ = string_values(name, string_expr(data), source)
+            return value(string, pattern)
+        return handler
+
+    return build
+
+
+def in_handler(node: TreeNode):
+    """
+        ["in", value, candidate...]: scalar literal candidates become a frozenset, a single other
+        candidate is the list to look into, other candidates are otherwise compared one by one
+    """
+    if len(node._leafs) < 2:
+        raise Exception(
+            f"{node._expression} expects a value and its candidates while {len(node._leafs)} arguments were provided")
+
+    needle, *candidates = node._leafs
+    if all(is_scalar_literal_node(candidate) for candidate in candidates):
+        values = frozenset(candidate._expression for candidate in candidates)
+        needle_expr = build_handler(needle)
+        return lambda data: member(needle_expr(data), values)
+
+    needle_expr, *candidate_exprs = get_handlers(node)
+    if len(candidate_exprs) == 1:
+        list_expr = candidate_exprs[0]
+        return lambda data: in_list(data, list_expr, needle_expr)
+    return lambda data: in_values(data, needle_expr, *candidate_exprs)
+
+
+def in_reference_handler(node: TreeNode):
+    """
+        ["in-reference", value, file, column?]: the reference file is indexed when the rule is built
+    """
+    if len(node._leafs) not in [2, 3]:
+        raise Exception(
+            f"in-reference expects 2 or 3 arguments while {len(node._leafs)} were provided")
+    value_node, *reference_nodes = node._leafs
+    if not all(is_literal_node(leaf) and isinstance(leaf._expression, str) for leaf in reference_nodes):
+        raise Exception("the reference file and column of in-reference must be literal strings")
+
+    # mmap, csv and hashlib are only needed by rules using reference files
+    from references import reference_index
+    index = reference_index(*[leaf._expression for leaf in reference_nodes])
+    value_expr = build_handler(value_node)
+    return lambda data: value_expr(data) in index
+
+
+def unique_handler(node: TreeNode):
+    """
+        ["unique", key]: fails for objects whose key was seen in an earlier object
+    """
     ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: exists(data, *args)
+    return keys_handler(node, UniqueKeys())
+
+
+def unique_approx_handler(node: TreeNode):
+    """
+        ["unique-approx", key, false_positive_rate?, capacity?]: unique in bounded memory,
+        a new key is taken for a duplicate with about false_positive_rate probability
+    """
+    if len(node._leafs) not in [1, 2, 3]:
+        raise Exception(
+            f"unique-approx expects 1 to 3 arguments while {len(node._leafs)} were provided")
+    options = node._leafs[1:]
+    if not all(is_literal_node(leaf) and isinstance(leaf._expression, (int, float)) for leaf in options):
+        raise Exception("the false positive rate and capacity of unique-approx must be literal numbers")
+    return keys_handler(node, BloomFilter(*[leaf._expression for leaf in options]))
+
+
+def keys_handler(node: TreeNode, keys):
+    node._state = keys
+    key_expr = build_handler(node._leafs[0])
+
+    def handler(data):
+        key = key_expr(data)
+        if key.__class__ is list and len(key) == 0:
+            # no key, nothing to compare
+            return True
+        return keys.add(key)
+    return handler
+
+
+def aggregate_handler(make):
+    """
+        builder of the aggregate functions: the node keeps its aggregate in _state, Validator adds
+        the value of every validated object to it and the node evaluates to the aggregate's result
+    """
+    def build(node: TreeNode):
+        name = node._expression
+        if function_spec(name).arity is not None:
+            ensure_leafs(node, function_spec(name).arity)
+        elif len(node._leafs) not in [1, 2]:
+            raise Exception(
+                f"{name} expects 1 or 2 arguments while {len(node._leafs)} were provided")
+        options = node._leafs[1:]
+        if not all(is_literal_node(leaf) and isinstance(leaf._expression, (int, float)) for leaf in options):
+            raise Exception(f"the options of {name} must be literal numbers")
+
+        aggregate = node._state = make(*[leaf._expression for leaf in options])
+        return lambda _: aggregate.result(name)
+
+    return build
+
+
+# functions evaluating their second argument for every element of the first one, see handlers.every
+QUANTIFIERS = ["every", "any", "count-where"]
+
+
+def scope_relative_paths(node: TreeNode) -> None:
+    """
+        in the rule of a quantifier "@", "@.price" and "@[0]" are paths into the current element,
+        a leading "@@" stands for a literal "@" there. everywhere else they are plain strings.
+        quantifiers within the rule already scoped their own rule, only their list is left
+    """
+    if hasattr(node, '_leafs'):
+        for leaf in node._leafs[:1] if node._expression in QUANTIFIERS else node._leafs:
+            scope_relative_paths(leaf)
+        return
+    expr = node._expression
+    if not isinstance(expr, str):
+        return
+    if expr == '@' or expr.startswith(('@.', '@[')):
+        node._relative = True
+    elif expr.startswith('@@'):
+        node._expression = expr[1:]
+
+
+def not_in_handler(node: TreeNode):
+    handler = in_handler(node)
+    return lambda data: not handler(data)
 
 
 def concat_handler(node: TreeNode):
@@ -333,37 +390,93 @@ def concat_handler(node: TreeNode):
     return lambda data: concat(data, *args)
 
 
-def lookup_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: lookup(data, *args)
-
-
-def is_number_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: is_number(data, *args)
-
-
-def is_integer_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: is_integer(data, *args)
-
-
-def is_float_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: is_float(data, *args)
-
-
-def is_alphanumeric_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: is_alphanumeric(data, *args)
-
-
-def is_string_handler(node: TreeNode):
-    ensure_leafs(node, 1)
-    args = get_handlers(node)
-    return lambda data: is_string(data, *args)
+# builtin functions, foldable ones only read the object through their arguments, vectorizable ones have an
+# array version in columnar.py, inline ones a codegen.py template
+
+for name, function, arity in [
+        ("eq", eq, 2),
+        ("neq", neq, 2),
+        ("eq_delta", eq_delta, 3),
+        ("in-range", in_range, 3),
+        ("abs", _abs, 1),
+        ("ceil", ceil, 1),
+        ("floor", floor, 1),
+        ("round", _round, 1),
+        ("not", _not, 1)]:
+    register_function(name, function, arity, foldable=True, vectorizable=True, inline=True)
+
+for name, build in [("all", all_handler), ("and", all_handler), ("some", some_handler), ("or", some_handler),
+                    ("none", none_handler)]:
+    register_function(name, build=build, foldable=True, vectorizable=True, inline=True)
+
+register_function("is_number", is_number, 1, foldable=True, vectorizable=True, inline=True)
+register_function("in", build=in_handler, foldable=True)
+register_function("not-in", build=not_in_handler, foldable=True)
+# the result depends on the objects validated before
+register_function("unique", build=unique_handler, pure=False)
+register_function("unique-approx", build=unique_approx_handler, pure=False)
+# the reference file may change after the rules are compiled
+register_function("in-reference", build=in_reference_handler)
+register_function("if", build=if_handler, foldable=True, inline=True)
+register_function("concat", build=concat_handler, foldable=True, inline=True)
+
+for name, function, arity in [
+        ("length", length, 1),
+        ("first", first, 1),
+        ("last", last, 1),
+        ("split", split, 2),
+        ("starts-with", starts_with, 2),
+        ("ends-with", ends_with, 2),
+        ("contains", contains, 2),
+        ("exists", exists, 1),
+        ("is_integer", is_integer, 1),
+        ("is_float", is_float, 1),
+        ("is_string", is_string, 1),
+        ("is_alphanumeric", is_alphanumeric, 1)]:
+    register_function(name, function, arity, foldable=True, inline=True)
+
+for name, function, arity in [
+        ("gt", gt, 2),
+        ("gte", gte, 2),
+        ("lt", lt, 2),
+        ("lte", lte, 2)]:
+    register_function(name, function, arity, foldable=True, inline=True)
+
+for name, function, arity in [
+        ("to-upper", to_upper, 1),
+        ("to-lower", to_lower, 1),
+        ("substring", substring, 3),
+        ("index", index, 2),
+        ("find", find, 2),
+        ("find-all", find_all, 2),
+        ("is_boolean", is_boolean, 1),
+        ("is_object", is_object, 1),
+        ("is_list", is_list, 1),
+        ("is_null", is_null, 1),
+        ("is_empty", is_empty, 1)]:
+    register_function(name, function, arity, foldable=True)
+
+for name, function, value in [
+        ("matches", matches, match_value),
+        ("regex-search", regex_search, search_value),
+        ("regex-extract", regex_extract, extract_value)]:
+    register_function(name, function, 2, build=regex_handler(value), foldable=True)
+
+register_function("every", every, 2, foldable=True, inline=True)
+register_function("any", _any, 2, foldable=True, inline=True)
+register_function("count-where", count_where, 2, foldable=True, inline=True)
+
+# a rule using them checks the whole dataset, see Validator.validate_dataset
+for name, make, arity in [
+        ("count", Presence, 1),
+        ("null-rate", Presence, 1),
+        ("sum", Moments, 1),
+        ("mean", Moments, 1),
+        ("min", Moments, 1),
+        ("max", Moments, 1),
+        ("stddev", Moments, 1),
+        ("distinct", HyperLogLog, None)]:
+    register_function(name, arity=arity, build=aggregate_handler(make), aggregate=True)
+
+# reads the object at a path computed at runtime, nothing to evaluate at compile time
+register_function("lookup", lookup, 1)
@@ -1,19 +1,550 @@
+import copy
 import json
-from tree import as_tree
+import sys
+import time
+import weakref
+from collections import Counter, deque
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from codegen import generate_handler
+from optimizer import compile_rules, is_pure_tree, rule_guard
+from registry import function_spec
+from tree import TreeNode, build_handler, is_constant_node, is_path_node
+
+# asyncio and concurrent.futures take longer to import than the rest of the library,
+# they are only loaded by the async API
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+    from profiling import Profile
+
+
+def format_error(name, message, obj) -> str:
+    return f"validation failed for rule \"{name}\" with message: \"{message}\" on object {obj}"
+
+
+# error codes of ValidationFailure
+RULE_FAILED = sys.intern("rule-failed")
+RULE_ERROR = sys.intern("rule-error")
+
+
+class ValidationFailure(NamedTuple):
+    """
+        a failed rule without any text built yet, render() gives the message validate returns
+    """
+    # position of the rule in the rules JSON
+    rule: int
+    name: str
+    code: str
+    # the rule's error_message when it evaluated to a false value, the exception when it raised
+    message: object
+    # what the rule evaluated to, None when it raised
+    value: object
+
+    def render(self, obj) -> str:
+        return format_error(self.name, self.message, obj)
+
+
+class RuleOrdering:
+    """
+        order the rules are checked in when validation stops at the first failures: every
+        sample_every-th object goes through all rules, recording their cost and how often they
+        fail, every reorder_every samples the cheapest, most often failing rules move to the front
+    """
+
+    def __init__(self, size: int, sample_every: int = 32, reorder_every: int = 32) -> None:
+        self.order = list(range(size))
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self._calls = 0
+        self._samples = 0
+        # rule index -> [samples, cumulated ns, failures]
+        self._stats = [[0, 0, 0] for _ in range(size)]
+
+    def sampling(self) -> bool:
+        self._calls += 1
+        return self._calls % self.sample_every == 0
+
+    def record(self, index: int, cost: int, failed: bool) -> None:
+        stats = self._stats[index]
+        stats[0] += 1
+        stats[1] += cost
+        stats[2] += failed
+
+    def sampled(self) -> None:
+        self._samples += 1
+        if self._samples % self.reorder_every == 0:
+            self.reorder()
+
+    def reorder(self) -> None:
+        def expected_cost(index):
+            samples, cost, failures = self._stats[index]
+            if samples == 0:
+                return 0
+            # cost of the rule over the chance it fails
+            return (cost / samples) / ((failures + 1) / (samples + 1))
+
+        self.order = sorted(self.order, key=expected_cost)
+
+
+# fewest rules guarded on one path worth looking that path up once per object
+MIN_GUARDED_RULES = 2
+
+
+class RuleIndex:
+    """
+        rules like ["if", ["eq", "$.type", "order"], ...] by the value of their discriminator path:
+        an object only goes through the unguarded rules and the ones guarded by its value. the
+        other guarded rules evaluate to their literal else branch, those failing keep their place
+        among the errors. objects whose discriminator raises or isn't hashable go through all rules
+    """
+
+    def __init__(self, rules: list, guards: Dict[int, tuple], path: TreeNode) -> None:
+        self.path = path._expression
+        self._discriminator = build_handler(path)
+        self._all = (list(range(len(rules))), rules)
+        guarded: Dict[object, set] = {}
+        for index, (_, values, _) in guards.items():
+            for value in values:
+                guarded.setdefault(value, set()).add(index)
+        # discriminator value -> (rule indexes, rules) in rule order
+        self._selections = {value: self._selection(rules, guards, indexes) for value, indexes in guarded.items()}
+        self._default = self._selection(rules, guards, set())
+
+    @staticmethod
+    def _selection(rules: list, guards: Dict[int, tuple], selected: set) -> Tuple[List[int], list]:
+        indexes = []
+        selection = []
+        for index, rule in enumerate(rules):
+            if index in guards and index not in selected:
+                otherwise = guards[index][2]
+                if otherwise:
+                    continue
+                rule = (lambda _, value=otherwise: value, rule[1], rule[2])
+            indexes.append(index)
+            selection.append(rule)
+        return indexes, selection
+
+    def select(self, obj) -> Tuple[List[int], list]:
+        try:
+            return self._selections.get(self._discriminator(obj), self._default)
+        except Exception:
+            # the guards raise or compare the value themselves
+            return self._all
+
+    def __len__(self) -> int:
+        """
+            number of discriminator values with rules of their own
+        """
+        return len(self._selections)
+
+
+def index_rules(val_tree: list, rules: list, excluded) -> Optional[RuleIndex]:
+    """
+        index of the rules guarded on the path most of them are guarded on, None without
+        MIN_GUARDED_RULES such rules
+    """
+    guards = {}
+    for index, rule in enumerate(val_tree):
+        guard = rule_guard(rule['node']) if index not in excluded else None
+        if guard is not None:
+            guards[index] = guard
+    paths = Counter(path._expression for path, _, _ in guards.values())
+    if not paths or paths.most_common(1)[0][1] < MIN_GUARDED_RULES:
+        return None
+    discriminator = paths.most_common(1)[0][0]
+    guards = {index: guard for index, guard in guards.items() if guard[0]._expression == discriminator}
+    return RuleIndex(rules, guards, next(iter(guards.values()))[0])
+
+
+def error_limit(fail_fast: bool, max_errors: Optional[int]) -> Optional[int]:
+    limit = 1 if fail_fast else max_errors
+    if limit is not None and limit < 1:
+        raise Exception(f"max_errors must be at least 1, got {limit}")
+    return limit
+
+
+def aggregate_nodes(node: TreeNode) -> List[TreeNode]:
+    """
+        aggregate function nodes of a rule tree, a rule using some checks the whole dataset and
+        can only read the validated objects through them
+    """
+    if not hasattr(node, '_leafs') or is_constant_node(node):
+        return []
+    spec = function_spec(node._expression)
+    if spec is not None and spec.aggregate:
+        if not is_pure_tree(node._leafs[0]):
+            raise Exception(f"the value of {node._expression} can't use aggregates or functions keeping state like unique")
+        return [node]
+    return [aggregate for leaf in node._leafs for aggregate in aggregate_nodes(leaf)]
+
+
+def object_paths(node: TreeNode) -> List[str]:
+    """
+        paths of a rule tree read outside of aggregate functions
+    """
+    if is_path_node(node):
+        return [node._expression]
+    if not hasattr(node, '_leafs') or is_constant_node(node):
+        return []
+    spec = function_spec(node._expression)
+    if spec is not None and spec.aggregate:
+        return []
+    return [path for leaf in node._leafs for path in object_paths(leaf)]
+
+
+def describe(node: TreeNode) -> str:
+    if is_path_node(node):
+        return node._expression
+    if not hasattr(node, '_leafs') or is_constant_node(node):
+        return json.dumps(node._expression, default=repr)
+    return f"{node._expression}({', '.join(describe(leaf) for leaf in node._leafs)})"
+
+
+def aggregates_updater(aggregates: List[TreeNode], build) -> Callable:
+    """
+        adds the values of an object to the aggregates of a dataset rule, raises the first error
+        once every aggregate got its value
+    """
+    updates = [(node._state, build(node._leafs[0])) for node in aggregates]
+
+    def update(obj) -> bool:
+        error = None
+        for aggregate, value in updates:
+            try:
+                aggregate.add(value(obj))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return True
+    return update
+
+
+# how rule trees are turned into functions: nested closures, or one generated function per rule
+BACKENDS = {
+    "closures": build_handler,
+    "codegen": generate_handler,
+}
 
 
 class Validator:
-    def __init__(self, rules: str) -> None:
-        self.val_tree = as_tree(json.loads(rules)).as_validation_tree()
+    def __init__(self, rules: str, executor: Optional['Executor'] = None, max_in_flight: int = 8,
+                 adaptive: bool = False, backend: str = "closures", reorder_rules: bool = True,
+                 cache_dir: Optional[str] = None, profile: bool = False, guard_index: bool = True) -> None:
+        if backend not in BACKENDS:
+            raise Exception(f"unknown backend {backend}, expected one of {', '.join(BACKENDS)}")
+        if cache_dir is not None:
+            from cache import RuleCache
+            tree, self._slot_table = RuleCache(cache_dir).compile(rules, adaptive)
+        else:
+            tree, self._slot_table = compile_rules(rules, adaptive)
+        build = BACKENDS[backend]
+        # per rule and node type statistics, nothing is timed without it
+        self.profile: Optional['Profile'] = None
+        if profile:
+            from profiling import Profile
+            self.profile = Profile()
+        self.val_tree = tree.as_validation_tree(build if self.profile is None else self.profile.build(build))
+        # rules checking aggregates, rule index -> aggregate nodes. objects only update the
+        # aggregates, the rules themselves are evaluated by validate_dataset
+        self._dataset: Dict[int, List[TreeNode]] = {}
+        self._rules = []
+        for index, rule in enumerate(self.val_tree):
+            validate = rule['validate']
+            aggregates = aggregate_nodes(rule['node'])
+            if aggregates:
+                paths = object_paths(rule['node'])
+                if paths:
+                    raise Exception(f"rule \"{rule['name']}\" checks aggregates, {', '.join(paths)} must be inside aggregate functions")
+                self._dataset[index] = aggregates
+                validate = aggregates_updater(aggregates, build)
+            if self.profile is not None:
+                self.profile.rules[index].index = rule['index']
+                self.profile.rules[index].name = rule['name']
+                validate = self.profile.wrap_rule(index, validate)
+            self._rules.append((validate, rule['name'], rule['error_message']))
+        # rules are independent, with fail_fast or max_errors the likely failures are checked first
+        self._ordering = RuleOrdering(len(self._rules)) if reorder_rules else None
+        self._order = list(range(len(self._rules)))
+        # id of a selection -> (order, [(index, rule)...] of the selection in that order)
+        self._ordered: Dict[int, tuple] = {}
+        # rules guarded on the type of the object only see objects of that type. profiled
+        # validators evaluate every rule on every object
+        self._index = index_rules(self.val_tree, self._rules, self._dataset) if guard_index and self.profile is None else None
+        self._everything = (self._order, self._rules)
+        # rule index -> position of the rule in the rules JSON, what failures report
+        self._positions = [rule['index'] for rule in self.val_tree]
+        # rules remembering the objects they saw, every object has to go through them
+        self._stateful = frozenset(index for index, rule in enumerate(self.val_tree) if not is_pure_tree(rule['node']))
+        # used by the async API, None means the event loop's default thread pool.
+        # rule closures can't be pickled, so process pools won't work here, see parallel.py
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        # a semaphore is bound to the event loop it's first used in, one per running loop
+        self._in_flight = weakref.WeakKeyDictionary()
+
+    @property
+    def stateful(self) -> bool:
+        """
+            whether some rules depend on the objects validated before, like unique. aggregates
+            don't count, the ones of several validators can be merged
+        """
+        return bool(self._stateful.difference(self._dataset))
+
+    @property
+    def aggregated(self) -> bool:
+        """
+            whether some rules check aggregates of the objects, see validate_dataset
+        """
+        return bool(self._dataset)
+
+    def reset(self) -> None:
+        """
+            forgets the objects validated so far, to start validating a new stream
+        """
+        def reset_node(node):
+            if node._state is not None:
+                node._state.reset()
+            for leaf in getattr(node, '_leafs', []):
+                reset_node(leaf)
+
+        for rule in self.val_tree:
+            reset_node(rule['node'])
+
+    def aggregates(self) -> Dict[str, object]:
+        """
+            "mean($.amount)" -> current value of every aggregate, None when it has no value yet
+        """
+        values = {}
+        for nodes in self._dataset.values():
+            for node in nodes:
+                try:
+                    values[describe(node)] = node._state.result(node._expression)
+                except Exception:
+                    values[describe(node)] = None
+        return values
+
+    def aggregate_states(self) -> list:
+        """
+            copies of the aggregates, for merge_aggregates of a validator with the same rules
+        """
+        return [copy.deepcopy(node._state) for aggregates in self._dataset.values() for node in aggregates]
+
+    def merge_aggregates(self, states: list) -> None:
+        """
+            adds the aggregates of the objects another validator saw, see aggregate_states
+        """
+        nodes = [node for aggregates in self._dataset.values() for node in aggregates]
+        if len(states) != len(nodes):
+            raise Exception(f"{len(states)} aggregates can't be merged into the {len(nodes)} of these rules")
+        for node, state in zip(nodes, states):
+            node._state.merge(state)
+
+    def validate_dataset(self) -> list:
+        """
+            error messages of the rules checking aggregates, over the objects validated since the
+            last reset. the aggregates are shown in place of the object
+        """
+        aggregates = self.aggregates()
+        return [failure.render(aggregates) for failure in self.validate_dataset_structured()]
+
+    def validate_dataset_structured(self) -> List[ValidationFailure]:
+        failures = []
+        for index in self._dataset:
+            rule = self.val_tree[index]
+            try:
+                result = rule['validate'](None)
+            except Exception as e:
+                failures.append(ValidationFailure(rule['index'], rule['name'], RULE_ERROR, e, None))
+                continue
+            if not result:
+                failures.append(ValidationFailure(rule['index'], rule['name'], RULE_FAILED, rule['error_message'], result))
+        return failures
+
+    def source(self) -> str:
+        """
+            python source of the rules compiled with the codegen backend, for debugging
+        """
+        sources = []
+        for index, rule in enumerate(self.val_tree):
+            handler = rule['validate']
+            source = getattr(handler, 'source', None) or getattr(getattr(handler, '__wrapped__', None), 'source', None)
+            sources.append(f"# rule {index}: {rule['name']}\n" + (source or "# compiled to closures\n"))
+        return "\n".join(sources)
+
+    def validate(self, obj: dict, fail_fast: bool = False, max_errors: Optional[int] = None) -> list:
+        """
+            error messages of every failed rule, or of the first max_errors of them (one with
+            fail_fast). a record is valid under these limits exactly when it is without them
+        """
+        self._slot_table.epoch += 1
+        if fail_fast or max_errors is not None:
+            return [failure.render(obj) for failure in self._first_failures(obj, error_limit(fail_fast, max_errors))]
 
-    def validate(self, obj: dict) -> list:
         errors = []
-        for validation_rule in self.val_tree:
+        for validate, name, error_message in self._rules if self._index is None else self._index.select(obj)[1]:
             try:
-                result = validation_rule['validate'](obj)
-                if not result:
-                    raise Exception(f"{validation_rule['error_message']}")
+                if not validate(obj):
+                    errors.append(format_error(name, error_message, obj))
             except Exception as e:
-                errors.append(f"validation failed for rule \"{validation_rule['name']}\" with message: \"{e}\" on object {obj}")
+                errors.append(format_error(name, e, obj))
 
         return errors
+
+    def validate_many(self, records: Iterable[dict], fail_fast: bool = False, max_errors: Optional[int] = None) -> List[list]:
+        """
+            validates a batch of records, same as [validate(record) for record in records]
+        """
+        return list(self.iter_validate(records, fail_fast, max_errors))
+
+    def iter_validate(self, records: Iterable[dict], fail_fast: bool = False, max_errors: Optional[int] = None) -> Iterator[list]:
+        """
+            lazily yields the errors of every record, in input order
+        """
+        limit = error_limit(fail_fast, max_errors)
+        rules = self._rules
+        index = self._index
+        slot_table = self._slot_table
+        for obj in records:
+            slot_table.epoch += 1
+            if limit is not None:
+                yield [failure.render(obj) for failure in self._first_failures(obj, limit)]
+                continue
+
+            errors = []
+            for validate, name, error_message in rules if index is None else index.select(obj)[1]:
+                try:
+                    if not validate(obj):
+                        errors.append(format_error(name, error_message, obj))
+                except Exception as e:
+                    errors.append(format_error(name, e, obj))
+
+            yield errors
+
+    def validate_structured(self, obj: dict, fail_fast: bool = False, max_errors: Optional[int] = None) -> List[ValidationFailure]:
+        """
+            like validate, but failures are ValidationFailure records, no message is formatted
+        """
+        return next(self.iter_validate_structured((obj,), fail_fast, max_errors))
+
+    def iter_validate_structured(self, records: Iterable[dict], fail_fast: bool = False,
+                                 max_errors: Optional[int] = None) -> Iterator[List[ValidationFailure]]:
+        limit = error_limit(fail_fast, max_errors)
+        everything = self._everything
+        positions = self._positions
+        rule_index = self._index
+        slot_table = self._slot_table
+        for obj in records:
+            slot_table.epoch += 1
+            if limit is not None:
+                yield self._first_failures(obj, limit)
+                continue
+
+            failures = []
+            indexes, rules = everything if rule_index is None else rule_index.select(obj)
+            for index, (validate, name, error_message) in zip(indexes, rules):
+                try:
+                    result = validate(obj)
+                except Exception as e:
+                    failures.append(ValidationFailure(positions[index], name, RULE_ERROR, e, None))
+                    continue
+                if not result:
+                    failures.append(ValidationFailure(positions[index], name, RULE_FAILED, error_message, result))
+
+            yield failures
+
+    def _first_failures(self, obj: dict, limit: int) -> List[ValidationFailure]:
+        """
+            stops once limit rules failed, those are returned in rule order
+        """
+        ordering = self._ordering
+        sampling = ordering is not None and ordering.sampling()
+        failures = []
+        selection = self._everything if self._index is None else self._index.select(obj)
+        ordered = self._ordered_rules(selection, ordering.order if ordering is not None else self._order)
+        evaluated = len(ordered)
+        for position, (index, (validate, name, error_message)) in enumerate(ordered):
+            started = time.perf_counter_ns() if sampling else 0
+            try:
+                result = validate(obj)
+                failure = None if result else ValidationFailure(self._positions[index], name, RULE_FAILED, error_message, result)
+            except Exception as e:
+                failure = ValidationFailure(self._positions[index], name, RULE_ERROR, e, None)
+            if sampling:
+                ordering.record(index, time.perf_counter_ns() - started, failure is not None)
+            if failure is not None:
+                failures.append(failure)
+                if len(failures) >= limit and not sampling:
+                    evaluated = position + 1
+                    break
+
+        if self._stateful:
+            # the rules left still have to see the object
+            for index, (validate, _, _) in ordered[evaluated:]:
+                if index in self._stateful:
+                    try:
+                        validate(obj)
+                    except Exception:
+                        pass
+
+        if sampling:
+            ordering.sampled()
+        failures = failures[:limit]
+        failures.sort()
+        return failures
+
+    def _ordered_rules(self, selection: Tuple[List[int], list], order: List[int]) -> List[tuple]:
+        """
+            (index, rule) of the selected rules in the order of the rule indexes in order,
+            kept until the order changes
+        """
+        cached = self._ordered.get(id(selection))
+        if cached is None or cached[0] is not order:
+            if order is self._order and selection is self._everything:
+                ordered = list(zip(*selection))
+            else:
+                rank = {index: position for position, index in enumerate(order)}
+                ordered = sorted(zip(*selection), key=lambda pair: rank[pair[0]])
+            cached = self._ordered[id(selection)] = (order, ordered)
+        return cached[1]
+
+    async def validate_async(self, obj: dict) -> list:
+        """
+            runs validate in the executor so the event loop keeps serving other tasks,
+            at most max_in_flight validations run at once, the others wait here
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        in_flight = self._in_flight.get(loop)
+        if in_flight is None:
+            in_flight = self._in_flight[loop] = asyncio.Semaphore(self.max_in_flight)
+        async with in_flight:
+            return await loop.run_in_executor(self.executor, self.validate, obj)
+
+    async def iter_validate_async(self, records: AsyncIterable[dict], batch_size: int = 100) -> AsyncIterator[list]:
+        """
+            async version of iter_validate, records are coalesced into batches of batch_size
+            before going to the executor. once max_in_flight batches are pending, no more
+            records are pulled from the source until the oldest batch is done
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        batch = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) < batch_size:
+                continue
+            pending.append(loop.run_in_executor(self.executor, self.validate_many, batch))
+            batch = []
+            if len(pending) >= self.max_in_flight:
+                await asyncio.wait([pending[0]])
+            while pending and pending[0].done():
+                for errors in pending.popleft().result():
+                    yield errors
+
+        if batch:
+            pending.append(loop.run_in_executor(self.executor, self.validate_many, batch))
+        while pending:
+            for errors in await pending.popleft():
+                yield errors